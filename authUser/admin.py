@@ -1,7 +1,13 @@
 from django.contrib import admin
-from .models import CustomUser, CustomUserManager
+from .models import CustomUser, CustomUserManager, OutgoingEmail
 
 # Register your models here.
 admin.site.register(CustomUser)
 
 
+@admin.register(OutgoingEmail)
+class OutgoingEmailAdmin(admin.ModelAdmin):
+    list_display = ['id', 'recipients', 'subject', 'status', 'attempts', 'next_attempt_at', 'sent_at']
+    list_filter = ['status']
+
+
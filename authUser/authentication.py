@@ -0,0 +1,120 @@
+import copy
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.utils import get_md5_hash_password
+
+from fit.caches import is_shared_cache
+from fit.metrics import user_cache_lookups
+
+
+class UserCache:
+    # Двухуровневый кэш пользователей: короткоживущий словарь в процессе
+    # и общий django cache (Redis/Memcached в продакшене). С кэшем в памяти процесса
+    # общий уровень не используется: сброс после сохранения не дошёл бы до других воркеров,
+    # и изменения пользователя видны в них через LOCAL_TTL.
+
+    key_prefix = 'authuser:user:'
+
+    def __init__(self, local_ttl, shared_ttl, max_size):
+        self.local_ttl = local_ttl
+        self.shared_ttl = shared_ttl
+        self.max_size = max_size
+        self._local = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _key(self, user_id):
+        return f'{self.key_prefix}{user_id}'
+
+    def get(self, user_id):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._local.get(user_id)
+            if entry is not None:
+                expires, user = entry
+                if expires > now:
+                    self._local.move_to_end(user_id)
+                    user_cache_lookups.inc(result='local_hit')
+                    return user
+                del self._local[user_id]
+
+        user = cache.get(self._key(user_id)) if is_shared_cache() else None
+        if user is not None:
+            self._set_local(user_id, user)
+        user_cache_lookups.inc(result='shared_hit' if user is not None else 'miss')
+        return user
+
+    def set(self, user):
+        if is_shared_cache():
+            cache.set(self._key(user.pk), user, self.shared_ttl)
+        self._set_local(user.pk, user)
+
+    def _set_local(self, user_id, user):
+        with self._lock:
+            self._local[user_id] = (time.monotonic() + self.local_ttl, user)
+            self._local.move_to_end(user_id)
+            while len(self._local) > self.max_size:
+                self._local.popitem(last=False)
+
+    def invalidate(self, user_id):
+        with self._lock:
+            self._local.pop(user_id, None)
+        if is_shared_cache():
+            cache.delete(self._key(user_id))
+
+    def clear_local(self):
+        with self._lock:
+            self._local.clear()
+
+
+user_cache = UserCache(
+    local_ttl=settings.AUTH_USER_CACHE['LOCAL_TTL'],
+    shared_ttl=settings.AUTH_USER_CACHE['SHARED_TTL'],
+    max_size=settings.AUTH_USER_CACHE['LOCAL_MAX_SIZE'],
+)
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    # JWTAuthentication, который берёт пользователя из user_cache, а не из БД.
+    # View с token_claims_user = True получают TokenUser из подписанных claims (user_id, nickname,
+    # is_verified). Claims - только подсказка: активность и смена пароля всё равно проверяются
+    # по пользователю из кэша, иначе отключённый пользователь работал бы до истечения токена.
+
+    use_token_claims = False
+
+    def authenticate(self, request):
+        view = (getattr(request, 'parser_context', None) or {}).get('view')
+        self.use_token_claims = getattr(view, 'token_claims_user', False)
+        return super().authenticate(request)
+
+    def get_user(self, validated_token):
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise InvalidToken(_("Token contained no recognizable user identification"))
+
+        user = user_cache.get(user_id)
+        if user is None:
+            # Проверки активности и смены пароля выполняет JWTAuthentication
+            user = super().get_user(validated_token)
+            user_cache.set(user)
+        else:
+            if not user.is_active:
+                raise AuthenticationFailed(_("User is inactive"), code="user_inactive")
+
+            if api_settings.CHECK_REVOKE_TOKEN:
+                if validated_token.get(api_settings.REVOKE_TOKEN_CLAIM) != get_md5_hash_password(user.password):
+                    raise AuthenticationFailed(_("The user's password has been changed."), code="password_changed")
+
+        if self.use_token_claims:
+            return api_settings.TOKEN_USER_CLASS(validated_token)
+
+        # Копия, чтобы изменения в одном запросе не попадали в общий объект кэша
+        return copy.copy(user)
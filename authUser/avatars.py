@@ -0,0 +1,134 @@
+import hashlib
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import transaction
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+
+
+def get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=settings.AVATARS['WORKERS'], thread_name_prefix='avatars')
+    return _executor
+
+
+def upload_name(digest, ext):
+    return f"avatars/uploads/{digest}{ext}"
+
+
+def variant_name(digest, variant):
+    # Имя зависит только от содержимого: одинаковые загрузки дают одни и те же файлы,
+    # а новая аватарка всегда получает новый URL
+    extension = settings.AVATARS['FORMAT'].lower()
+    return f"avatars/{digest[:2]}/{digest}/{variant}.{extension}"
+
+
+def file_digest(uploaded_file):
+    sha = hashlib.sha256()
+    for chunk in uploaded_file.chunks():
+        sha.update(chunk)
+    uploaded_file.seek(0)
+    return sha.hexdigest()
+
+
+def variants_exist(digest):
+    return all(default_storage.exists(variant_name(digest, variant)) for variant in settings.AVATARS['VARIANTS'])
+
+
+def store_avatar(user, uploaded_file):
+    digest = file_digest(uploaded_file)
+
+    if variants_exist(digest):
+        # Такой файл уже обрабатывался (у этого или другого пользователя)
+        user.avatar.name = variant_name(digest, 'large')
+        user.avatar_hash = digest
+        user.avatar_ready = True
+        user.save(update_fields=['avatar', 'avatar_hash', 'avatar_ready'])
+        return user
+
+    ext = os.path.splitext(uploaded_file.name)[1].lower()[:10]
+    name = upload_name(digest, ext)
+    if not default_storage.exists(name):
+        name = default_storage.save(name, uploaded_file)
+
+    user.avatar.name = name
+    user.avatar_hash = digest
+    user.avatar_ready = False
+    user.save(update_fields=['avatar', 'avatar_hash', 'avatar_ready'])
+
+    if settings.AVATARS['ASYNC']:
+        transaction.on_commit(lambda: get_executor().submit(process_avatar, digest, name))
+    else:
+        transaction.on_commit(lambda: process_avatar(digest, name))
+    return user
+
+
+def render_variants(source):
+    from PIL import Image, ImageOps
+
+    with Image.open(source) as image:
+        # Поворот по EXIF до того, как метаданные будут отброшены
+        image = ImageOps.exif_transpose(image)
+        image = image.convert('RGBA' if image.mode in ('RGBA', 'LA', 'P') else 'RGB')
+
+        for variant, size in settings.AVATARS['VARIANTS'].items():
+            thumbnail = ImageOps.fit(image, (size, size), method=Image.Resampling.LANCZOS)
+            buffer = BytesIO()
+            # Новое изображение сохраняется без exif/icc/xmp
+            thumbnail.save(buffer, format=settings.AVATARS['FORMAT'], quality=settings.AVATARS['QUALITY'],
+                           method=4)
+            yield variant, buffer.getvalue()
+
+
+def process_avatar(digest, name):
+    from .authentication import user_cache
+    from .models import CustomUser
+
+    try:
+        # Тот же файл мог успеть обработать параллельный запрос
+        if not variants_exist(digest):
+            with default_storage.open(name) as source:
+                for variant, content in render_variants(source):
+                    target = variant_name(digest, variant)
+                    if not default_storage.exists(target):
+                        default_storage.save(target, ContentFile(content))
+    except Exception:
+        logger.exception("Avatar processing failed for %s", name)
+        users = CustomUser.objects.filter(avatar=name, avatar_ready=False)
+        pks = list(users.values_list('pk', flat=True))
+        users.update(avatar=None, avatar_hash='')
+    else:
+        users = CustomUser.objects.filter(avatar_hash=digest, avatar_ready=False)
+        pks = list(users.values_list('pk', flat=True))
+        users.update(avatar=variant_name(digest, 'large'), avatar_ready=True)
+    finally:
+        # Исходник с метаданными больше не нужен
+        if default_storage.exists(name):
+            default_storage.delete(name)
+
+    # update() не шлёт post_save, поэтому кэш пользователей сбрасываем вручную
+    for pk in pks:
+        user_cache.invalidate(pk)
+
+
+def avatar_url(user, variant):
+    if not user.avatar:
+        return None
+    if user.avatar_ready:
+        if variant not in settings.AVATARS['VARIANTS']:
+            variant = 'large'
+        return default_storage.url(variant_name(user.avatar_hash, variant))
+    if user.avatar_hash:
+        # Миниатюры ещё готовятся: исходник с EXIF/GPS наружу не отдаётся
+        return None
+    # Аватар, загруженный до появления миниатюр
+    return user.avatar.url
@@ -0,0 +1,167 @@
+import hashlib
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, connection, transaction
+from django.http import HttpResponse, JsonResponse
+from django.utils import timezone
+
+from fit.routers import token_user_id
+
+# Ответы с этими статусами не сохраняются: повтор с тем же ключом выполнится заново
+RETRYABLE_STATUSES = (401, 403, 408, 429)
+# Заголовки, которые не переносятся в повторный ответ
+SKIP_HEADERS = ('set-cookie',)
+# Ответы с токенами не сохраняются: повтор с тем же ключом выдал бы живые JWT
+TOKEN_FIELDS = ('access', 'refresh')
+
+_sweep_lock = threading.Lock()
+_swept_at = time.monotonic()
+_executor = None
+
+
+def get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='idempotency')
+    return _executor
+
+
+def request_hash(request):
+    # Тот же ключ с другим запросом - ошибка клиента. Большие тела (загрузка аватара)
+    # не читаются целиком ради хеша, для них сравниваются только длина и тип
+    digest = hashlib.sha256(f'{request.method} {request.path}\n'.encode())
+    length = int(request.META.get('CONTENT_LENGTH') or 0)
+    if length <= settings.IDEMPOTENCY['HASH_BODY_LIMIT']:
+        digest.update(request.body)
+    else:
+        digest.update(f"{length} {request.META.get('CONTENT_TYPE', '')}".encode())
+    return digest.hexdigest()
+
+
+def has_tokens(response):
+    if not response.get('Content-Type', '').startswith('application/json'):
+        return False
+    try:
+        data = json.loads(response.content)
+    except ValueError:
+        return False
+    return isinstance(data, dict) and any(field in data for field in TOKEN_FIELDS)
+
+
+def replay(record):
+    response = HttpResponse(bytes(record.body), status=record.status_code)
+    for name, value in record.headers:
+        response[name] = value
+    response['Idempotent-Replayed'] = 'true'
+    return response
+
+
+def sweep_expired():
+    from .models import IdempotencyKey
+
+    return IdempotencyKey.objects.filter(expires_at__lte=timezone.now()).delete()[0]
+
+
+def sweep_in_background():
+    try:
+        sweep_expired()
+    finally:
+        # Соединение фонового потока иначе осталось бы открытым
+        connection.close()
+
+
+def maybe_sweep():
+    # Удаление истёкших ключей в фоновом потоке, не чаще SWEEP_INTERVAL
+    global _swept_at
+    if time.monotonic() - _swept_at < settings.IDEMPOTENCY['SWEEP_INTERVAL']:
+        return
+    with _sweep_lock:
+        if time.monotonic() - _swept_at < settings.IDEMPOTENCY['SWEEP_INTERVAL']:
+            return
+        _swept_at = time.monotonic()
+    get_executor().submit(sweep_in_background)
+
+
+class IdempotencyMiddleware:
+    # Заголовок Idempotency-Key для view с idempotent_methods. Первый ответ на ключ (в рамках
+    # пользователя из JWT) сохраняется в IdempotencyKey и на повторы отдаётся как есть, без
+    # повторного выполнения view. Параллельный дубль ждёт, пока первый запрос завершится.
+    # Запросы без токена ключ не учитывают: у анонимных клиентов общее пространство ключей.
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        record = getattr(request, 'idempotency_record', None)
+        if record is not None:
+            self.finish(record, response)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        view_class = getattr(view_func, 'cls', None)
+        if request.method not in getattr(view_class, 'idempotent_methods', ()):
+            return None
+        key = request.headers.get('Idempotency-Key', '').strip()
+        if not key:
+            return None
+        if len(key) > 255:
+            return JsonResponse({"error": "Слишком длинный Idempotency-Key"}, status=400)
+        user_id = token_user_id(request)
+        if user_id is None:
+            return None
+        return self.claim(request, key, user_id, request_hash(request))
+
+    def claim(self, request, key, user_id, fingerprint):
+        from .models import IdempotencyKey
+
+        config = settings.IDEMPOTENCY
+        deadline = time.monotonic() + config['WAIT_TIMEOUT']
+        while True:
+            now = timezone.now()
+            try:
+                with transaction.atomic():
+                    request.idempotency_record = IdempotencyKey.objects.create(
+                        user_id=user_id, key=key, request_hash=fingerprint,
+                        expires_at=now + timedelta(seconds=config['TTL']),
+                    )
+                return None
+            except IntegrityError:
+                pass
+
+            record = IdempotencyKey.objects.filter(user_id=user_id, key=key).first()
+            if record is None:
+                continue
+            if record.expires_at <= now or (
+                    record.status_code is None and record.created_at < now - timedelta(seconds=config['LOCK_TIMEOUT'])):
+                # Истёкший ключ или запрос, упавший вместе с процессом: ключ можно занять заново
+                IdempotencyKey.objects.filter(pk=record.pk).delete()
+                continue
+            if record.request_hash != fingerprint:
+                return JsonResponse({"error": "Idempotency-Key уже использован для другого запроса"}, status=422)
+            if record.status_code is not None:
+                return replay(record)
+            if time.monotonic() >= deadline:
+                response = JsonResponse({"error": "Запрос с этим Idempotency-Key ещё выполняется"}, status=409)
+                response['Retry-After'] = '1'
+                return response
+            time.sleep(config['POLL_INTERVAL'])
+
+    def finish(self, record, response):
+        from .models import IdempotencyKey
+
+        if (response.status_code >= 500 or response.status_code in RETRYABLE_STATUSES or response.streaming
+                or has_tokens(response)):
+            IdempotencyKey.objects.filter(pk=record.pk).delete()
+            return
+        IdempotencyKey.objects.filter(pk=record.pk).update(
+            status_code=response.status_code,
+            headers=[[name, value] for name, value in response.items() if name.lower() not in SKIP_HEADERS],
+            body=response.content,
+        )
+        maybe_sweep()
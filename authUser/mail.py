@@ -0,0 +1,56 @@
+from django.core.mail import EmailMultiAlternatives
+from django.core.mail.backends.base import BaseEmailBackend
+
+
+class OutboxEmailBackend(BaseEmailBackend):
+    # EMAIL_BACKEND для приложения: письма не отправляются сразу, а пишутся в
+    # таблицу OutgoingEmail в текущей транзакции. Отправляет их send_outbox.
+
+    def send_messages(self, email_messages):
+        from .models import OutgoingEmail
+
+        rows = [
+            OutgoingEmail(
+                subject=message.subject[:255],
+                recipients=", ".join(message.recipients()),
+                message=serialize_message(message),
+            )
+            for message in email_messages
+            if message.recipients()
+        ]
+        OutgoingEmail.objects.bulk_create(rows)
+        return len(rows)
+
+
+def serialize_message(message):
+    if message.attachments:
+        raise ValueError("OutboxEmailBackend does not support attachments")
+
+    return {
+        "body": message.body,
+        "from_email": message.from_email,
+        "to": list(message.to),
+        "cc": list(message.cc),
+        "bcc": list(message.bcc),
+        "reply_to": list(message.reply_to),
+        "headers": dict(message.extra_headers),
+        "alternatives": [list(alternative) for alternative in getattr(message, "alternatives", [])],
+    }
+
+
+def deserialize_message(outgoing, connection=None):
+    data = outgoing.message
+    message = EmailMultiAlternatives(
+        subject=outgoing.subject,
+        body=data["body"],
+        from_email=data["from_email"],
+        to=data["to"],
+        cc=data["cc"],
+        bcc=data["bcc"],
+        reply_to=data["reply_to"],
+        headers=data["headers"],
+        connection=connection,
+    )
+    for content, mimetype in data["alternatives"]:
+        message.attach_alternative(content, mimetype)
+    return message
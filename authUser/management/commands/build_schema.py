@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+
+from fit.schema import build_schema_files, code_version, schema_path
+
+
+class Command(BaseCommand):
+    help = "Генерирует схему OpenAPI для текущей версии кода (запускать при деплое)"
+
+    def handle(self, *args, **options):
+        version = code_version()
+        build_schema_files(version)
+        self.stdout.write(f"Schema {version} written to {schema_path(version, 'yaml').parent}")
@@ -0,0 +1,36 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from authUser.outbox import OutboxSender
+
+
+class Command(BaseCommand):
+    help = "Отправляет письма из outbox пачками через одно соединение с почтовым сервером"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--loop', action='store_true', help="Работать постоянно, опрашивая outbox")
+        parser.add_argument('--interval', type=float, default=2.0, help="Пауза между опросами в режиме --loop")
+        parser.add_argument('--batch-size', type=int, default=None)
+
+    def handle(self, *args, **options):
+        sender = OutboxSender(batch_size=options['batch_size'])
+
+        if not options['loop']:
+            total, sent = sender.drain()
+            self.stdout.write(f"Processed {total} emails, sent {sent}")
+            return
+
+        try:
+            while True:
+                claimed, sent = sender.send_batch()
+                if sent:
+                    self.stdout.write(f"Sent {sent} of {claimed} emails")
+                if claimed < sender.batch_size:
+                    # Outbox пуст: закрываем соединение, чтобы сервер не оборвал его по таймауту
+                    sender.close()
+                    time.sleep(options['interval'])
+        except KeyboardInterrupt:
+            pass
+        finally:
+            sender.close()
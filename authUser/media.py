@@ -0,0 +1,113 @@
+import mimetypes
+import os
+import re
+from pathlib import Path
+
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import FileResponse, Http404, HttpResponse, HttpResponseNotModified
+from django.utils._os import safe_join
+from django.utils.http import http_date, parse_etags
+from django.views.decorators.http import require_safe
+
+# avatars/<hash[:2]>/<hash>/<variant>.<ext> адресуются по содержимому
+VERSIONED_AVATAR = re.compile(r'^[0-9a-f]{2}/(?P<digest>[0-9a-f]{64})/(?P<variant>\w+)\.\w+$')
+RANGE = re.compile(r'^bytes=(?P<start>\d*)-(?P<end>\d*)$')
+
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+MUTABLE_CACHE_CONTROL = 'public, max-age=300, must-revalidate'
+
+
+def avatar_etag(path, stat):
+    match = VERSIONED_AVATAR.match(path)
+    if match:
+        return f'"{match.group("digest")[:32]}-{match.group("variant")}"'
+    return f'"{int(stat.st_mtime):x}-{stat.st_size:x}"'
+
+
+def parse_range(header, size):
+    # Поддерживается один диапазон: bytes=a-b, bytes=a- и bytes=-n
+    match = RANGE.match(header.strip())
+    if not match or (not match.group('start') and not match.group('end')):
+        return None
+    if match.group('start'):
+        start = int(match.group('start'))
+        end = int(match.group('end')) if match.group('end') else size - 1
+    else:
+        start = max(size - int(match.group('end')), 0)
+        end = size - 1
+    end = min(end, size - 1)
+    if start > end:
+        raise ValueError("Unsatisfiable range")
+    return start, end
+
+
+def sendfile_response(full_path, relative_path, content_type):
+    options = settings.MEDIA_SENDFILE
+    response = HttpResponse(content_type=content_type)
+    if options['BACKEND'] == 'xaccel':
+        response['X-Accel-Redirect'] = options['XACCEL_PREFIX'].rstrip('/') + '/avatars/' + relative_path
+    else:
+        response['X-Sendfile'] = full_path
+    return response
+
+
+@require_safe
+def serve_avatar(request, path):
+    try:
+        full_path = safe_join(settings.MEDIA_ROOT, 'avatars', path)
+    except SuspiciousFileOperation:
+        raise Http404("Avatar not found")
+    # Исходные загрузки с метаданными хранятся только до обработки и наружу не отдаются
+    if Path(os.path.relpath(full_path, os.path.join(settings.MEDIA_ROOT, 'avatars'))).parts[0] == 'uploads':
+        raise Http404("Avatar not found")
+
+    try:
+        stat = os.stat(full_path)
+    except (FileNotFoundError, NotADirectoryError):
+        raise Http404("Avatar not found")
+    if not Path(full_path).is_file():
+        raise Http404("Avatar not found")
+
+    etag = avatar_etag(path, stat)
+    cache_control = IMMUTABLE_CACHE_CONTROL if VERSIONED_AVATAR.match(path) else MUTABLE_CACHE_CONTROL
+
+    if_none_match = request.headers.get('If-None-Match')
+    if if_none_match and (etag in parse_etags(if_none_match) or if_none_match.strip() == '*'):
+        response = HttpResponseNotModified()
+        response['ETag'] = etag
+        response['Cache-Control'] = cache_control
+        return response
+
+    content_type = mimetypes.guess_type(full_path)[0] or 'application/octet-stream'
+
+    if settings.MEDIA_SENDFILE['BACKEND']:
+        # Файл отдаёт прокси (nginx/apache), он же обрабатывает Range
+        response = sendfile_response(full_path, path, content_type)
+    else:
+        byte_range = None
+        range_header = request.headers.get('Range')
+        if_range = request.headers.get('If-Range')
+        if range_header and (not if_range or if_range.strip() == etag):
+            try:
+                byte_range = parse_range(range_header, stat.st_size)
+            except ValueError:
+                response = HttpResponse(status=416)
+                response['Content-Range'] = f'bytes */{stat.st_size}'
+                return response
+
+        if byte_range:
+            start, end = byte_range
+            with open(full_path, 'rb') as f:
+                f.seek(start)
+                response = HttpResponse(f.read(end - start + 1), status=206, content_type=content_type)
+            response['Content-Range'] = f'bytes {start}-{end}/{stat.st_size}'
+        else:
+            response = FileResponse(open(full_path, 'rb'), content_type=content_type)
+            response['Content-Length'] = stat.st_size
+
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(stat.st_mtime)
+    response['Cache-Control'] = cache_control
+    response['Accept-Ranges'] = 'bytes'
+    return response
@@ -0,0 +1,23 @@
+# Generated by Django 5.1.2 on 2026-10-19 17:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('authUser', '0004_outgoingemail'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='customuser',
+            name='avatar_hash',
+            field=models.CharField(blank=True, default='', max_length=64),
+        ),
+        migrations.AddField(
+            model_name='customuser',
+            name='avatar_ready',
+            field=models.BooleanField(default=False),
+        ),
+    ]
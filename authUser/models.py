@@ -34,6 +34,9 @@ class CustomUser(AbstractBaseUser, PermissionsMixin):
     first_name = models.CharField(max_length=30, blank=True)
     last_name = models.CharField(max_length=30, blank=True)
     avatar = models.ImageField(upload_to='avatars/', blank=True, null=True)
+    # sha256 загруженного файла; варианты лежат в avatars/<hash[:2]>/<hash>/
+    avatar_hash = models.CharField(max_length=64, blank=True, default='')
+    avatar_ready = models.BooleanField(default=False)
     code = models.TextField(blank=True, null=True)
     is_verified = models.BooleanField(default=False)
     is_active = models.BooleanField(default=True)
@@ -49,7 +52,69 @@ class CustomUser(AbstractBaseUser, PermissionsMixin):
     @staticmethod
     def get_email_field_name():
         return 'email'
+
+    def get_avatar_url(self, variant='medium'):
+        from .avatars import avatar_url
+        return avatar_url(self, variant)
+
     def __str__(self):
         return f"{self.nickname} - {'Verified' if self.is_verified else 'Not Verified'}"
 
 
+
+
+class OutgoingEmail(models.Model):
+    STATUS_PENDING = "P"
+    STATUS_SENT = "S"
+    STATUS_FAILED = "F"
+    status_choice = [
+        (STATUS_PENDING, 'pending'),
+        (STATUS_SENT, 'sent'),
+        (STATUS_FAILED, 'failed'),
+    ]
+
+    subject = models.CharField(max_length=255)
+    recipients = models.TextField()
+    # Сериализованное письмо: body, from_email, to, cc, bcc, reply_to, headers, alternatives
+    message = models.JSONField()
+    status = models.CharField(max_length=1, choices=status_choice, default=STATUS_PENDING)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True, null=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at'], name='outbox_due_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.recipients} | {self.subject} | {self.get_status_display()}"
+
+
+class RevokedToken(models.Model):
+    jti = models.CharField(max_length=64, unique=True)
+    expires_at = models.DateTimeField(db_index=True)
+    revoked_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    def __str__(self):
+        return self.jti
+
+
+class IdempotencyKey(models.Model):
+    # Сохранённый ответ на запрос с Idempotency-Key (authUser.idempotency).
+    # status_code = NULL - запрос ещё выполняется
+    user_id = models.BigIntegerField(default=0)
+    key = models.CharField(max_length=255)
+    request_hash = models.CharField(max_length=64)
+    status_code = models.PositiveSmallIntegerField(null=True, blank=True)
+    headers = models.JSONField(default=list)
+    body = models.BinaryField(default=b'')
+    created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField(db_index=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user_id', 'key'], name='idempotency_user_key_uniq'),
+        ]
@@ -0,0 +1,105 @@
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import get_connection
+from django.db import connection as db_connection, transaction
+from django.utils import timezone
+
+from .mail import deserialize_message
+from .models import OutgoingEmail
+
+logger = logging.getLogger(__name__)
+
+
+def claim_batch(batch_size, lease):
+    # Забираем пачку писем и сдвигаем next_attempt_at на время аренды, чтобы
+    # параллельный воркер не отправил те же письма.
+    now = timezone.now()
+    with transaction.atomic():
+        queryset = OutgoingEmail.objects.filter(
+            status=OutgoingEmail.STATUS_PENDING, next_attempt_at__lte=now
+        ).order_by('next_attempt_at', 'id')
+        if db_connection.features.has_select_for_update:
+            queryset = queryset.select_for_update(
+                skip_locked=db_connection.features.has_select_for_update_skip_locked
+            )
+        batch = list(queryset[:batch_size])
+        OutgoingEmail.objects.filter(pk__in=[email.pk for email in batch]).update(
+            next_attempt_at=now + timedelta(seconds=lease)
+        )
+    return batch
+
+
+class OutboxSender:
+    # Отправляет письма из outbox через одно долгоживущее соединение
+    # (OUTBOX['DELIVERY_BACKEND'], по умолчанию SMTP).
+
+    def __init__(self, backend=None, batch_size=None, max_attempts=None, retry_delay=None, lease=None):
+        options = settings.OUTBOX
+        self.backend = backend or options['DELIVERY_BACKEND']
+        self.batch_size = batch_size or options['BATCH_SIZE']
+        self.max_attempts = max_attempts or options['MAX_ATTEMPTS']
+        self.retry_delay = retry_delay or options['RETRY_DELAY']
+        self.lease = lease or options['LEASE']
+        self.connection = None
+
+    def open(self):
+        if self.connection is None:
+            self.connection = get_connection(self.backend, fail_silently=False)
+            self.connection.open()
+        return self.connection
+
+    def close(self):
+        if self.connection is not None:
+            try:
+                self.connection.close()
+            except Exception:
+                logger.exception("Failed to close outbox mail connection")
+            self.connection = None
+
+    def send_batch(self):
+        batch = claim_batch(self.batch_size, self.lease)
+        sent = 0
+        for outgoing in batch:
+            try:
+                connection = self.open()
+                deserialize_message(outgoing, connection=connection).send()
+            except Exception as e:
+                # Соединение после ошибки может быть в неизвестном состоянии
+                self.close()
+                self.mark_failed(outgoing, e)
+            else:
+                outgoing.status = OutgoingEmail.STATUS_SENT
+                outgoing.sent_at = timezone.now()
+                outgoing.attempts += 1
+                outgoing.last_error = None
+                outgoing.save(update_fields=['status', 'sent_at', 'attempts', 'last_error'])
+                sent += 1
+        return len(batch), sent
+
+    def mark_failed(self, outgoing, error):
+        outgoing.attempts += 1
+        outgoing.last_error = f"{type(error).__name__}: {error}"
+        if outgoing.attempts >= self.max_attempts:
+            outgoing.status = OutgoingEmail.STATUS_FAILED
+            logger.error("Outbox email %s failed permanently: %s", outgoing.pk, outgoing.last_error)
+        else:
+            # Экспоненциальная задержка между попытками
+            delay = self.retry_delay * 2 ** (outgoing.attempts - 1)
+            outgoing.next_attempt_at = timezone.now() + timedelta(seconds=delay)
+            logger.warning("Outbox email %s failed, retry in %ss: %s", outgoing.pk, delay, outgoing.last_error)
+        outgoing.save(update_fields=['status', 'attempts', 'last_error', 'next_attempt_at'])
+
+    def drain(self):
+        total = sent = 0
+        try:
+            while True:
+                claimed, delivered = self.send_batch()
+                total += claimed
+                sent += delivered
+                if claimed < self.batch_size:
+                    break
+        finally:
+            self.close()
+        return total, sent
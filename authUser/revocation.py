@@ -0,0 +1,160 @@
+import bisect
+import hashlib
+import math
+import threading
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+
+
+class BloomFilter:
+    def __init__(self, capacity, error_rate):
+        self.capacity = capacity
+        self.size = max(8, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, key):
+        # Двойное хеширование: k позиций из двух 64-битных половин одного blake2b
+        digest = hashlib.blake2b(key.encode(), digest_size=16).digest()
+        first = int.from_bytes(digest[:8], 'little')
+        second = int.from_bytes(digest[8:], 'little') | 1
+        return ((first + i * second) % self.size for i in range(self.hashes))
+
+    def add(self, key):
+        for position in self._positions(key):
+            self.bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, key):
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self._positions(key))
+
+
+class RevocationList:
+    # Список отозванных jti в памяти процесса.
+    # Bloom-фильтр отвечает "точно не отозван" без обращения к БД; положительный ответ
+    # проверяется по словарю jti -> exp. Отсортированный индекс по exp позволяет
+    # выбрасывать истёкшие записи. Источник правды - таблица RevokedToken; другие процессы
+    # подтягивают новые записи, когда меняется версия в общем кэше (или раз в MAX_STALENESS).
+
+    version_key = 'authuser:revocation:version'
+
+    def __init__(self, capacity, error_rate, sync_interval, max_staleness, db_prune_interval):
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.sync_interval = sync_interval
+        self.max_staleness = max_staleness
+        self.db_prune_interval = db_prune_interval
+        self._lock = threading.RLock()
+        self._reset()
+
+    def _reset(self):
+        self._bloom = BloomFilter(self.capacity, self.error_rate)
+        self._expires = {}
+        self._index = []
+        self._loaded = False
+        self._version = None
+        self._checked_at = 0.0
+        self._loaded_at = 0.0
+        self._db_synced_at = None
+        self._db_pruned_at = 0.0
+        self._removed = 0
+
+    def _add(self, jti, expires_ts):
+        if jti in self._expires:
+            return
+        self._expires[jti] = expires_ts
+        bisect.insort(self._index, (expires_ts, jti))
+        self._bloom.add(jti)
+        if len(self._expires) > self._bloom.capacity:
+            self._rebuild_bloom(self._bloom.capacity * 2)
+
+    def _rebuild_bloom(self, capacity):
+        self._bloom = BloomFilter(max(capacity, self.capacity), self.error_rate)
+        for jti in self._expires:
+            self._bloom.add(jti)
+        self._removed = 0
+
+    def _prune(self, now_ts):
+        index = self._index
+        if not index or index[0][0] > now_ts:
+            return
+        cut = bisect.bisect_right(index, now_ts, key=lambda item: item[0])
+        for _, jti in index[:cut]:
+            self._expires.pop(jti, None)
+        del index[:cut]
+        self._removed += cut
+        # Из Bloom-фильтра удалять нельзя, поэтому при большом числе удалений он пересобирается
+        if self._removed > max(len(self._expires), 1000):
+            self._rebuild_bloom(self._bloom.capacity)
+
+    def _load(self, since=None):
+        from .models import RevokedToken
+
+        now = timezone.now()
+        queryset = RevokedToken.objects.filter(expires_at__gt=now)
+        if since is not None:
+            # Перекрытие на случай транзакций, закоммиченных позже
+            queryset = queryset.filter(revoked_at__gte=since - timedelta(seconds=5))
+        for jti, expires_at in queryset.values_list('jti', 'expires_at').iterator():
+            self._add(jti, expires_at.timestamp())
+        self._db_synced_at = now
+        self._loaded_at = time.monotonic()
+        self._loaded = True
+
+        if time.monotonic() - self._db_pruned_at > self.db_prune_interval:
+            RevokedToken.objects.filter(expires_at__lte=now).delete()
+            self._db_pruned_at = time.monotonic()
+
+    def _sync(self):
+        now = time.monotonic()
+        if self._loaded and now - self._checked_at < self.sync_interval:
+            return
+        with self._lock:
+            if self._loaded and now - self._checked_at < self.sync_interval:
+                return
+            self._checked_at = now
+            self._prune(time.time())
+            version = cache.get(self.version_key)
+            if not self._loaded:
+                self._load()
+            elif version != self._version or now - self._loaded_at > self.max_staleness:
+                self._load(since=self._db_synced_at)
+            self._version = version
+
+    def is_revoked(self, jti):
+        self._sync()
+        if jti not in self._bloom:
+            return False
+        with self._lock:
+            self._prune(time.time())
+            return jti in self._expires
+
+    def revoke(self, jti, expires_at):
+        from .models import RevokedToken
+
+        RevokedToken.objects.bulk_create(
+            [RevokedToken(jti=jti, expires_at=expires_at)], ignore_conflicts=True
+        )
+        with self._lock:
+            self._add(jti, expires_at.timestamp())
+        # Сигнал остальным процессам подтянуть новые записи
+        try:
+            cache.incr(self.version_key)
+        except ValueError:
+            cache.set(self.version_key, 1, None)
+
+    def clear(self):
+        with self._lock:
+            self._reset()
+
+
+revocation_list = RevocationList(
+    capacity=settings.TOKEN_REVOCATION['CAPACITY'],
+    error_rate=settings.TOKEN_REVOCATION['ERROR_RATE'],
+    sync_interval=settings.TOKEN_REVOCATION['SYNC_INTERVAL'],
+    max_staleness=settings.TOKEN_REVOCATION['MAX_STALENESS'],
+    db_prune_interval=settings.TOKEN_REVOCATION['DB_PRUNE_INTERVAL'],
+)
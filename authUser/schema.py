@@ -0,0 +1,471 @@
+from drf_spectacular.contrib.rest_framework_simplejwt import SimpleJWTScheme
+from drf_spectacular.types import OpenApiTypes
+from drf_spectacular.utils import extend_schema, OpenApiParameter, OpenApiExample, OpenApiResponse
+
+from .serializers import UserSerializer, EmailVerificationSerializer, LogoutSerializer
+from .views import RegisterView, LogoutView, AvatarUploadView, CodeCheckVerifiedAPIView, ChangePasswordView, \
+    CurrentUserView
+
+# Описания OpenAPI для views приложения. Применяются хуком fit.schema.apply_view_schemas
+# только при генерации схемы, поэтому не строятся при импорте views.
+
+
+class CachedJWTScheme(SimpleJWTScheme):
+    # Схема jwtAuth (кнопка Authorize в Swagger) для CachedJWTAuthentication
+    target_class = 'authUser.authentication.CachedJWTAuthentication'
+
+
+def apply():
+    extend_schema(
+        summary="Регистрация нового пользователя",
+        description="Позволяет зарегистрировать нового пользователя, отправив данные через POST-запрос.",
+        request=UserSerializer,
+        responses={
+            201: OpenApiResponse(
+                description="user created successfully",
+            ),
+            400: OpenApiResponse(
+                description="ошибка",
+            ),
+        },
+    )(RegisterView.post)
+
+    extend_schema(
+        summary="Выход из аккаунта",
+        description=(
+                "Отзывает переданный refresh token и текущий access token. "
+                "Отозванные токены перестают приниматься всеми воркерами в течение нескольких секунд."
+        ),
+        parameters=[
+            OpenApiParameter(
+                name="Authorization",
+                description="Bearer access token для аутентификации",
+                required=True,
+                type=OpenApiTypes.STR,
+                location=OpenApiParameter.HEADER,
+                examples=[
+                    OpenApiExample(
+                        "Пример токена",
+                        summary="Bearer Token",
+                        value="eyJhbGciOiJIUzI1NiIsInR5..."
+                    )
+                ]
+            )
+        ],
+        request=LogoutSerializer,
+        responses={
+            200: OpenApiResponse(
+                description="Токены отозваны.",
+                examples=[
+                    OpenApiExample(
+                        "Успешный ответ",
+                        summary="Выход выполнен",
+                        value={"message": "Logged out successfully"}
+                    )
+                ]
+            ),
+            400: OpenApiResponse(
+                description="Некорректный refresh token.",
+                examples=[
+                    OpenApiExample(
+                        "Ошибка токена",
+                        summary="Неверный токен",
+                        value={"error": "Invalid refresh token"}
+                    )
+                ]
+            )
+        },
+        tags=["current_user"]
+    )(LogoutView.post)
+
+    extend_schema(
+        summary="Загрузить аватар",
+        description=(
+                "Загружает новый аватар для текущего пользователя. Необходимо передать файл аватара в формате `multipart/form-data`."
+        ),
+        parameters=[
+            OpenApiParameter(
+                name="Authorization and image",
+                description="Bearer access token для аутентификации",
+                required=True,
+                type=OpenApiTypes.STR,
+                location=OpenApiParameter.HEADER,
+                examples=[
+                    OpenApiExample(
+                        "Пример токена",
+                        summary="Bearer Token",
+                        value="eyJhbGciOiJIUzI1NiIsInR5..."
+                    )
+                ]
+            )
+        ],
+        request={
+            "multipart/form-data": {
+                "type": "object",
+                "properties": {
+                    "avatar": {"type": "string", "format": "binary"}
+                }
+            }
+        },
+        responses={
+            200: OpenApiResponse(
+                description="Аватар успешно загружен.",
+                examples=[
+                    OpenApiExample(
+                        "Успешная загрузка",
+                        summary="Успешный ответ",
+                        value={"message": "Avatar uploaded successfully"}
+                    )
+                ]
+            ),
+            400: OpenApiResponse(
+                description="Ошибка валидации данных.",
+                examples=[
+                    OpenApiExample(
+                        "Ошибка валидации",
+                        summary="Неверный запрос",
+                        value={"error": "Invalid file format"}
+                    )
+                ]
+            )
+        },
+        tags=["avatar"]
+    )(AvatarUploadView.post)
+
+    extend_schema(
+        summary="Обновить аватар",
+        description=(
+                "Обновляет текущий аватар пользователя. Требуется передать файл с ключом `avatar` в формате `multipart/form-data`. "
+                "Необходимо наличие JWT access токена."
+        ),
+        parameters=[
+            OpenApiParameter(
+                name="Authorization",
+                description="Bearer access token для аутентификации",
+                required=True,
+                type=OpenApiTypes.STR,
+                location=OpenApiParameter.HEADER,
+                examples=[
+                    OpenApiExample(
+                        "Пример токена",
+                        summary="Bearer Token",
+                        value="eyJhbGciOiJIUzI1NiIsInR5..."
+                    )
+                ]
+            )
+        ],
+        request={
+            "multipart/form-data": {
+                "type": "object",
+                "properties": {
+                    "avatar": {"type": "string", "format": "binary"}
+                }
+            }
+        },
+        responses={
+            200: OpenApiResponse(
+                description="Аватар успешно обновлён.",
+                examples=[
+                    OpenApiExample(
+                        "Успешное обновление",
+                        summary="Успешный ответ",
+                        value={
+                            "message": "Аватар успешно обновлён",
+                            "avatar_url": None,
+                            "avatar_ready": False
+                        }
+                    )
+                ]
+            ),
+            400: OpenApiResponse(
+                description="Ошибка валидации данных.",
+                examples=[
+                    OpenApiExample(
+                        "Ошибка файла",
+                        summary="Файл отсутствует",
+                        value={"error": "Необходимо передать файл 'avatar'"}
+                    )
+                ]
+            )
+        },
+        tags=["avatar"]
+    )(AvatarUploadView.put)
+
+    extend_schema(
+        summary="Получить аватар",
+        description=(
+                "Возвращает текущий аватар пользователя. Если аватар отсутствует, вернётся ошибка. "
+                "Требуется наличие JWT access токена."
+        ),
+        parameters=[
+            OpenApiParameter(
+                name="Authorization",
+                description="Bearer access token для аутентификации",
+                required=True,
+                type=OpenApiTypes.STR,
+                location=OpenApiParameter.HEADER,
+                examples=[
+                    OpenApiExample(
+                        "Пример токена",
+                        summary="Bearer Token",
+                        value="eyJhbGciOiJIUzI1NiIsInR5..."
+                    )
+                ]
+            ),
+            OpenApiParameter(
+                name="size",
+                description="Размер миниатюры: small (64px), medium (192px) или large (512px)",
+                required=False,
+                type=OpenApiTypes.STR,
+                location=OpenApiParameter.QUERY,
+                enum=["small", "medium", "large"],
+                default="large"
+            )
+        ],
+        responses={
+            200: OpenApiResponse(
+                description="Успешное получение аватара. Пока миниатюры готовятся, avatar_url - null.",
+                examples=[
+                    OpenApiExample(
+                        "Успешный ответ",
+                        summary="Аватар найден",
+                        value={"avatar_url": "http://example.com/media/avatars/3f/3f9a.../large.webp",
+                               "avatar_ready": True}
+                    )
+                ]
+            ),
+            404: OpenApiResponse(
+                description="Аватар не найден.",
+                examples=[
+                    OpenApiExample(
+                        "Аватар отсутствует",
+                        summary="Ошибка",
+                        value={"error": "Аватар не установлен"}
+                    )
+                ]
+            )
+        },
+        tags=["avatar"]
+    )(AvatarUploadView.get)
+
+    extend_schema(
+        summary="Удалить аватар",
+        description=(
+                "Удаляет текущий аватар пользователя. Требуется наличие JWT access токена. "
+                "Если аватар отсутствует, вернётся ошибка."
+        ),
+        parameters=[
+            OpenApiParameter(
+                name="Authorization",
+                description="Bearer access token для аутентификации",
+                required=True,
+                type=OpenApiTypes.STR,
+                location=OpenApiParameter.HEADER,
+                examples=[
+                    OpenApiExample(
+                        "Пример токена",
+                        summary="Bearer Token",
+                        value="eyJhbGciOiJIUzI1NiIsInR5..."
+                    )
+                ]
+            )
+        ],
+        responses={
+            200: OpenApiResponse(
+                description="Аватар успешно удалён.",
+                examples=[
+                    OpenApiExample(
+                        "Успешный ответ",
+                        summary="Аватар удалён",
+                        value={"message": "Аватар успешно удалён"}
+                    )
+                ]
+            ),
+            404: OpenApiResponse(
+                description="Аватар не найден.",
+                examples=[
+                    OpenApiExample(
+                        "Аватар отсутствует",
+                        summary="Ошибка",
+                        value={"error": "Аватар не установлен"}
+                    )
+                ]
+            )
+        },
+        tags=["avatar"]
+    )(AvatarUploadView.delete)
+
+    extend_schema(
+        summary='верификация через код',
+        parameters=[
+            OpenApiParameter(
+                name="Authorization",
+                description="Bearer access token для аутентификации",
+                required=True,
+                type=OpenApiTypes.STR,
+                location=OpenApiParameter.HEADER,
+                examples=[
+                    OpenApiExample(
+                        "Пример токена",
+                        summary="Bearer Token",
+                        value="eyJhbGciOiJIUzI1NiIsInR5..."
+                    )
+                ]
+            )
+        ],
+        request=EmailVerificationSerializer,
+        tags=["current_user"]
+    )(CodeCheckVerifiedAPIView.post)
+
+    extend_schema(
+        summary="Смена пароля пользователя",
+        tags=["current_user"],
+        parameters=[
+            OpenApiParameter(
+                name="Authorization",
+                description="Bearer access token для аутентификации",
+                required=True,
+                type=OpenApiTypes.STR,
+                location=OpenApiParameter.HEADER,
+                examples=[
+                    OpenApiExample(
+                        "Пример токена",
+                        summary="Bearer Token",
+                        value="eyJhbGciOiJIUzI1NiIsInR5..."
+                    )
+                ]
+            )
+        ],
+        request={
+            "application/json": {
+                "type": "object",
+                "properties": {
+                    "old_password": {
+                        "type": "string",
+                        "description": "Текущий пароль пользователя",
+                        "example": "old_password123"
+                    },
+                    "new_password": {
+                        "type": "string",
+                        "description": "Новый пароль пользователя",
+                        "example": "new_password456"
+                    },
+                    "confirm_password": {
+                        "type": "string",
+                        "description": "Подтверждение нового пароля",
+                        "example": "new_password456"
+                    }
+                },
+                "required": ["old_password", "new_password", "confirm_password"]
+            }
+        },
+        responses={
+            200: {
+                "description": "Пароль успешно изменен.",
+                "content": {
+                    "application/json": {
+                        "example": {
+                            "message": "Пароль успешно изменен."
+                        }
+                    }
+                }
+            },
+            400: {
+                "description": "Ошибки в данных запроса.",
+                "content": {
+                    "application/json": {
+                        "examples": {
+                            "missing_fields": {
+                                "summary": "Отсутствуют обязательные поля",
+                                "value": {"error": "Все поля обязательны для заполнения."}
+                            },
+                            "invalid_old_password": {
+                                "summary": "Неверный текущий пароль",
+                                "value": {"error": "Старый пароль указан неверно."}
+                            },
+                            "password_mismatch": {
+                                "summary": "Пароли не совпадают",
+                                "value": {"error": "Новый пароль и подтверждение не совпадают."}
+                            }
+                        }
+                    }
+                }
+            }
+        }
+    )(ChangePasswordView.post)
+
+    extend_schema(
+        summary="Получение информации о текущем пользователе",
+        description="Возвращает информацию о текущем аутентифицированном пользователе.",
+        parameters=[
+            OpenApiParameter(
+                name="Authorization",
+                description="Bearer access token для аутентификации",
+                required=True,
+                type=OpenApiTypes.STR,
+                location=OpenApiParameter.HEADER,
+                examples=[
+                    OpenApiExample(
+                        "Пример токена",
+                        summary="Bearer Token",
+                        value="eyJhbGciOiJIUzI1NiIsInR5..."
+                    )
+                ]
+            )
+        ],
+        responses={
+            200: OpenApiExample(
+                "Успешный ответ",
+                value={
+                    "nickname": "john_doe",
+                    "email": "john.doe@example.com",
+                    "first_name": "John",
+                    "last_name": "Doe",
+                    "id": 1
+                }
+            ),
+            401: OpenApiExample(
+                "Неавторизованный доступ",
+                value={"detail": "Authentication credentials were not provided."}
+            )
+        },
+        tags=["current_user"]
+    )(CurrentUserView.get)
+
+    extend_schema(
+        summary="Обновление информации о пользователе",
+        description="Позволяет обновить данные текущего пользователя.",
+        request=UserSerializer,
+        parameters=[
+            OpenApiParameter(
+                name="Authorization",
+                description="Bearer access token для аутентификации",
+                required=True,
+                type=OpenApiTypes.STR,
+                location=OpenApiParameter.HEADER,
+                examples=[
+                    OpenApiExample(
+                        "Пример токена",
+                        summary="Bearer Token",
+                        value="eyJhbGciOiJIUzI1NiIsInR5..."
+                    )
+                ]
+            )
+        ],
+        responses={
+            200: OpenApiExample(
+                "Успешное обновление",
+                value={"message": "User updated successfully"}
+            ),
+            400: OpenApiExample(
+                "Ошибка валидации",
+                value={"message": {"email": ["This field is required."]}}
+            )
+        },
+        tags=["current_user"]
+    )(CurrentUserView.put)
+
+    extend_schema(
+        summary="удаление пользователя",
+        tags=["current_user"]
+    )(CurrentUserView.delete)
@@ -1,7 +1,10 @@
 from django.contrib.auth import get_user_model
 import re
 from rest_framework import serializers
+from rest_framework_simplejwt.serializers import TokenObtainPairSerializer, TokenRefreshSerializer
 from .models import CustomUser
+from .tokens import ClaimsRefreshToken
+
 class UserSerializer(serializers.ModelSerializer):
     password = serializers.CharField(write_only=True)
     avatar_url = serializers.SerializerMethodField()
@@ -21,9 +24,7 @@ class UserSerializer(serializers.ModelSerializer):
         return instance
 
     def get_avatar_url(self, obj):
-        if obj.avatar:
-            return obj.avatar.url
-        return None
+        return obj.get_avatar_url('medium')
 
 
     def validate_email(self, value):
@@ -69,4 +70,14 @@ class AvatarSerializer(serializers.ModelSerializer):
         fields = ['avatar']
 
 
+class ClaimsTokenObtainPairSerializer(TokenObtainPairSerializer):
+    token_class = ClaimsRefreshToken
+
+
+class RevocableTokenRefreshSerializer(TokenRefreshSerializer):
+    # BLACKLIST_AFTER_ROTATION отзывает старый refresh token через revocation_list
+    token_class = ClaimsRefreshToken
+
 
+class LogoutSerializer(serializers.Serializer):
+    refresh = serializers.CharField()
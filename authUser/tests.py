@@ -1,3 +1,433 @@
-from django.test import TestCase
+import os
+import tempfile
+from datetime import timedelta
+from io import BytesIO
+from unittest import mock
+from io import StringIO
+from smtplib import SMTPException
 
-# Create your tests here.
+from django.core import mail
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.mail.backends.base import BaseEmailBackend
+from django.core.management import call_command
+from django.conf import settings
+from django.core.cache import cache
+from django.http import JsonResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework.test import APIClient
+
+from plans.models import Exercises, Preferences, WorkoutSet
+from plans.services import save_plan
+from plans.workouts import workout_log
+
+from . import authentication
+from .authentication import CachedJWTAuthentication, user_cache
+from .idempotency import IdempotencyMiddleware, sweep_expired
+from .models import CustomUser, IdempotencyKey, OutgoingEmail, RevokedToken
+from .outbox import OutboxSender
+from .revocation import BloomFilter, RevocationList, revocation_list
+from .tokens import ClaimsRefreshToken
+
+
+class FailingEmailBackend(BaseEmailBackend):
+    def send_messages(self, email_messages):
+        raise SMTPException("connection refused")
+
+
+@override_settings(EMAIL_BACKEND='authUser.mail.OutboxEmailBackend')
+class OutboxTests(TestCase):
+    def register(self):
+        return APIClient().post('/api/v1/auth/register/', {
+            "nickname": "runner1",
+            "email": "runner@example.com",
+            "password": "Passw0rd!",
+        }, format='json')
+
+    def test_register_queues_email_instead_of_sending(self):
+        response = self.register()
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(len(mail.outbox), 0)
+        outgoing = OutgoingEmail.objects.get()
+        self.assertEqual(outgoing.recipients, "runner@example.com")
+        self.assertEqual(outgoing.status, OutgoingEmail.STATUS_PENDING)
+
+    @override_settings(OUTBOX={
+        'DELIVERY_BACKEND': 'django.core.mail.backends.locmem.EmailBackend',
+        'BATCH_SIZE': 2, 'MAX_ATTEMPTS': 3, 'RETRY_DELAY': 60, 'LEASE': 300,
+    })
+    def test_send_outbox_delivers_pending_emails(self):
+        self.register()
+        mail.EmailMessage("Hi", "text", "from@example.com", ["a@example.com"]).send()
+        mail.EmailMessage("Hi", "text", "from@example.com", ["b@example.com"]).send()
+
+        call_command('send_outbox', stdout=StringIO())
+
+        self.assertEqual(len(mail.outbox), 3)
+        self.assertEqual(mail.outbox[0].to, ["runner@example.com"])
+        self.assertFalse(OutgoingEmail.objects.exclude(status=OutgoingEmail.STATUS_SENT).exists())
+
+    def test_failed_delivery_is_retried_then_given_up(self):
+        self.register()
+        sender = OutboxSender(backend='authUser.tests.FailingEmailBackend', max_attempts=2)
+
+        sender.drain()
+        outgoing = OutgoingEmail.objects.get()
+        self.assertEqual(outgoing.status, OutgoingEmail.STATUS_PENDING)
+        self.assertEqual(outgoing.attempts, 1)
+        self.assertIn("connection refused", outgoing.last_error)
+
+        OutgoingEmail.objects.update(next_attempt_at=outgoing.created_at)
+        sender.drain()
+        outgoing.refresh_from_db()
+        self.assertEqual(outgoing.status, OutgoingEmail.STATUS_FAILED)
+
+
+@override_settings(EMAIL_BACKEND='authUser.mail.OutboxEmailBackend')
+class IdempotencyTests(TestCase):
+    def setUp(self):
+        # Подходы сбрасываются явно, без фонового потока
+        override = override_settings(WORKOUT_LOG={**settings.WORKOUT_LOG, 'FLUSH_THREAD': False})
+        override.enable()
+        self.addCleanup(override.disable)
+        self.addCleanup(workout_log.clear)
+        self.user = CustomUser.objects.create_user("retry1", "retry1@example.com", "Passw0rd!")
+        preferences = Preferences.objects.create(
+            id_user=self.user, gender="M", age=30, height=180, weight=80, goal="mass",
+            workout_frequency=3, prefer_workout_ex="barbell", time_of_program=1)
+        plan = save_plan({"name": "Retry", "description": "", "program_duration": 1, "weekly_schedule": [
+            {"day": "Monday", "focus": "Legs", "exercises": [
+                {"name": "Squat", "sets": "3", "reps": "10", "rest": "60s", "notes": ""}]}]}, self.user, preferences)
+        self.exercise = Exercises.objects.get(weekly_schedule_id__plan_id=plan)
+
+    def log_sets(self, key, reps=5, user=None):
+        api = APIClient()
+        api.credentials(HTTP_AUTHORIZATION=f'Bearer {ClaimsRefreshToken.for_user(user or self.user).access_token}')
+        sets = [{"exercise": self.exercise.pk, "reps": reps}] if reps is not None else []
+        return api.post('/api/v1/traning/workouts/sets/', {"sets": sets}, format='json', HTTP_IDEMPOTENCY_KEY=key)
+
+    def logged_sets(self):
+        workout_log.flush()
+        return WorkoutSet.objects.count()
+
+    def test_retry_replays_stored_response(self):
+        first = self.log_sets("key-1")
+        retry = self.log_sets("key-1")
+
+        self.assertEqual(first.status_code, 202)
+        self.assertEqual(retry.status_code, 202)
+        self.assertEqual(retry.content, first.content)
+        self.assertEqual(retry['Idempotent-Replayed'], 'true')
+        self.assertEqual(self.logged_sets(), 1)
+
+    def test_key_reused_for_other_request(self):
+        self.log_sets("key-1")
+        self.assertEqual(self.log_sets("key-1", reps=6).status_code, 422)
+        self.assertEqual(self.log_sets("key-2", reps=6).status_code, 202)
+
+    @override_settings(IDEMPOTENCY={**settings.IDEMPOTENCY, 'WAIT_TIMEOUT': 0.3, 'POLL_INTERVAL': 0.05})
+    def test_duplicate_waits_for_running_request(self):
+        self.log_sets("key-1")
+        record = IdempotencyKey.objects.get()
+        IdempotencyKey.objects.update(status_code=None)
+
+        response = self.log_sets("key-1")
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(self.logged_sets(), 1)
+
+        # Запрос, "упавший" дольше LOCK_TIMEOUT назад, больше не держит ключ
+        IdempotencyKey.objects.update(created_at=record.created_at - timedelta(hours=1))
+        response = self.log_sets("key-1")
+        self.assertEqual(response.status_code, 202)
+        self.assertFalse(response.has_header('Idempotent-Replayed'))
+        self.assertEqual(self.logged_sets(), 2)
+
+    def test_validation_errors_are_replayed_until_swept(self):
+        self.assertEqual(self.log_sets("key-1", reps=None).status_code, 400)
+        self.assertEqual(IdempotencyKey.objects.get().status_code, 400)
+
+        IdempotencyKey.objects.update(expires_at=timezone.now())
+        self.assertEqual(sweep_expired(), 1)
+        self.assertEqual(self.log_sets("key-1", reps=None).status_code, 400)
+
+    def test_anonymous_and_token_responses_are_not_stored(self):
+        response = APIClient().post('/api/v1/auth/register/', {
+            "nickname": "retry2", "email": "retry2@example.com", "password": "Passw0rd!",
+        }, format='json', HTTP_IDEMPOTENCY_KEY="key-1")
+        self.assertEqual(response.status_code, 201)
+        self.assertFalse(IdempotencyKey.objects.exists())
+
+        # Ответ с JWT не сохраняется и для запроса с токеном
+        def view(request):
+            return JsonResponse({"access": "token", "refresh": "token"})
+
+        view.cls = type('TokenView', (), {'idempotent_methods': ('POST',)})
+        middleware = IdempotencyMiddleware(lambda request: view(request))
+        token = ClaimsRefreshToken.for_user(self.user).access_token
+        request = RequestFactory().post('/', HTTP_AUTHORIZATION=f'Bearer {token}', HTTP_IDEMPOTENCY_KEY='key-2')
+        self.assertIsNone(middleware.process_view(request, view, (), {}))
+        middleware(request)
+        self.assertFalse(IdempotencyKey.objects.exists())
+
+
+class JWTSchemeTests(SimpleTestCase):
+    def test_cached_jwt_authentication_has_security_scheme(self):
+        from drf_spectacular.generators import SchemaGenerator
+
+        schema = SchemaGenerator().get_schema(request=None, public=True)
+        self.assertEqual(schema['components']['securitySchemes']['jwtAuth']['scheme'], 'bearer')
+        self.assertIn({'jwtAuth': []}, schema['paths']['/api/v1/traning/budget/']['get']['security'])
+
+
+class UserCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        user_cache.clear_local()
+        self.addCleanup(user_cache.clear_local)
+        self.user = CustomUser.objects.create_user("cached", "cached@example.com", "Passw0rd!")
+        self.token = str(ClaimsRefreshToken.for_user(self.user).access_token)
+
+    def authenticate(self):
+        request = RequestFactory().get('/', HTTP_AUTHORIZATION=f'Bearer {self.token}')
+        return CachedJWTAuthentication().authenticate(request)[0]
+
+    def test_cached_user_is_resolved_without_queries(self):
+        self.assertEqual(self.authenticate().pk, self.user.pk)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.authenticate().pk, self.user.pk)
+        user = self.authenticate()
+        user.nickname = "changed"
+        self.assertEqual(self.authenticate().nickname, "cached")
+
+    def test_shared_tier_requires_shared_cache(self):
+        self.authenticate()
+        user_cache.clear_local()
+        # Кэш в памяти процесса не общий: пользователь снова читается из БД
+        with self.assertNumQueries(1):
+            self.authenticate()
+
+        with mock.patch.object(authentication, 'is_shared_cache', return_value=True):
+            user_cache.clear_local()
+            self.authenticate()
+            user_cache.clear_local()
+            with self.assertNumQueries(0):
+                self.authenticate()
+
+    def test_save_and_delete_invalidate_cache(self):
+        self.authenticate()
+        self.user.is_active = False
+        self.user.save()
+        with self.assertRaises(AuthenticationFailed):
+            self.authenticate()
+
+        self.user.is_active = True
+        self.user.save()
+        self.authenticate()
+        self.user.delete()
+        with self.assertRaises(AuthenticationFailed):
+            self.authenticate()
+
+    def test_claims_views_check_user_state(self):
+        api = APIClient()
+        api.credentials(HTTP_AUTHORIZATION=f'Bearer {self.token}')
+        self.assertEqual(api.get('/api/v1/traning/budget/').status_code, 200)
+        # Закэшированный пользователь тоже проверяется
+        CustomUser.objects.filter(pk=self.user.pk).update(is_active=False)
+        self.assertEqual(api.get('/api/v1/traning/budget/').status_code, 200)
+        user_cache.invalidate(self.user.pk)
+        self.assertEqual(api.get('/api/v1/traning/budget/').status_code, 401)
+
+        self.user.save()
+        self.assertEqual(api.get('/api/v1/traning/budget/').status_code, 200)
+        self.user.is_active = False
+        self.user.save()
+        self.assertEqual(api.get('/api/v1/traning/budget/').status_code, 401)
+
+    def test_claims_views_reject_token_after_password_change(self):
+        # api_settings simplejwt общий для токенов и CachedJWTAuthentication
+        with mock.patch.object(authentication.api_settings, 'CHECK_REVOKE_TOKEN', True):
+            api = APIClient()
+            api.credentials(HTTP_AUTHORIZATION=f'Bearer {ClaimsRefreshToken.for_user(self.user).access_token}')
+            self.assertEqual(api.get('/api/v1/traning/budget/').status_code, 200)
+            self.user.set_password("N3wPassw0rd!")
+            self.user.save()
+            self.assertEqual(api.get('/api/v1/traning/budget/').status_code, 401)
+
+
+def jpeg_with_exif(color='red'):
+    from PIL import Image
+
+    exif = Image.Exif()
+    exif[0x010F] = "SpyCam"  # Make
+    buffer = BytesIO()
+    Image.new('RGB', (300, 200), color).save(buffer, format='JPEG', exif=exif)
+    return SimpleUploadedFile('photo.jpg', buffer.getvalue(), content_type='image/jpeg')
+
+
+class AvatarTests(TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.media_root = tmp.name
+        overrides = override_settings(MEDIA_ROOT=tmp.name, AVATARS={**settings.AVATARS, 'ASYNC': False})
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+        cache.clear()
+        user_cache.clear_local()
+        self.user = CustomUser.objects.create_user("avatar", "avatar@example.com", "Passw0rd!")
+        self.api = APIClient()
+        self.api.force_authenticate(self.user)
+
+    def upload(self):
+        return self.api.post('/api/v1/auth/avatar/', {'avatar': jpeg_with_exif()}, format='multipart')
+
+    def test_raw_upload_is_not_exposed_until_processed(self):
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.assertEqual(self.upload().status_code, 200)
+        self.user.refresh_from_db()
+        self.assertTrue(self.user.avatar.name.startswith('avatars/uploads/'))
+        self.assertEqual(self.api.get('/api/v1/auth/avatar/').json(), {"avatar_url": None, "avatar_ready": False})
+
+        for callback in callbacks:
+            callback()
+        self.user.refresh_from_db()
+        self.assertTrue(self.user.avatar_ready)
+        self.assertFalse(os.listdir(os.path.join(self.media_root, 'avatars', 'uploads')))
+        url = self.api.get('/api/v1/auth/avatar/', {'size': 'small'}).json()["avatar_url"]
+        self.assertTrue(url.endswith(f'/{self.user.avatar_hash}/small.webp'))
+        with open(os.path.join(self.media_root, 'avatars', self.user.avatar_hash[:2], self.user.avatar_hash,
+                               'large.webp'), 'rb') as f:
+            self.assertNotIn(b'SpyCam', f.read())
+
+    def test_failed_processing_clears_avatar_and_removes_upload(self):
+        with mock.patch('authUser.avatars.render_variants', side_effect=OSError("broken image")), \
+                self.assertLogs('authUser.avatars', 'ERROR'):
+            with self.captureOnCommitCallbacks(execute=True):
+                self.assertEqual(self.upload().status_code, 200)
+        self.user.refresh_from_db()
+        self.assertFalse(self.user.avatar)
+        self.assertFalse(os.listdir(os.path.join(self.media_root, 'avatars', 'uploads')))
+        self.assertEqual(self.api.get('/api/v1/auth/avatar/').status_code, 404)
+
+
+class AvatarMediaTests(TestCase):
+    digest = 'ab' + '0' * 62
+
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        overrides = override_settings(MEDIA_ROOT=tmp.name)
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+        self.files = {
+            f'{self.digest[:2]}/{self.digest}/large.webp': b'0123456789',
+            f'uploads/{self.digest}.jpg': b'raw with exif',
+            'legacy.png': b'legacy',
+        }
+        for name, content in self.files.items():
+            path = os.path.join(tmp.name, 'avatars', name)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, 'wb') as f:
+                f.write(content)
+        self.versioned = f'/media/avatars/{self.digest[:2]}/{self.digest}/large.webp'
+
+    def test_versioned_avatar_is_immutable_with_etag(self):
+        response = self.client.get(self.versioned)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content), b'0123456789')
+        self.assertEqual(response['Cache-Control'], 'public, max-age=31536000, immutable')
+        self.assertEqual(response['ETag'], f'"{self.digest[:32]}-large"')
+
+        cached = self.client.get(self.versioned, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(cached.status_code, 304)
+        self.assertEqual(cached['ETag'], response['ETag'])
+
+        legacy = self.client.get('/media/avatars/legacy.png')
+        self.assertEqual(legacy['Cache-Control'], 'public, max-age=300, must-revalidate')
+
+    def test_raw_uploads_are_not_served(self):
+        self.assertEqual(self.client.get(f'/media/avatars/uploads/{self.digest}.jpg').status_code, 404)
+        self.assertEqual(self.client.get(f'/media/avatars/ab/../uploads/{self.digest}.jpg').status_code, 404)
+
+    def test_ranges(self):
+        response = self.client.get(self.versioned, HTTP_RANGE='bytes=2-5')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response.content, b'2345')
+        self.assertEqual(response['Content-Range'], 'bytes 2-5/10')
+
+        self.assertEqual(self.client.get(self.versioned, HTTP_RANGE='bytes=-3').content, b'789')
+        unsatisfiable = self.client.get(self.versioned, HTTP_RANGE='bytes=20-30')
+        self.assertEqual(unsatisfiable.status_code, 416)
+        self.assertEqual(unsatisfiable['Content-Range'], 'bytes */10')
+
+        # If-Range с другим ETag: файл изменился, отдаётся целиком
+        full = self.client.get(self.versioned, HTTP_RANGE='bytes=2-5', HTTP_IF_RANGE='"other"')
+        self.assertEqual(full.status_code, 200)
+
+    def test_sendfile_offload(self):
+        with override_settings(MEDIA_SENDFILE={'BACKEND': 'xaccel', 'XACCEL_PREFIX': '/protected-media/'}):
+            response = self.client.get(self.versioned)
+        self.assertEqual(response['X-Accel-Redirect'],
+                         f'/protected-media/avatars/{self.digest[:2]}/{self.digest}/large.webp')
+        self.assertEqual(response.content, b'')
+
+        with override_settings(MEDIA_SENDFILE={'BACKEND': 'xsendfile', 'XACCEL_PREFIX': '/protected-media/'}):
+            response = self.client.get(self.versioned)
+        self.assertTrue(response['X-Sendfile'].endswith(f'{self.digest}/large.webp'))
+        self.assertEqual(response['ETag'], f'"{self.digest[:32]}-large"')
+
+
+class TokenRevocationTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        user_cache.clear_local()
+        revocation_list.clear()
+        self.addCleanup(revocation_list.clear)
+        self.user = CustomUser.objects.create_user("revoker", "revoker@example.com", "Passw0rd!")
+        self.refresh = ClaimsRefreshToken.for_user(self.user)
+        self.api = APIClient()
+        self.api.credentials(HTTP_AUTHORIZATION=f'Bearer {self.refresh.access_token}')
+
+    def new_list(self, **options):
+        # Отдельный экземпляр - как список в другом процессе
+        return RevocationList(**{'capacity': 100, 'error_rate': 0.01, 'sync_interval': 0, 'max_staleness': 3600,
+                                 'db_prune_interval': 3600, **options})
+
+    def test_logout_revokes_refresh_and_access_tokens(self):
+        self.assertEqual(self.api.get('/api/v1/auth/current-user/').status_code, 200)
+        response = self.api.post('/api/v1/auth/logout/', {"refresh": str(self.refresh)}, format='json')
+        self.assertEqual(response.status_code, 200)
+
+        self.assertEqual(self.api.get('/api/v1/auth/current-user/').status_code, 401)
+        refreshed = APIClient().post('/api/v1/auth/refresh/', {"refresh": str(self.refresh)}, format='json')
+        self.assertEqual(refreshed.status_code, 401)
+        self.assertEqual(RevokedToken.objects.count(), 2)
+
+    def test_bloom_false_positive_falls_through_to_exact_check(self):
+        revocations = self.new_list()
+        revocations.revoke('revoked-jti', timezone.now() + timedelta(hours=1))
+        with mock.patch.object(BloomFilter, '__contains__', return_value=True):
+            self.assertFalse(revocations.is_revoked('other-jti'))
+            self.assertTrue(revocations.is_revoked('revoked-jti'))
+
+    def test_revocation_from_other_process_is_picked_up(self):
+        other = self.new_list()
+        self.assertFalse(other.is_revoked('jti-1'))
+        self.new_list().revoke('jti-1', timezone.now() + timedelta(hours=1))
+        # Версия в общем кэше изменилась - новые записи подтягиваются из БД
+        with self.assertNumQueries(1):
+            self.assertTrue(other.is_revoked('jti-1'))
+
+    def test_pruning_expired_rows_keeps_live_revocations(self):
+        revocations = self.new_list()
+        revocations.revoke('live', timezone.now() + timedelta(hours=1))
+        revocations.revoke('expired', timezone.now() - timedelta(seconds=1))
+        self.assertFalse(revocations.is_revoked('expired'))
+        self.assertTrue(revocations.is_revoked('live'))
+
+        fresh = self.new_list(db_prune_interval=0)
+        self.assertTrue(fresh.is_revoked('live'))
+        self.assertEqual(list(RevokedToken.objects.values_list('jti', flat=True)), ['live'])
+        self.assertTrue(self.new_list().is_revoked('live'))
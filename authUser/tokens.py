@@ -0,0 +1,40 @@
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import AccessToken, RefreshToken
+from rest_framework_simplejwt.utils import datetime_from_epoch
+
+from .revocation import revocation_list
+
+
+class RevocableTokenMixin:
+    # Подменяет blacklist из token_blacklist: проверка по revocation_list без запроса к БД
+
+    def verify(self):
+        super().verify()
+        self.check_revoked()
+
+    def check_revoked(self):
+        if revocation_list.is_revoked(self[api_settings.JTI_CLAIM]):
+            raise TokenError(_("Token is blacklisted"))
+
+    def blacklist(self):
+        revocation_list.revoke(self[api_settings.JTI_CLAIM], datetime_from_epoch(self["exp"]))
+
+
+class RevocableAccessToken(RevocableTokenMixin, AccessToken):
+    pass
+
+
+class ClaimsRefreshToken(RevocableTokenMixin, RefreshToken):
+    # Подписанные claims копируются и в access token. Они отражают состояние
+    # пользователя на момент входа, поэтому годятся только как подсказка.
+
+    access_token_class = RevocableAccessToken
+
+    @classmethod
+    def for_user(cls, user):
+        token = super().for_user(user)
+        token['nickname'] = user.nickname
+        token['is_verified'] = user.is_verified
+        return token
@@ -0,0 +1,132 @@
+import argparse
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# OpenAI-совместимый сервер для нагрузочных тестов: POST /v1/chat/completions
+# отвечает готовым планом с заданной задержкой. Запуск отдельно:
+#   python -m bench.fake_openai --port 8900 --latency 1.5
+# и OPENAI_BASE_URL=http://127.0.0.1:8900/v1 для Django.
+
+CANNED_PLAN = {
+    "name": "План набора массы",
+    "description": "Трёхмесячная программа для набора мышечной массы.",
+    "program_duration": 3,
+    "weekly_schedule": [
+        {
+            "day": day,
+            "focus": focus,
+            "exercises": [
+                {"name": name, "sets": "4", "reps": "8-10", "rest": "90 секунд", "notes": "Следите за техникой."}
+                for name in exercises
+            ],
+        }
+        for day, focus, exercises in (
+            ("Понедельник", "Грудь и трицепс", ("Жим лёжа", "Жим гантелей на наклонной", "Отжимания на брусьях",
+                                                 "Французский жим", "Разводка гантелей", "Разгибания на блоке")),
+            ("Среда", "Спина и бицепс", ("Становая тяга", "Подтягивания", "Тяга штанги в наклоне",
+                                         "Тяга верхнего блока", "Подъём штанги на бицепс", "Молотки")),
+            ("Пятница", "Ноги и плечи", ("Приседания", "Жим ногами", "Румынская тяга",
+                                         "Армейский жим", "Махи гантелями", "Подъёмы на носки")),
+        )
+    ],
+}
+
+
+class FakeOpenAIHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get('Content-Length') or 0))
+        if self.path.rstrip('/') != '/v1/chat/completions':
+            self.send_json(404, {"error": {"message": "Not found", "type": "invalid_request_error"}})
+            return
+        server = self.server
+        if random.random() < server.error_rate:
+            self.send_json(500, {"error": {"message": "Fake server error", "type": "server_error"}})
+            return
+        time.sleep(max(0.0, random.gauss(server.latency, server.jitter)))
+
+        request = json.loads(body or b'{}')
+        content = json.dumps(server.plan, ensure_ascii=False)
+        prompt_tokens = sum(len(m.get("content", "")) for m in request.get("messages", [])) // 4
+        completion_tokens = len(content) // 4
+        with server.lock:
+            server.requests += 1
+        self.send_json(200, {
+            "id": f"chatcmpl-fake-{server.requests}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": request.get("model", "gpt-4o"),
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": f"```json\n{content}\n```"},
+                "finish_reason": "stop",
+            }],
+            "usage": {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens,
+            },
+        })
+
+    def send_json(self, status, data):
+        payload = json.dumps(data, ensure_ascii=False).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class FakeOpenAIServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, host='127.0.0.1', port=0, latency=0.0, jitter=0.0, error_rate=0.0, plan=CANNED_PLAN):
+        super().__init__((host, port), FakeOpenAIHandler)
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.plan = plan
+        self.requests = 0
+        self.lock = threading.Lock()
+        self._thread = None
+
+    @property
+    def base_url(self):
+        host, port = self.server_address[:2]
+        return f'http://{host}:{port}/v1'
+
+    def start(self):
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fake OpenAI chat completions server")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8900)
+    parser.add_argument('--latency', type=float, default=1.0, help="средняя задержка ответа, секунды")
+    parser.add_argument('--jitter', type=float, default=0.1)
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    args = parser.parse_args()
+    server = FakeOpenAIServer(args.host, args.port, args.latency, args.jitter, args.error_rate)
+    print(f"Fake OpenAI listening on {server.base_url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.server_close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,80 @@
+import argparse
+import json
+import logging
+import os
+import sys
+import time
+
+import django
+
+# Накладные расходы цепочки middleware на запрос к JWT API: прежний MIDDLEWARE
+# против RouteScopedMiddleware. Запросы без токена (401), чтобы время view и БД не мешало замеру.
+#   python -m bench.middleware --requests 5000
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'fit.settings')
+os.environ.setdefault('OPEN_API_KEY', 'bench')
+os.environ.setdefault('REQUEST_LOG_LEVEL', 'WARNING')
+
+FULL_MIDDLEWARE = [
+    'fit.metrics.MetricsMiddleware',
+    'fit.querylog.QueryInstrumentationMiddleware',
+    'django.middleware.security.SecurityMiddleware',
+    'django.contrib.sessions.middleware.SessionMiddleware',
+    'django.middleware.common.CommonMiddleware',
+    'django.middleware.csrf.CsrfViewMiddleware',
+    'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'fit.profiling.ProfilingMiddleware',
+    'django.contrib.messages.middleware.MessageMiddleware',
+    'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'corsheaders.middleware.CorsMiddleware',
+    'django.middleware.common.CommonMiddleware',
+    'fit.routers.ReplicaRoutingMiddleware',
+]
+
+
+def measure(middleware, path, requests):
+    from django.conf import settings
+    from django.core.handlers.wsgi import WSGIHandler
+    from django.test import RequestFactory, override_settings
+
+    # Метрики выключены, чтобы в замер не попадала запись файлов
+    with override_settings(MIDDLEWARE=middleware, METRICS={**settings.METRICS, 'ENABLED': False}):
+        handler = WSGIHandler()
+        factory = RequestFactory()
+        environ = factory.get(path, HTTP_ORIGIN='http://localhost:3000').environ
+
+        def call():
+            handler(dict(environ), lambda status, headers, exc_info=None: None)
+
+        for _ in range(200):
+            call()
+        start = time.perf_counter()
+        for _ in range(requests):
+            call()
+        return (time.perf_counter() - start) / requests * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Middleware overhead benchmark")
+    parser.add_argument('--requests', type=int, default=5000)
+    parser.add_argument('--path', default='/api/v1/traning/plan/')
+    args = parser.parse_args()
+    django.setup()
+    logging.getLogger('django.request').setLevel(logging.ERROR)
+    from django.conf import settings
+
+    full = measure(FULL_MIDDLEWARE, args.path, args.requests)
+    scoped = measure(settings.MIDDLEWARE, args.path, args.requests)
+    print(json.dumps({
+        "path": args.path,
+        "requests": args.requests,
+        "full_stack_us": round(full, 1),
+        "scoped_us": round(scoped, 1),
+        "saved_us": round(full - scoped, 1),
+        "saved_percent": round((full - scoped) / full * 100, 1),
+    }, indent=2))
+
+
+if __name__ == '__main__':
+    main()
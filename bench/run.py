@@ -0,0 +1,354 @@
+import argparse
+import io
+import itertools
+import json
+import os
+import platform
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from bench.fake_openai import FakeOpenAIServer
+
+# Нагрузочный прогон всех эндпоинтов из fit/urls.py на отдельной базе и фейковом OpenAI.
+#   python -m bench.run                       # сравнить с bench/baseline.json
+#   python -m bench.run --update-baseline     # записать новую базовую линию
+# Результат - JSON с пропускной способностью и перцентилями задержки по сценариям;
+# код возврата 1, если есть регрессии или неожиданные статусы ответов.
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+BASELINE = Path(__file__).resolve().parent / 'baseline.json'
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def percentile(values, q):
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    index = min(len(ordered) - 1, max(0, round(q / 100 * len(ordered) + 0.5) - 1))
+    return ordered[index]
+
+
+def multipart(field, filename, content, content_type):
+    boundary = uuid.uuid4().hex
+    body = (
+        f'--{boundary}\r\nContent-Disposition: form-data; name="{field}"; filename="{filename}"\r\n'
+        f'Content-Type: {content_type}\r\n\r\n'
+    ).encode() + content + f'\r\n--{boundary}--\r\n'.encode()
+    return body, f'multipart/form-data; boundary={boundary}'
+
+
+def avatar_bytes():
+    from PIL import Image
+
+    buffer = io.BytesIO()
+    Image.new('RGB', (400, 400), (40, 120, 200)).save(buffer, 'PNG')
+    return buffer.getvalue()
+
+
+class Scenario:
+    # warmup - запросы без замера перед прогоном (первые запросы прогревают ленивые импорты и кэши)
+    warmup = 1
+
+    def __init__(self, name, method, path, expect=(200,), body=None, token='user', requests=None, headers=None):
+        self.name = name
+        self.method = method
+        self.path = path
+        self.expect = expect
+        self.body = body
+        self.token = token
+        self.requests = requests
+        self.headers = headers or {}
+
+    def build(self, user, data):
+        path = self.path.format(preferences_id=user["preferences_id"], plan_id=user["plan_ids"][0],
+                                plan_ids=','.join(map(str, user["plan_ids"])), feed_token=user["feed_token"],
+                                profile_id=data.get("profile_id"))
+        headers = dict(self.headers)
+        if self.token == 'user':
+            headers['Authorization'] = f'Bearer {user["access"]}'
+        elif self.token == 'staff':
+            headers['Authorization'] = f'Bearer {data["staff"]["access"]}'
+        body = None
+        if self.body is not None:
+            body, headers['Content-Type'] = self.body(user)
+        return path, headers, body
+
+
+class LogoutScenario(Scenario):
+    # Logout отзывает и access token, поэтому у каждого запроса своя пара токенов из сидинга
+    warmup = 0
+
+    def __init__(self, name, path, pairs, **kwargs):
+        super().__init__(name, 'POST', path, token=None, requests=len(pairs), **kwargs)
+        self.pairs = iter(pairs)
+
+    def build(self, user, data):
+        pair = next(self.pairs)
+        headers = {'Authorization': f'Bearer {pair["access"]}', 'Content-Type': 'application/json'}
+        return self.path, headers, json.dumps({"refresh": pair["refresh"]}).encode()
+
+
+def scenarios(data, heavy_requests):
+    users = data["users"]
+    register_ids = itertools.count()
+    image = avatar_bytes()
+    run_id = uuid.uuid4().hex[:6]
+
+    def json_body(value):
+        return lambda user: (json.dumps(value).encode(), 'application/json')
+
+    def register(user):
+        n = next(register_ids)
+        return json_body({"nickname": f"r{run_id}{n}", "email": f"r{run_id}{n}@example.com",
+                          "password": "Passw0rd!", "first_name": "Load", "last_name": "Test"})(user)
+
+    preferences = {"gender": "F", "age": 28, "height": 168, "weight": 60, "goal": "Похудение",
+                   "experience_level": "B", "workout_frequency": 3, "prefer_workout_ex": "Кардио",
+                   "time_of_program": 2}
+
+    return [
+        Scenario('auth.login', 'POST', '/api/v1/auth/login/', token=None, requests=heavy_requests,
+                 body=lambda user: json_body({"nickname": user["nickname"], "password": data["password"]})(user)),
+        Scenario('auth.refresh', 'POST', '/api/v1/auth/refresh/', token=None,
+                 body=lambda user: json_body({"refresh": user["refresh"]})(user)),
+        Scenario('auth.register', 'POST', '/api/v1/auth/register/', expect=(201,), token=None,
+                 requests=heavy_requests, body=register),
+        LogoutScenario('auth.logout', '/api/v1/auth/logout/',
+                       [pair for user in users for pair in user["logout_tokens"]]),
+        Scenario('auth.verify_email', 'POST', '/api/v1/auth/verify-email/', expect=(200, 400),
+                 body=json_body({"code": "000000"})),
+        Scenario('auth.current_user.get', 'GET', '/api/v1/auth/current-user/'),
+        Scenario('auth.current_user.put', 'PUT', '/api/v1/auth/current-user/',
+                 body=json_body({"first_name": "Bench", "last_name": "Updated"})),
+        Scenario('auth.change_password', 'POST', '/api/v1/auth/change-password/', requests=heavy_requests,
+                 body=json_body({"old_password": data["password"], "new_password": data["password"],
+                                 "confirm_password": data["password"]})),
+        Scenario('auth.avatar.get', 'GET', '/api/v1/auth/avatar/', expect=(200, 404)),
+        Scenario('auth.avatar.put', 'PUT', '/api/v1/auth/avatar/', requests=heavy_requests,
+                 body=lambda user: multipart('avatar', 'avatar.png', image, 'image/png')),
+        Scenario('auth.password_reset_form', 'GET', '/api/v1/auth/password-reset/', token=None),
+        Scenario('media.avatar', 'GET', data["avatar_path"], token=None),
+        Scenario('preferences.list', 'GET', '/api/v1/traning/preferences/'),
+        Scenario('preferences.create', 'POST', '/api/v1/traning/preferences/', expect=(201,),
+                 body=json_body(preferences)),
+        Scenario('preferences.detail', 'GET', '/api/v1/traning/preferences/{preferences_id}/info/'),
+        Scenario('preferences.update', 'PUT', '/api/v1/traning/preferences/{preferences_id}/info/',
+                 body=json_body({**preferences, "goal": "Набор мышечной массы"})),
+        Scenario('plan.generate', 'POST', '/api/v1/traning/preferences/{preferences_id}/plan/?force=1',
+                 requests=heavy_requests),
+        Scenario('plan.generate.existing', 'POST', '/api/v1/traning/preferences/{preferences_id}/plan/'),
+        Scenario('plan.list', 'GET', '/api/v1/traning/plan/'),
+        Scenario('plan.batch', 'GET', '/api/v1/traning/plan/?ids={plan_ids}'),
+        Scenario('plan.detail', 'GET', '/api/v1/traning/plan/{plan_id}/info/'),
+        Scenario('plan.calendar', 'GET', '/api/v1/traning/plan/{plan_id}/calendar/'),
+        Scenario('plan.calendar.feed', 'GET', '/api/v1/traning/calendar/{feed_token}.ics', token=None,
+                 headers={'Accept': 'text/calendar'}),
+        Scenario('plan.budget', 'GET', '/api/v1/traning/budget/'),
+        Scenario('workouts.sets', 'POST', '/api/v1/traning/workouts/sets/', expect=(202,),
+                 body=lambda user: json_body({"sets": [{"exercise": exercise_id, "reps": 10, "weight": 40}
+                                                       for exercise_id in user["exercise_ids"]]})(user)),
+        Scenario('workouts.progress', 'GET', '/api/v1/traning/workouts/progress/'),
+        Scenario('exercises.autocomplete', 'GET',
+                 '/api/v1/traning/exercises/autocomplete/?q=' + urllib.parse.quote('жим')),
+        Scenario('plan.by_preferences', 'GET', '/api/v1/traning/preferences/{preferences_id}/plan/'),
+        Scenario('plan.by_preferences.detail', 'GET',
+                 '/api/v1/traning/preferences/{preferences_id}/plan/{plan_id}/info/'),
+        Scenario('schema', 'GET', '/api/v1/schema/', token=None, requests=heavy_requests),
+        Scenario('schema.swagger_ui', 'GET', '/api/v1/schema/swagger-ui/', token=None),
+        Scenario('schema.redoc', 'GET', '/api/v1/schema/redoc/', token=None),
+        Scenario('metrics', 'GET', '/metrics', token=None),
+        Scenario('profiles.list', 'GET', '/api/v1/profiles/', token='staff'),
+        Scenario('profiles.download', 'GET', '/api/v1/profiles/{profile_id}/txt/', token='staff'),
+        Scenario('admin.login', 'GET', '/admin/login/', token=None),
+    ]
+
+
+def run_scenario(base_url, scenario, data, requests, concurrency):
+    users = data["users"]
+    counter = itertools.count()
+    lock = threading.Lock()
+
+    def one(_):
+        with lock:
+            user = users[next(counter) % len(users)]
+            path, headers, body = scenario.build(user, data)
+        request = urllib.request.Request(base_url + path, data=body, headers=headers, method=scenario.method)
+        start = time.perf_counter()
+        try:
+            with urllib.request.urlopen(request, timeout=120) as response:
+                response.read()
+                status = response.status
+        except urllib.error.HTTPError as e:
+            e.read()
+            status = e.code
+        except OSError:
+            status = 0
+        return time.perf_counter() - start, status
+
+    for i in range(scenario.warmup):
+        one(i)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as pool:
+        results = list(pool.map(one, range(requests)))
+    elapsed = time.perf_counter() - start
+
+    latencies = [latency * 1000 for latency, _ in results]
+    errors = sum(1 for _, status in results if status not in scenario.expect)
+    statuses = {}
+    for _, status in results:
+        statuses[str(status)] = statuses.get(str(status), 0) + 1
+    return {
+        "requests": requests,
+        "errors": errors,
+        "statuses": statuses,
+        "throughput_rps": round(requests / elapsed, 2),
+        "p50_ms": round(percentile(latencies, 50), 2),
+        "p95_ms": round(percentile(latencies, 95), 2),
+        "p99_ms": round(percentile(latencies, 99), 2),
+        "max_ms": round(max(latencies), 2),
+    }
+
+
+def compare(results, baseline, tolerance):
+    regressions = []
+    for name, result in results.items():
+        if result["errors"]:
+            regressions.append(f"{name}: {result['errors']} unexpected responses {result['statuses']}")
+        base = baseline.get(name)
+        if not base:
+            continue
+        if result["p95_ms"] > base["p95_ms"] * (1 + tolerance):
+            regressions.append(f"{name}: p95 {result['p95_ms']} ms > baseline {base['p95_ms']} ms")
+        if result["throughput_rps"] < base["throughput_rps"] * (1 - tolerance):
+            regressions.append(f"{name}: {result['throughput_rps']} rps < baseline {base['throughput_rps']} rps")
+    return regressions
+
+
+def capture_profile(base_url, data):
+    # Один профилированный запрос staff, чтобы было что скачивать в profiles.download
+    request = urllib.request.Request(base_url + '/api/v1/traning/plan/', headers={
+        'Authorization': f'Bearer {data["staff"]["access"]}', 'X-Profile': '1'})
+    with urllib.request.urlopen(request, timeout=60) as response:
+        response.read()
+        return response.headers.get('X-Profile-Id')
+
+
+def wait_for_server(url, process, timeout=60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError("Django server exited during startup")
+        try:
+            urllib.request.urlopen(url, timeout=1).read()
+            return
+        except urllib.error.HTTPError:
+            return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError("Django server did not start")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="FitGenie load test")
+    parser.add_argument('--requests', type=int, default=200, help="запросов на сценарий")
+    parser.add_argument('--heavy-requests', type=int, default=40,
+                        help="запросов на сценарий для дорогих операций (хеширование пароля, генерация, схема)")
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--users', type=int, default=20)
+    parser.add_argument('--plans', type=int, default=5)
+    parser.add_argument('--llm-latency', type=float, default=0.5, help="задержка фейкового OpenAI, секунды")
+    parser.add_argument('--only', action='append', help="запустить только сценарии с этим префиксом")
+    parser.add_argument('--tolerance', type=float, default=0.3, help="допустимое ухудшение относительно baseline")
+    parser.add_argument('--baseline', type=Path, default=BASELINE)
+    parser.add_argument('--update-baseline', action='store_true')
+    parser.add_argument('--output', type=Path)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        fake = FakeOpenAIServer(latency=args.llm_latency, jitter=args.llm_latency / 10).start()
+        env = {
+            **os.environ,
+            'DJANGO_SETTINGS_MODULE': 'fit.settings',
+            'PYTHONPATH': str(BASE_DIR),
+            'DB_PROFILE': 'sqlite',
+            'DB_NAME': os.path.join(tmp, 'bench.sqlite3'),
+            'MEDIA_ROOT': os.path.join(tmp, 'media'),
+            'METRICS_DIR': os.path.join(tmp, 'metrics'),
+            'PROFILING_DIR': os.path.join(tmp, 'profiles'),
+            'OPEN_API_KEY': 'bench',
+            'OPENAI_BASE_URL': fake.base_url,
+            'AVATARS_ASYNC': 'False',
+            'REQUEST_LOG_LEVEL': 'WARNING',
+        }
+        subprocess.run([sys.executable, 'manage.py', 'migrate', '--verbosity', '0'], cwd=BASE_DIR, env=env,
+                       check=True)
+        seeded = subprocess.run(
+            [sys.executable, '-m', 'bench.seed', '--users', str(args.users), '--plans', str(args.plans),
+             '--logout-tokens', '5'],
+            cwd=BASE_DIR, env=env, check=True, capture_output=True, text=True,
+        )
+        data = json.loads(seeded.stdout.strip().splitlines()[-1])
+
+        port = free_port()
+        base_url = f'http://127.0.0.1:{port}'
+        with open(os.path.join(tmp, 'server.log'), 'w') as log:
+            server = subprocess.Popen(
+                [sys.executable, 'manage.py', 'runserver', f'127.0.0.1:{port}', '--noreload'],
+                cwd=BASE_DIR, env=env, stdout=log, stderr=subprocess.STDOUT,
+            )
+            try:
+                wait_for_server(base_url + '/admin/login/', server)
+                data["profile_id"] = capture_profile(base_url, data)
+                results = {}
+                for scenario in scenarios(data, args.heavy_requests):
+                    if args.only and not any(scenario.name.startswith(prefix) for prefix in args.only):
+                        continue
+                    requests = scenario.requests or args.requests
+                    results[scenario.name] = run_scenario(base_url, scenario, data, requests, args.concurrency)
+                    print(f"{scenario.name:32} {results[scenario.name]['throughput_rps']:8.1f} rps  "
+                          f"p95 {results[scenario.name]['p95_ms']:8.1f} ms", file=sys.stderr)
+            finally:
+                server.terminate()
+                server.wait(timeout=30)
+                fake.stop()
+
+    baseline = json.loads(args.baseline.read_text())["scenarios"] if args.baseline.exists() else {}
+    report = {
+        "meta": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "concurrency": args.concurrency,
+            "requests": args.requests,
+            "heavy_requests": args.heavy_requests,
+            "llm_latency": args.llm_latency,
+        },
+        "scenarios": results,
+        "regressions": [] if args.update_baseline else compare(results, baseline, args.tolerance),
+    }
+    output = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.output:
+        args.output.write_text(output)
+    print(output)
+    if args.update_baseline:
+        args.baseline.write_text(json.dumps({"meta": report["meta"], "scenarios": results}, indent=2) + '\n')
+    sys.exit(1 if report["regressions"] else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,93 @@
+import io
+import json
+import os
+import sys
+
+import django
+
+# Наполняет базу (DB_NAME из окружения) пользователями с предпочтениями и планами
+# и печатает JSON с токенами и id для bench.run:
+#   python -m bench.seed --users 20 --plans 5
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'fit.settings')
+
+PASSWORD = 'Passw0rd!'
+
+
+def avatar_file():
+    from django.core.files.uploadedfile import SimpleUploadedFile
+    from PIL import Image
+
+    buffer = io.BytesIO()
+    Image.new('RGB', (640, 480), (200, 80, 40)).save(buffer, 'JPEG')
+    return SimpleUploadedFile('avatar.jpg', buffer.getvalue(), content_type='image/jpeg')
+
+
+def seed(users, plans_per_user, logout_tokens):
+    from django.contrib.auth.hashers import make_password
+    from django.db import transaction
+
+    from authUser.avatars import store_avatar
+    from authUser.models import CustomUser
+    from authUser.tokens import ClaimsRefreshToken
+    from bench.fake_openai import CANNED_PLAN
+    from fit.sharding import shard_for_user
+    from plans.calendar_feed import feed_token
+    from plans.models import Exercises, Preferences
+    from plans.services import save_plan
+
+    # Один хеш на всех: PBKDF2 на каждого пользователя занял бы большую часть сидинга
+    password = make_password(PASSWORD)
+    result = {"password": PASSWORD, "users": []}
+    with transaction.atomic():
+        staff = CustomUser.objects.create(nickname='benchstaff', email='benchstaff@example.com',
+                                          password=password, is_staff=True, is_verified=True)
+        for i in range(users):
+            user = CustomUser.objects.create(nickname=f'bench{i}', email=f'bench{i}@example.com',
+                                             password=password, first_name='Bench', last_name=str(i), code=123456)
+            preferences = Preferences.objects.create(
+                id_user=user, gender='M', age=20 + i % 40, height=170 + i % 30, weight=60 + i % 40,
+                goal='Набор мышечной массы', experience_level='M', workout_frequency=3,
+                prefer_workout_ex='Штанга, гантели', time_of_program=3,
+            )
+            plan_ids = [save_plan(CANNED_PLAN, user, preferences).pk for _ in range(plans_per_user)]
+            refresh = ClaimsRefreshToken.for_user(user)
+            result["users"].append({
+                "id": user.pk,
+                "nickname": user.nickname,
+                "access": str(refresh.access_token),
+                "refresh": str(refresh),
+                "preferences_id": preferences.pk,
+                "plan_ids": plan_ids,
+                "feed_token": feed_token(user.pk, plan_ids[0]),
+                "exercise_ids": list(Exercises.objects.using(shard_for_user(user.pk)).filter(
+                    weekly_schedule_id__plan_id=plan_ids[0]).values_list('pk', flat=True)[:3]),
+                "logout_tokens": [
+                    {"access": str(token.access_token), "refresh": str(token)}
+                    for token in (ClaimsRefreshToken.for_user(user) for _ in range(logout_tokens))
+                ],
+            })
+
+    first = CustomUser.objects.get(pk=result["users"][0]["id"])
+    store_avatar(first, avatar_file())
+    first.refresh_from_db()
+    result["avatar_path"] = first.get_avatar_url('medium')
+    result["staff"] = {"id": staff.pk, "access": str(ClaimsRefreshToken.for_user(staff).access_token)}
+    return result
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Seed a benchmark dataset")
+    parser.add_argument('--users', type=int, default=20)
+    parser.add_argument('--plans', type=int, default=5)
+    parser.add_argument('--logout-tokens', type=int, default=10)
+    args = parser.parse_args()
+    django.setup()
+    print(json.dumps(seed(args.users, args.plans, args.logout_tokens)))
+
+
+if __name__ == '__main__':
+    main()
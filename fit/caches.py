@@ -0,0 +1,13 @@
+from django.conf import settings
+
+# Бэкенды, данные которых видны только текущему процессу
+LOCAL_BACKENDS = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
+
+def is_shared_cache(alias='default'):
+    # Общий между воркерами кэш (Redis, Memcached, база): без него инвалидация и счётчики
+    # в кэше действуют только в процессе, который их изменил
+    return settings.CACHES[alias]['BACKEND'] not in LOCAL_BACKENDS
@@ -0,0 +1,89 @@
+from pathlib import Path
+
+from decouple import config
+
+# Профили базы данных, выбираются переменной окружения DB_PROFILE
+
+SQLITE_PRAGMAS = [
+    # WAL: читатели не блокируют писателя и наоборот
+    'PRAGMA journal_mode=WAL',
+    # В режиме WAL NORMAL безопасен и не делает fsync на каждый коммит
+    'PRAGMA synchronous=NORMAL',
+    'PRAGMA mmap_size=268435456',
+    # Отрицательное значение - размер в KiB (64 MiB)
+    'PRAGMA cache_size=-65536',
+    'PRAGMA temp_store=MEMORY',
+]
+
+
+def sqlite_profile(base_dir):
+    return {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': config('DB_NAME', default=str(base_dir / 'db.sqlite3')),
+        'OPTIONS': {
+            # busy timeout в секундах: ждать освобождения блокировки вместо "database is locked"
+            'timeout': config('DB_BUSY_TIMEOUT', default=20, cast=int),
+            # Блокировка на запись берётся в начале транзакции, а не при первом INSERT,
+            # иначе параллельные транзакции падают при повышении блокировки
+            'transaction_mode': 'IMMEDIATE',
+            'init_command': '; '.join(SQLITE_PRAGMAS),
+        },
+    }
+
+
+def postgres_profile(base_dir):
+    return {
+        'ENGINE': 'django.db.backends.postgresql',
+        'NAME': config('DB_NAME', default='fitgenie'),
+        'USER': config('DB_USER', default='fitgenie'),
+        'PASSWORD': config('DB_PASSWORD', default=''),
+        'HOST': config('DB_HOST', default='localhost'),
+        'PORT': config('DB_PORT', default='5432'),
+        # Постоянные соединения с проверкой перед повторным использованием
+        'CONN_MAX_AGE': config('DB_CONN_MAX_AGE', default=600, cast=int),
+        'CONN_HEALTH_CHECKS': True,
+        # QuerySet.iterator() в выгрузках использует server-side курсоры;
+        # за pgbouncer в режиме transaction их нужно отключить
+        'DISABLE_SERVER_SIDE_CURSORS': config('DB_DISABLE_SERVER_SIDE_CURSORS', default=False, cast=bool),
+        'OPTIONS': {
+            'connect_timeout': 5,
+        },
+    }
+
+
+PROFILES = {
+    'sqlite': sqlite_profile,
+    'postgres': postgres_profile,
+}
+
+
+def database_profile(name, base_dir):
+    try:
+        return PROFILES[name](base_dir)
+    except KeyError:
+        raise ValueError(f"Unknown DB_PROFILE {name!r}, expected one of {', '.join(PROFILES)}")
+
+
+def replica_profile(primary, name, host):
+    # Реплика с теми же параметрами, что и primary; миграции на неё не применяются
+    replica = {**primary, 'OPTIONS': dict(primary.get('OPTIONS', {}))}
+    if name:
+        replica['NAME'] = name
+    if host:
+        replica['HOST'] = host
+    replica['TEST'] = {'MIRROR': 'default'}
+    return replica
+
+
+def shard_profile(primary, index, host=''):
+    # Шард планов с параметрами primary: файл <db>_plans_<index>.sqlite3 рядом с основным
+    # или база <name>_plans_<index>, опционально на отдельном хосте
+    shard = {**primary, 'OPTIONS': dict(primary.get('OPTIONS', {}))}
+    name = Path(primary['NAME'])
+    if primary['ENGINE'].endswith('sqlite3'):
+        shard['NAME'] = str(name.with_name(f'{name.stem}_plans_{index}{name.suffix}'))
+    else:
+        shard['NAME'] = f"{primary['NAME']}_plans_{index}"
+    if host:
+        shard['HOST'] = host
+    return shard
@@ -0,0 +1,267 @@
+import atexit
+import fcntl
+import json
+import os
+import threading
+import time
+import uuid
+from bisect import bisect_left
+from pathlib import Path
+
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseForbidden
+from django.utils.crypto import constant_time_compare
+from django.views.decorators.http import require_GET
+
+# Метрики в формате Prometheus без prometheus_client.
+# Каждый процесс копит значения в памяти и не чаще FLUSH_INTERVAL сбрасывает их в свой файл
+# METRICS['DIR']/<pid>-<id>.json; /metrics суммирует файлы всех процессов (воркеров gunicorn).
+# Файлы завершившихся процессов при сборе сливаются в archive.json, чтобы счётчики не обнулялись.
+# Каталог должен быть локальным для хоста (проверка процесса идёт по pid) и очищаться при деплое,
+# как multiprocess-каталог prometheus_client.
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+LLM_BUCKETS = (0.5, 1.0, 2.0, 5.0, 10.0, 20.0, 30.0, 60.0, 120.0)
+
+
+class Metric:
+    type = None
+
+    def __init__(self, registry, name, documentation, labelnames):
+        self.registry = registry
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        registry.metrics[name] = self
+
+    def key(self, labels):
+        return json.dumps([str(labels[label]) for label in self.labelnames])
+
+
+class Counter(Metric):
+    type = 'counter'
+
+    def inc(self, amount=1, **labels):
+        self.registry.record(self, self.key(labels), amount)
+
+
+class Histogram(Metric):
+    type = 'histogram'
+
+    def __init__(self, registry, name, documentation, labelnames, buckets=DEFAULT_BUCKETS):
+        super().__init__(registry, name, documentation, labelnames)
+        self.buckets = buckets
+
+    def observe(self, value, **labels):
+        self.registry.record(self, self.key(labels), value)
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = {}
+        self._values = {}
+        self._lock = threading.Lock()
+        self._flushed_at = 0.0
+        self._pid = None
+        self._path = None
+
+    def counter(self, name, documentation, labelnames=()):
+        return Counter(self, name, documentation, labelnames)
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return Histogram(self, name, documentation, labelnames, buckets)
+
+    def _check_process(self):
+        # После fork значения родителя уже учтены в его файле, у дочернего процесса свой файл
+        if self._pid != os.getpid():
+            if self._pid is not None:
+                self._values = {}
+            self._pid = os.getpid()
+            self._path = Path(settings.METRICS['DIR']) / f'{self._pid}-{uuid.uuid4().hex[:8]}.json'
+
+    def record(self, metric, key, value):
+        if not settings.METRICS['ENABLED']:
+            return
+        with self._lock:
+            self._check_process()
+            series = self._values.setdefault(metric.name, {})
+            if metric.type == 'counter':
+                series[key] = series.get(key, 0) + value
+            else:
+                # Счётчики по корзинам (не накопительные), сумма и число наблюдений
+                state = series.get(key)
+                if state is None:
+                    state = series[key] = [[0] * (len(metric.buckets) + 1), 0.0, 0]
+                state[0][bisect_left(metric.buckets, value)] += 1
+                state[1] += value
+                state[2] += 1
+        if time.monotonic() - self._flushed_at >= settings.METRICS['FLUSH_INTERVAL']:
+            self.flush()
+
+    def flush(self):
+        if not settings.METRICS['ENABLED']:
+            return
+        with self._lock:
+            self._check_process()
+            self._flushed_at = time.monotonic()
+            # Процессы без метрик (manage.py, тесты) файлов не оставляют
+            if not self._values:
+                return
+            self._path.parent.mkdir(parents=True, exist_ok=True)
+            tmp = self._path.with_suffix('.tmp')
+            tmp.write_text(json.dumps(self._values))
+            os.replace(tmp, self._path)
+
+    def collect(self):
+        self.flush()
+        directory = Path(settings.METRICS['DIR'])
+        if directory.is_dir():
+            self.compact(directory)
+        merged = {}
+        for path in directory.glob('*.json'):
+            data = read_values(path)
+            if data is not None:
+                merge_values(self.metrics, merged, data)
+        return merged
+
+    def compact(self, directory):
+        dead = [path for path in directory.glob('*-*.json') if not process_alive(path.name.split('-')[0])]
+        if not dead:
+            return
+        # Несколько воркеров могут собирать метрики одновременно - архив обновляет один
+        with open(directory / 'archive.lock', 'w') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            archive = directory / 'archive.json'
+            merged = read_values(archive) or {}
+            dead = [path for path in dead if path.exists()]
+            for path in dead:
+                data = read_values(path)
+                if data is not None:
+                    merge_values(self.metrics, merged, data)
+            tmp = archive.with_suffix('.tmp')
+            tmp.write_text(json.dumps(merged))
+            os.replace(tmp, archive)
+            for path in dead:
+                path.unlink(missing_ok=True)
+
+    def render(self):
+        merged = self.collect()
+        lines = []
+        for name, metric in self.metrics.items():
+            lines.append(f'# HELP {name} {metric.documentation}')
+            lines.append(f'# TYPE {name} {metric.type}')
+            for key, value in sorted(merged.get(name, {}).items()):
+                labels = list(zip(metric.labelnames, json.loads(key)))
+                if metric.type == 'counter':
+                    lines.append(f'{name}{format_labels(labels)} {format_value(value)}')
+                    continue
+                counts, total, count = value
+                cumulative = 0
+                for bound, bucket_count in zip(metric.buckets + (float('inf'),), counts):
+                    cumulative += bucket_count
+                    le = '+Inf' if bound == float('inf') else format_value(bound)
+                    lines.append(f'{name}_bucket{format_labels(labels + [("le", le)])} {cumulative}')
+                lines.append(f'{name}_sum{format_labels(labels)} {format_value(total)}')
+                lines.append(f'{name}_count{format_labels(labels)} {count}')
+        return '\n'.join(lines) + '\n'
+
+
+def read_values(path):
+    try:
+        return json.loads(path.read_text())
+    except (OSError, ValueError):
+        return None
+
+
+def merge_values(metrics, merged, data):
+    for name, series in data.items():
+        metric = metrics.get(name)
+        if metric is None:
+            continue
+        target = merged.setdefault(name, {})
+        for key, value in series.items():
+            if metric.type == 'counter':
+                target[key] = target.get(key, 0) + value
+            elif key not in target:
+                target[key] = [list(value[0]), value[1], value[2]]
+            else:
+                state = target[key]
+                state[0] = [a + b for a, b in zip(state[0], value[0])]
+                state[1] += value[1]
+                state[2] += value[2]
+
+
+def process_alive(pid):
+    if not pid.isdigit():
+        return True
+    if int(pid) == os.getpid():
+        return True
+    try:
+        os.kill(int(pid), 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def format_labels(labels):
+    if not labels:
+        return ''
+    escaped = (str(value).replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n') for _, value in labels)
+    return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(labels, escaped)) + '}'
+
+
+def format_value(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+registry = Registry()
+atexit.register(registry.flush)
+
+request_duration = registry.histogram(
+    'http_request_duration_seconds', 'Время обработки запроса', ('view', 'method'))
+requests_total = registry.counter(
+    'http_requests_total', 'Число запросов по статусам', ('view', 'method', 'status'))
+request_db_duration = registry.histogram(
+    'http_request_db_seconds', 'Время запросов к БД за один HTTP-запрос', ('view',))
+llm_duration = registry.histogram(
+    'llm_request_duration_seconds', 'Длительность запросов к LLM', ('model', 'outcome'), LLM_BUCKETS)
+llm_tokens = registry.counter(
+    'llm_tokens_total', 'Токены LLM', ('model', 'kind'))
+llm_errors = registry.counter(
+    'llm_errors_total', 'Ошибки запросов к LLM', ('model', 'error'))
+user_cache_lookups = registry.counter(
+    'auth_user_cache_lookups_total', 'Обращения к кэшу пользователей', ('result',))
+plan_template_lookups = registry.counter(
+    'plan_template_lookups_total', 'Поиск готового шаблона плана при генерации', ('result',))
+
+
+class MetricsMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not settings.METRICS['ENABLED']:
+            return self.get_response(request)
+        start = time.perf_counter()
+        response = self.get_response(request)
+        duration = time.perf_counter() - start
+
+        match = request.resolver_match
+        view = (match.view_name or match._func_path) if match else 'unresolved'
+        request_duration.observe(duration, view=view, method=request.method)
+        requests_total.inc(view=view, method=request.method, status=response.status_code)
+        # Время в БД считает fit.querylog.QueryInstrumentationMiddleware
+        stats = getattr(request, 'query_stats', None)
+        if stats is not None:
+            request_db_duration.observe(stats.total, view=view)
+        return response
+
+
+@require_GET
+def metrics_view(request):
+    token = settings.METRICS['TOKEN']
+    if token and not constant_time_compare(request.headers.get('Authorization', ''), f'Bearer {token}'):
+        return HttpResponseForbidden()
+    return HttpResponse(registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
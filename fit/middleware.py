@@ -0,0 +1,58 @@
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+
+class RouteScopedMiddleware:
+    # Сессии, CSRF, auth, messages и clickjacking нужны только админке и HTML-страницам
+    # (FULL_STACK_PATHS). Для них запрос проходит через цепочку FULL_STACK_MIDDLEWARE,
+    # остальные (JWT API) идут сразу дальше. process_view/process_exception/process_template_response
+    # вложенных middleware Django не вызывает сам, поэтому они проксируются отсюда.
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.paths = tuple(settings.FULL_STACK_PATHS)
+        self.view_hooks = []
+        self.exception_hooks = []
+        self.template_response_hooks = []
+
+        handler = get_response
+        for path in reversed(settings.FULL_STACK_MIDDLEWARE):
+            middleware = import_string(path)(handler)
+            if hasattr(middleware, 'process_view'):
+                self.view_hooks.insert(0, middleware.process_view)
+            if hasattr(middleware, 'process_exception'):
+                self.exception_hooks.append(middleware.process_exception)
+            if hasattr(middleware, 'process_template_response'):
+                self.template_response_hooks.append(middleware.process_template_response)
+            handler = middleware
+        self.full_stack = handler
+
+    def is_full_stack(self, request):
+        return request.path_info.startswith(self.paths)
+
+    def __call__(self, request):
+        if self.is_full_stack(request):
+            return self.full_stack(request)
+        return self.get_response(request)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if self.is_full_stack(request):
+            for hook in self.view_hooks:
+                response = hook(request, view_func, view_args, view_kwargs)
+                if response is not None:
+                    return response
+        return None
+
+    def process_exception(self, request, exception):
+        if self.is_full_stack(request):
+            for hook in self.exception_hooks:
+                response = hook(request, exception)
+                if response is not None:
+                    return response
+        return None
+
+    def process_template_response(self, request, response):
+        if self.is_full_stack(request):
+            for hook in self.template_response_hooks:
+                response = hook(request, response)
+        return response
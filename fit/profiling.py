@@ -0,0 +1,153 @@
+import cProfile
+import io
+import pstats
+import re
+import secrets
+import threading
+import time
+import tracemalloc
+from pathlib import Path
+
+from django.conf import settings
+from django.http import FileResponse, Http404
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework.permissions import IsAdminUser
+from rest_framework.response import Response
+from rest_framework.views import APIView
+from rest_framework_simplejwt.settings import api_settings
+
+PROFILE_ID = re.compile(r'^\d{8}T\d{6}-[0-9a-f]{8}$')
+# Расширения файлов одного профиля: cProfile, снимок tracemalloc и текстовая сводка
+KINDS = {'prof': '.prof', 'mem': '.tracemalloc', 'txt': '.txt'}
+
+# cProfile нельзя запускать в нескольких потоках одновременно - профилируется один запрос за раз
+_profile_lock = threading.Lock()
+
+
+def profile_dir():
+    return Path(settings.PROFILING['DIR'])
+
+
+def authenticated_user_id(request):
+    # Токен проверяется так же, как в аутентификации DRF: только AUTH_TOKEN_CLASSES, с учётом отзыва
+    from authUser.authentication import CachedJWTAuthentication
+
+    authentication = CachedJWTAuthentication()
+    header = authentication.get_header(request)
+    raw_token = authentication.get_raw_token(header) if header is not None else None
+    if raw_token is None:
+        return None
+    try:
+        return authentication.get_validated_token(raw_token).get(api_settings.USER_ID_CLAIM)
+    except AuthenticationFailed:
+        return None
+
+
+def is_staff_request(request):
+    # Сессия (админка) или JWT; в БД идём только для запросов с флагом профилирования
+    from authUser.authentication import user_cache
+    from authUser.models import CustomUser
+
+    # request.user есть только на маршрутах с полным стеком middleware (админка)
+    session_user = getattr(request, 'user', None)
+    if session_user is not None and session_user.is_authenticated:
+        return session_user.is_staff
+    user_id = authenticated_user_id(request)
+    if user_id is None:
+        return False
+    user = user_cache.get(user_id) or CustomUser.objects.filter(pk=user_id).first()
+    return bool(user and user.is_active and user.is_staff)
+
+
+def enforce_retention(directory, max_profiles):
+    profiles = sorted({path.stem for path in directory.glob('*.prof')}, reverse=True)
+    for profile_id in profiles[max_profiles:]:
+        for suffix in KINDS.values():
+            (directory / f'{profile_id}{suffix}').unlink(missing_ok=True)
+
+
+def write_summary(path, request, duration, profiler, snapshot):
+    out = io.StringIO()
+    out.write(f'{request.method} {request.get_full_path()}\n{duration * 1000:.1f} ms\n\n')
+    pstats.Stats(profiler, stream=out).sort_stats('cumulative').print_stats(40)
+    out.write('\nTop allocations:\n')
+    for stat in snapshot.statistics('lineno')[:20]:
+        out.write(f'{stat}\n')
+    path.write_text(out.getvalue())
+
+
+class ProfilingMiddleware:
+    # Профилирование одного запроса по заголовку X-Profile: 1 или параметру ?_profile=1, только для staff.
+    # Результат - файлы в PROFILING['DIR'], id профиля возвращается в заголовке X-Profile-Id.
+    # Запросы без флага проходят без изменений.
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not (request.headers.get('X-Profile') == '1' or request.GET.get('_profile') == '1'):
+            return self.get_response(request)
+        if not settings.PROFILING['ENABLED'] or not is_staff_request(request):
+            return self.get_response(request)
+        if not _profile_lock.acquire(blocking=False):
+            response = self.get_response(request)
+            response['X-Profile-Skipped'] = 'busy'
+            return response
+        try:
+            return self.profile(request)
+        finally:
+            _profile_lock.release()
+
+    def profile(self, request):
+        started_tracing = not tracemalloc.is_tracing()
+        if started_tracing:
+            tracemalloc.start(settings.PROFILING['TRACEMALLOC_FRAMES'])
+        profiler = cProfile.Profile()
+        start = time.perf_counter()
+        try:
+            profiler.enable()
+            try:
+                response = self.get_response(request)
+            finally:
+                profiler.disable()
+            duration = time.perf_counter() - start
+            snapshot = tracemalloc.take_snapshot()
+        finally:
+            if started_tracing:
+                tracemalloc.stop()
+
+        directory = profile_dir()
+        directory.mkdir(parents=True, exist_ok=True)
+        profile_id = f"{time.strftime('%Y%m%dT%H%M%S', time.gmtime())}-{secrets.token_hex(4)}"
+        profiler.dump_stats(directory / f'{profile_id}.prof')
+        snapshot.dump(str(directory / f'{profile_id}.tracemalloc'))
+        write_summary(directory / f'{profile_id}.txt', request, duration, profiler, snapshot)
+        enforce_retention(directory, settings.PROFILING['MAX_PROFILES'])
+
+        response['X-Profile-Id'] = profile_id
+        return response
+
+
+class ProfileListView(APIView):
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        directory = profile_dir()
+        profiles = sorted({path.stem for path in directory.glob('*.prof')}, reverse=True) if directory.is_dir() else []
+        return Response([
+            {"id": profile_id, "files": [kind for kind, suffix in KINDS.items()
+                                         if (directory / f'{profile_id}{suffix}').exists()]}
+            for profile_id in profiles
+        ])
+
+
+class ProfileDownloadView(APIView):
+    permission_classes = [IsAdminUser]
+
+    def get(self, request, profile_id, kind):
+        if not PROFILE_ID.match(profile_id) or kind not in KINDS:
+            raise Http404("Профиль не найден")
+        path = profile_dir() / f'{profile_id}{KINDS[kind]}'
+        if not path.is_file():
+            raise Http404("Профиль не найден")
+        return FileResponse(open(path, 'rb'), as_attachment=True, filename=path.name)
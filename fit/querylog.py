@@ -0,0 +1,93 @@
+import heapq
+import json
+import logging
+import random
+import time
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+
+request_logger = logging.getLogger('fit.requests')
+slow_query_logger = logging.getLogger('fit.slow_queries')
+
+
+class QueryStats:
+    # Обёртка connection.execute_wrapper: считает запросы и время, хранит top_n самых медленных
+
+    def __init__(self, top_n, slow_ms, sample_rate, path):
+        self.top_n = top_n
+        self.slow_ms = slow_ms
+        self.sample_rate = sample_rate
+        self.path = path
+        self.count = 0
+        self.total = 0.0
+        self.slowest = []
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            duration = time.perf_counter() - start
+            self.count += 1
+            self.total += duration
+            item = (duration, sql, context['connection'].alias)
+            if len(self.slowest) < self.top_n:
+                heapq.heappush(self.slowest, item)
+            elif duration > self.slowest[0][0]:
+                heapq.heapreplace(self.slowest, item)
+            if duration * 1000 >= self.slow_ms and random.random() < self.sample_rate:
+                slow_query_logger.warning(json.dumps({
+                    'path': self.path,
+                    'db': item[2],
+                    'duration_ms': round(duration * 1000, 2),
+                    'sql': sql[:2000],
+                }))
+
+
+class QueryInstrumentationMiddleware:
+    # Одна структурированная строка лога на запрос (число запросов, время в БД, самые медленные),
+    # заголовок Server-Timing и выборочный лог медленных запросов.
+    # При QUERY_INSTRUMENTATION['ENABLED'] = False middleware не подключается вовсе.
+
+    def __init__(self, get_response):
+        self.options = settings.QUERY_INSTRUMENTATION
+        if not self.options['ENABLED']:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        stats = QueryStats(
+            self.options['TOP_N'], self.options['SLOW_QUERY_MS'], self.options['SLOW_QUERY_SAMPLE_RATE'],
+            request.path,
+        )
+        request.query_stats = stats
+        start = time.perf_counter()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(stats))
+            response = self.get_response(request)
+        duration = time.perf_counter() - start
+
+        db_ms = stats.total * 1000
+        if self.options['SERVER_TIMING']:
+            timing = f'db;dur={db_ms:.1f};desc="{stats.count} queries", app;dur={duration * 1000:.1f}'
+            if response.has_header('Server-Timing'):
+                timing = f"{response['Server-Timing']}, {timing}"
+            response['Server-Timing'] = timing
+
+        request_logger.info(json.dumps({
+            'method': request.method,
+            'path': request.path,
+            'status': response.status_code,
+            'duration_ms': round(duration * 1000, 2),
+            'db_queries': stats.count,
+            'db_ms': round(db_ms, 2),
+            'slowest': [
+                {'db': alias, 'duration_ms': round(took * 1000, 2), 'sql': sql[:300]}
+                for took, sql, alias in sorted(stats.slowest, reverse=True)
+            ],
+        }))
+        return response
@@ -0,0 +1,91 @@
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.checks import Error
+from rest_framework_simplejwt.exceptions import TokenBackendError
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.state import token_backend
+
+from fit.caches import is_shared_cache
+
+# Алиас базы для чтения в текущем запросе; None - читать с primary
+read_alias = ContextVar('read_alias', default=None)
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+PIN_KEY = 'db:pin:{}'
+
+
+def pin_to_primary(user_id):
+    cache.set(PIN_KEY.format(user_id), 1, settings.READ_REPLICA['PIN_SECONDS'])
+
+
+def is_pinned(user_id):
+    return cache.get(PIN_KEY.format(user_id)) is not None
+
+
+def check_replica_cache(app_configs=None, **kwargs):
+    # Закрепление за primary хранится в кэше: с кэшем в памяти процесса запись на одном воркере
+    # не закрепляет чтения на другом, и клиент читает с реплики устаревшие данные
+    if settings.READ_REPLICA['ALIAS'] and not is_shared_cache():
+        return [Error(
+            "READ_REPLICA требует общий кэш",
+            hint="Задайте REDIS_URL: закрепление чтений за primary после записи хранится в кэше.",
+            id='fit.E001',
+        )]
+    return []
+
+
+def token_user_id(request):
+    # id пользователя из JWT без обращения к БД; аутентификация DRF всё равно проверит токен
+    header = request.headers.get('Authorization', '').split()
+    if len(header) != 2 or header[0] not in api_settings.AUTH_HEADER_TYPES:
+        return None
+    try:
+        return token_backend.decode(header[1]).get(api_settings.USER_ID_CLAIM)
+    except TokenBackendError:
+        return None
+
+
+class ReplicaRouter:
+    # Чтения моделей из READ_REPLICA['APPS'] уходят на реплику, если запрос это разрешил
+    # (ReplicaRoutingMiddleware). Все записи и миграции - только на primary.
+
+    def db_for_read(self, model, **hints):
+        alias = read_alias.get()
+        if alias and model._meta.app_label in settings.READ_REPLICA['APPS']:
+            return alias
+        return None
+
+    def db_for_write(self, model, **hints):
+        # После записи в запросе дальнейшие чтения тоже идут на primary
+        read_alias.set(None)
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == 'default'
+
+
+class ReplicaRoutingMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        alias = settings.READ_REPLICA['ALIAS']
+        if not alias:
+            return self.get_response(request)
+
+        user_id = token_user_id(request)
+        safe = request.method in SAFE_METHODS
+        token = read_alias.set(alias if safe and not (user_id and is_pinned(user_id)) else None)
+        try:
+            response = self.get_response(request)
+        finally:
+            read_alias.reset(token)
+
+        if not safe and user_id and response.status_code < 400:
+            pin_to_primary(user_id)
+        return response
@@ -0,0 +1,177 @@
+import functools
+import gzip
+import hashlib
+import os
+import threading
+from importlib import import_module
+from pathlib import Path
+
+import drf_spectacular
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseNotModified
+from django.utils.cache import patch_vary_headers
+from django.utils.http import parse_etags
+from drf_spectacular.renderers import OpenApiJsonRenderer, OpenApiYamlRenderer
+from drf_spectacular.settings import spectacular_settings
+from drf_spectacular.types import OpenApiTypes
+from drf_spectacular.utils import OpenApiParameter, OpenApiExample, extend_schema
+from drf_spectacular.views import SpectacularAPIView
+
+# Описания OpenAPI (extend_schema) вынесены из views в модули SCHEMA_MODULES. Модуль импортируется
+# и его apply() вешает описания на методы view только при первой генерации схемы,
+# так что импорт views (старт воркера, manage.py) их не строит.
+
+_applied = False
+_lock = threading.Lock()
+
+
+def apply_view_schemas(endpoints):
+    # PREPROCESSING_HOOK drf-spectacular: вызывается до создания view, endpoints не меняет
+    global _applied
+    if not _applied:
+        with _lock:
+            if not _applied:
+                for module in settings.SCHEMA_MODULES:
+                    import_module(module).apply()
+                _applied = True
+    return endpoints
+
+
+def apply():
+    from .profiling import ProfileDownloadView, ProfileListView
+
+    auth_parameter = OpenApiParameter(
+        name="Authorization",
+        description="Bearer access token для аутентификации",
+        required=True,
+        type=OpenApiTypes.STR,
+        location=OpenApiParameter.HEADER,
+        examples=[
+            OpenApiExample(
+                "Пример токена",
+                summary="Bearer Token",
+                value="eyJhbGciOiJIUzI1NiIsInR5..."
+            )
+        ]
+    )
+
+    extend_schema(
+        summary="Список сохранённых профилей запросов",
+        description="Только для staff. Профили создаются запросами с заголовком X-Profile: 1 или параметром ?_profile=1.",
+        parameters=[auth_parameter],
+        responses={
+            200: OpenApiExample(
+                "Успешный ответ",
+                value=[{"id": "20250101T120000-1a2b3c4d", "files": ["prof", "mem", "txt"]}]
+            )
+        },
+        tags=["profiling"]
+    )(ProfileListView.get)
+
+    extend_schema(
+        summary="Скачивание файла профиля",
+        description="kind: prof (cProfile, открывается pstats/snakeviz), mem (снимок tracemalloc), txt (сводка).",
+        parameters=[auth_parameter],
+        responses={200: OpenApiTypes.BINARY, 404: OpenApiTypes.OBJECT},
+        tags=["profiling"]
+    )(ProfileDownloadView.get)
+
+    # Параметр lang у готовой схемы не поддерживается
+    extend_schema(responses={200: OpenApiTypes.OBJECT})(CachedSchemaView.get)
+
+
+# Готовая схема: генерируется один раз на версию кода (при деплое командой build_schema
+# или при первом запросе), хранится в памяти и на диске в SCHEMA_CACHE['DIR'] вместе с gzip-версиями.
+
+SCHEMA_FORMATS = {'yaml': OpenApiYamlRenderer, 'json': OpenApiJsonRenderer}
+SCHEMA_SOURCE_DIRS = ('authUser', 'plans', 'fit')
+
+_documents = {}
+_documents_lock = threading.Lock()
+
+
+class SchemaDocument:
+    def __init__(self, body, gzipped):
+        self.body = body
+        self.gzipped = gzipped
+        self.etag = '"' + hashlib.sha256(body).hexdigest()[:32] + '"'
+
+
+def code_version():
+    # CODE_VERSION (например, git sha из CI) или отпечаток исходников, от которых зависит схема
+    return settings.SCHEMA_CACHE['CODE_VERSION'] or source_fingerprint()
+
+
+@functools.cache
+def source_fingerprint():
+    # Считается один раз на процесс: код меняется только вместе с перезапуском
+    digest = hashlib.sha256(f'{drf_spectacular.__version__}:{settings.SPECTACULAR_SETTINGS!r}'.encode())
+    base_dir = Path(settings.BASE_DIR)
+    for directory in SCHEMA_SOURCE_DIRS:
+        for path in sorted((base_dir / directory).rglob('*.py')):
+            stat = path.stat()
+            digest.update(f'{path.relative_to(base_dir)}:{stat.st_mtime_ns}:{stat.st_size};'.encode())
+    return digest.hexdigest()[:16]
+
+
+def schema_path(version, fmt):
+    return Path(settings.SCHEMA_CACHE['DIR']) / f'schema-{version}.{fmt}'
+
+
+def build_schema_files(version):
+    generator = spectacular_settings.DEFAULT_GENERATOR_CLASS()
+    schema = generator.get_schema(request=None, public=spectacular_settings.SERVE_PUBLIC)
+    directory = Path(settings.SCHEMA_CACHE['DIR'])
+    directory.mkdir(parents=True, exist_ok=True)
+    for fmt, renderer in SCHEMA_FORMATS.items():
+        body = renderer().render(schema, renderer.media_type, {})
+        for path, data in ((schema_path(version, fmt), body),
+                           (schema_path(version, fmt + '.gz'), gzip.compress(body, 9, mtime=0))):
+            tmp = path.with_name(f'{path.name}.{os.getpid()}.tmp')
+            tmp.write_bytes(data)
+            os.replace(tmp, path)
+    # Схемы прошлых версий больше не нужны
+    for path in directory.glob('schema-*'):
+        if not path.name.startswith(f'schema-{version}.'):
+            path.unlink(missing_ok=True)
+
+
+def get_schema_document(fmt):
+    version = code_version()
+    document = _documents.get((version, fmt))
+    if document is not None:
+        return document
+    # Генерация под блокировкой: drf-spectacular не потокобезопасен при первой генерации
+    with _documents_lock:
+        document = _documents.get((version, fmt))
+        if document is None:
+            if not schema_path(version, fmt).exists():
+                build_schema_files(version)
+            for name in SCHEMA_FORMATS:
+                _documents[version, name] = SchemaDocument(
+                    schema_path(version, name).read_bytes(), schema_path(version, name + '.gz').read_bytes()
+                )
+            document = _documents[version, fmt]
+    return document
+
+
+class CachedSchemaView(SpectacularAPIView):
+    # SpectacularAPIView, который отдаёт готовую схему с ETag и gzip вместо генерации на каждый запрос
+
+    def get(self, request, *args, **kwargs):
+        renderer, media_type = self.perform_content_negotiation(request)
+        document = get_schema_document(renderer.format)
+
+        if document.etag in parse_etags(request.headers.get('If-None-Match', '')):
+            response = HttpResponseNotModified()
+        elif 'gzip' in request.headers.get('Accept-Encoding', ''):
+            response = HttpResponse(document.gzipped, content_type=media_type)
+            response['Content-Encoding'] = 'gzip'
+        else:
+            response = HttpResponse(document.body, content_type=media_type)
+        response['ETag'] = document.etag
+        response['Cache-Control'] = 'no-cache'
+        patch_vary_headers(response, ('Accept', 'Accept-Encoding'))
+        if response.status_code == 200:
+            response['Content-Disposition'] = f'inline; filename="schema.{renderer.format}"'
+        return response
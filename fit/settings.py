@@ -11,9 +11,11 @@ https://docs.djangoproject.com/en/5.1/ref/settings/
 """
 from datetime import timedelta
 from pathlib import Path
-from decouple import config
+from decouple import Csv, config
 import os
 
+from .databases import database_profile, replica_profile, shard_profile
+
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -50,7 +52,8 @@ INSTALLED_APPS = [
 # EMAIL_FILE_PATH = '/tmp/app-emails'
 # EMAIL_BACKEND = 'django.core.mail.backends.console.EmailBackend'
 
-EMAIL_BACKEND = 'django.core.mail.backends.smtp.EmailBackend'
+# Все письма пишутся в outbox (authUser.OutgoingEmail), отправляет их manage.py send_outbox
+EMAIL_BACKEND = 'authUser.mail.OutboxEmailBackend'
 EMAIL_HOST = 'smtp.yandex.ru'
 EMAIL_PORT = 465
 EMAIL_USE_SSL = True
@@ -59,18 +62,45 @@ EMAIL_HOST_USER = 'test01324@yandex.com'
 EMAIL_HOST_PASSWORD = 'oqyciacciawpqkqf'
 DEFAULT_FROM_EMAIL = EMAIL_HOST_USER
 
+OUTBOX = {
+    'DELIVERY_BACKEND': config('OUTBOX_DELIVERY_BACKEND', default='django.core.mail.backends.smtp.EmailBackend'),
+    'BATCH_SIZE': 50,
+    'MAX_ATTEMPTS': 5,
+    'RETRY_DELAY': 60,  # секунды, удваивается с каждой попыткой
+    'LEASE': 300,
+}
+
 
 MIDDLEWARE = [
+    'fit.metrics.MetricsMiddleware',
+    'fit.querylog.QueryInstrumentationMiddleware',
     'django.middleware.security.SecurityMiddleware',
-    'django.contrib.sessions.middleware.SessionMiddleware',
+    'corsheaders.middleware.CorsMiddleware',
     'django.middleware.common.CommonMiddleware',
+    'fit.middleware.RouteScopedMiddleware',
+    'fit.profiling.ProfilingMiddleware',
+    'fit.routers.ReplicaRoutingMiddleware',
+    'authUser.idempotency.IdempotencyMiddleware',
+]
+
+# Полный стек только для админки и HTML-страниц; JWT API обходится без сессий и CSRF (fit.middleware)
+FULL_STACK_PATHS = [
+    '/admin/',
+    '/api/v1/auth/password-reset/',
+    '/api/v1/auth/reset/',
+    '/api/v1/schema/swagger-ui/',
+    '/api/v1/schema/redoc/',
+]
+FULL_STACK_MIDDLEWARE = [
+    'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
-    'corsheaders.middleware.CorsMiddleware',
-    'django.middleware.common.CommonMiddleware',
 ]
+# Session/Auth/Message middleware подключены через RouteScopedMiddleware, проверки админки их не видят
+SILENCED_SYSTEM_CHECKS = ['admin.E408', 'admin.E409', 'admin.E410']
+
 CORS_ALLOWED_ORIGINS = [
     "http://localhost:3000",
     "http://127.0.0.1:3000",
@@ -108,7 +138,7 @@ REST_FRAMEWORK = {
     ],
 
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework_simplejwt.authentication.JWTAuthentication',  # Для использования JWT
+        'authUser.authentication.CachedJWTAuthentication',  # JWT, пользователь из кэша
     ],
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticated',  # Требуется аутентификация для всех запросов
@@ -116,6 +146,20 @@ REST_FRAMEWORK = {
     'DEFAULT_SCHEMA_CLASS': 'drf_spectacular.openapi.AutoSchema',
 }
 
+# Описания OpenAPI из этих модулей применяются только при генерации схемы (fit.schema)
+SCHEMA_MODULES = ['authUser.schema', 'plans.schema', 'fit.schema']
+
+SPECTACULAR_SETTINGS = {
+    'PREPROCESSING_HOOKS': ['fit.schema.apply_view_schemas'],
+}
+
+# Готовая схема OpenAPI (fit.schema.CachedSchemaView, manage.py build_schema).
+# Пересобирается при смене CODE_VERSION или, если она не задана, исходников приложений.
+SCHEMA_CACHE = {
+    'DIR': config('SCHEMA_CACHE_DIR', default=str(BASE_DIR / 'schema_cache')),
+    'CODE_VERSION': config('CODE_VERSION', default=''),
+}
+
 SIMPLE_JWT = {
     'ACCESS_TOKEN_LIFETIME': timedelta(days=7),
     'REFRESH_TOKEN_LIFETIME': timedelta(days=30),
@@ -124,10 +168,58 @@ SIMPLE_JWT = {
     'ALGORITHM': 'HS256',
     'SIGNING_KEY': SECRET_KEY,
     'AUTH_HEADER_TYPES': ('Bearer',),
+    'TOKEN_OBTAIN_SERIALIZER': 'authUser.serializers.ClaimsTokenObtainPairSerializer',
+    'TOKEN_REFRESH_SERIALIZER': 'authUser.serializers.RevocableTokenRefreshSerializer',
+    'AUTH_TOKEN_CLASSES': ('authUser.tokens.RevocableAccessToken',),
+}
+
+# Отзыв токенов по jti (authUser.revocation)
+TOKEN_REVOCATION = {
+    'CAPACITY': 100000,
+    'ERROR_RATE': 0.001,
+    'SYNC_INTERVAL': 1,  # как часто проверять версию в общем кэше, секунды
+    'MAX_STALENESS': 30,  # как часто перечитывать таблицу без сигнала из кэша
+    'DB_PRUNE_INTERVAL': 3600,
+}
+
+# Заголовок Idempotency-Key для дорогих POST (authUser.idempotency)
+IDEMPOTENCY = {
+    'TTL': 24 * 3600,  # сколько хранится ответ, секунды
+    'WAIT_TIMEOUT': 60,  # сколько параллельный дубль ждёт первый запрос (генерация плана - до минуты)
+    'POLL_INTERVAL': 0.2,
+    'LOCK_TIMEOUT': 300,  # незавершённый запрос старше этого считается упавшим
+    'HASH_BODY_LIMIT': 1024 * 1024,
+    'SWEEP_INTERVAL': 600,
+}
+
+# Общий кэш: Redis, если задан REDIS_URL, иначе память процесса
+REDIS_URL = config('REDIS_URL', default='')
+
+if REDIS_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': REDIS_URL,
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+
+# Кэш пользователей для CachedJWTAuthentication (секунды)
+AUTH_USER_CACHE = {
+    'LOCAL_TTL': config('AUTH_USER_CACHE_LOCAL_TTL', default=5, cast=int),
+    'SHARED_TTL': config('AUTH_USER_CACHE_SHARED_TTL', default=300, cast=int),
+    'LOCAL_MAX_SIZE': 10000,
 }
 
 
 OPENAI_API_KEY = config('OPEN_API_KEY')
+# Другой OpenAI-совместимый сервер, например bench/fake_openai.py для нагрузочных тестов
+OPENAI_BASE_URL = config('OPENAI_BASE_URL', default='') or None
 
 
 WSGI_APPLICATION = 'fit.wsgi.application'
@@ -136,11 +228,46 @@ WSGI_APPLICATION = 'fit.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.1/ref/settings/#databases
 
+# DB_PROFILE=sqlite (WAL и настроенные pragma) или postgres (постоянные соединения), см. fit/databases.py
+DB_PROFILE = config('DB_PROFILE', default='sqlite')
+
 DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
-    }
+    'default': database_profile(DB_PROFILE, BASE_DIR),
+}
+
+# Реплика для чтения: DB_REPLICA_NAME (файл SQLite или имя базы) и/или DB_REPLICA_HOST
+DB_REPLICA_NAME = config('DB_REPLICA_NAME', default='')
+DB_REPLICA_HOST = config('DB_REPLICA_HOST', default='')
+
+if DB_REPLICA_NAME or DB_REPLICA_HOST:
+    DATABASES['replica'] = replica_profile(DATABASES['default'], DB_REPLICA_NAME, DB_REPLICA_HOST)
+
+# Шардирование планов по хешу id пользователя (fit/sharding.py): PLAN_SHARDS=3 - default, plans_1 и plans_2.
+# DB_SHARD_HOSTS - хосты шардов plans_1, plans_2, ... через запятую. После изменения числа шардов:
+# migrate --database для новых и manage.py rebalance_shards
+PLAN_SHARDS = config('PLAN_SHARDS', default=1, cast=int)
+DB_SHARD_HOSTS = config('DB_SHARD_HOSTS', default='', cast=Csv())
+
+for index in range(1, PLAN_SHARDS):
+    DATABASES[f'plans_{index}'] = shard_profile(
+        DATABASES['default'], index, DB_SHARD_HOSTS[index - 1] if index <= len(DB_SHARD_HOSTS) else '')
+
+SHARDING = {
+    'ALIASES': ['default'] + [f'plans_{index}' for index in range(1, PLAN_SHARDS)],
+    'MODELS': ('plans.plan', 'plans.weekly_schedule', 'plans.exercises', 'plans.planarchive', 'plans.workoutset',
+               'plans.exerciseprogress'),
+    'ID_STEP': 10 ** 12,
+}
+
+DATABASE_ROUTERS = ['fit.sharding.ShardRouter', 'fit.routers.ReplicaRouter']
+
+# GET/HEAD/OPTIONS в этих приложениях читают с реплики; после записи пользователь
+# PIN_SECONDS секунд читает с primary, чтобы видеть свои изменения. Закрепление хранится в кэше,
+# поэтому реплике нужен общий кэш (REDIS_URL), иначе проверка fit.E001 не даст запуститься
+READ_REPLICA = {
+    'ALIAS': 'replica' if 'replica' in DATABASES else None,
+    'APPS': ('plans', 'authUser'),
+    'PIN_SECONDS': config('DB_REPLICA_PIN_SECONDS', default=5, cast=int),
 }
 
 
@@ -188,7 +315,22 @@ STATIC_ROOT = os.path.join(BASE_DIR, 'staticfiles')  # Путь для сбор
 
 # Медиафайлы
 MEDIA_URL = '/media/'
-MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
+MEDIA_ROOT = config('MEDIA_ROOT', default=os.path.join(BASE_DIR, 'media'))
+
+# Отдача аватаров через прокси: None, 'xsendfile' (Apache/lighttpd) или 'xaccel' (nginx internal location)
+MEDIA_SENDFILE = {
+    'BACKEND': config('MEDIA_SENDFILE_BACKEND', default=None),
+    'XACCEL_PREFIX': '/protected-media/',
+}
+
+# Обработка аватаров: квадратные миниатюры без метаданных
+AVATARS = {
+    'VARIANTS': {'small': 64, 'medium': 192, 'large': 512},
+    'FORMAT': 'WEBP',
+    'QUALITY': 80,
+    'ASYNC': config('AVATARS_ASYNC', default=True, cast=bool),
+    'WORKERS': 2,
+}
 
 
 # Default primary key field type
@@ -196,6 +338,85 @@ MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
+# Метрики запросов к БД на каждый HTTP-запрос (fit.querylog)
+QUERY_INSTRUMENTATION = {
+    'ENABLED': config('QUERY_INSTRUMENTATION', default=True, cast=bool),
+    'SERVER_TIMING': True,
+    'TOP_N': 3,
+    'SLOW_QUERY_MS': config('SLOW_QUERY_MS', default=100, cast=int),
+    'SLOW_QUERY_SAMPLE_RATE': config('SLOW_QUERY_SAMPLE_RATE', default=1.0, cast=float),
+}
+
+# Метрики Prometheus (fit.metrics): файлы процессов суммируются в /metrics
+METRICS = {
+    'ENABLED': config('METRICS', default=True, cast=bool),
+    'DIR': config('METRICS_DIR', default=str(BASE_DIR / 'metrics')),
+    'FLUSH_INTERVAL': 1,  # секунды
+    'TOKEN': config('METRICS_TOKEN', default=''),  # если задан, /metrics требует Authorization: Bearer <token>
+}
+
+TEST_RUNNER = 'fit.test_runner.TestRunner'
+
+# Профилирование запросов по требованию staff (fit.profiling)
+PROFILING = {
+    'ENABLED': config('PROFILING', default=True, cast=bool),
+    'DIR': config('PROFILING_DIR', default=str(BASE_DIR / 'profiles')),
+    'MAX_PROFILES': 50,
+    'TRACEMALLOC_FRAMES': 10,
+}
+
+# Заранее сгенерированные планы (plans.templates, команда pregenerate_plans).
+# SERVE: 'peak' - отдавать шаблон, когда в процессе уже идёт PEAK_IN_FLIGHT генераций; 'always'; 'off'
+PLAN_TEMPLATES = {
+    'SERVE': config('PLAN_TEMPLATES_SERVE', default='peak'),
+    'PEAK_IN_FLIGHT': config('PLAN_TEMPLATES_PEAK_IN_FLIGHT', default=4, cast=int),
+    'AGE_STEP': 5,
+    'HEIGHT_STEP': 5,
+    'WEIGHT_STEP': 5,
+    'MODEL': 'gpt-4o',
+    # Цена за 1000 токенов в долларах для оценки стоимости в --dry-run
+    'PRICE_PER_1K': {'prompt': 0.0025, 'completion': 0.01},
+}
+
+# Дневные лимиты генерации планов на пользователя (plans.budget); 0 - без ограничения
+TOKEN_BUDGET = {
+    'DAILY_TOKENS': config('TOKEN_BUDGET_DAILY_TOKENS', default=50000, cast=int),
+    'DAILY_GENERATIONS': config('TOKEN_BUDGET_DAILY_GENERATIONS', default=20, cast=int),
+    'FLUSH_INTERVAL': 10,  # как часто расход пишется в TokenUsage, секунды
+    'LOCAL_TTL': 2,  # без общего кэша (REDIS_URL) расход перечитывается из TokenUsage раз в LOCAL_TTL секунд
+}
+
+# Подсказки названий упражнений (plans.autocomplete)
+EXERCISE_AUTOCOMPLETE = {
+    'LIMIT': 10,
+    'MAX_LIMIT': 50,
+    'REBUILD_INTERVAL': config('EXERCISE_AUTOCOMPLETE_REBUILD_INTERVAL', default=300, cast=int),  # секунды
+}
+
+# Календарь тренировок плана и iCal-лента (plans.calendar_feed)
+PLAN_CALENDAR = {
+    'DEFAULT_DAYS': 28,  # окно по умолчанию, начиная с сегодняшнего дня
+    'MAX_DAYS': 366,
+}
+
+# Журнал подходов (plans.workouts, команда rollup_workouts)
+WORKOUT_LOG = {
+    'MAX_BATCH': 500,  # подходов в одном запросе
+    'BUFFER_SIZE': config('WORKOUT_LOG_BUFFER_SIZE', default=1000, cast=int),  # 0 - запись сразу
+    'FLUSH_INTERVAL': 2,  # секунды
+    'FLUSH_THREAD': config('WORKOUT_LOG_FLUSH_THREAD', default=True, cast=bool),  # сброс буфера без новых записей
+    'ROLLUP_GRACE': 60,  # подходы моложе этого (секунды) ждут следующей свёртки
+    'RETENTION_MONTHS': config('WORKOUT_LOG_RETENTION_MONTHS', default=0, cast=int),  # 0 - хранить всё
+}
+
+# Архивация холодных планов (plans.archive, команда archive_plans)
+PLAN_ARCHIVE = {
+    'AFTER_DAYS': config('PLAN_ARCHIVE_AFTER_DAYS', default=180, cast=int),
+    'CODEC': config('PLAN_ARCHIVE_CODEC', default='zlib'),  # 'zstd' требует пакет zstandard
+    'LEVEL': {'zlib': 9, 'zstd': 19},
+    'BATCH_SIZE': 200,
+}
+
 LOGGING = {
     'version': 1,
     'disable_existing_loggers': False,
@@ -205,9 +426,15 @@ LOGGING = {
         },
     },
     'loggers': {
-        'django.db.backends': {
-            'level': 'DEBUG',
+        'fit.requests': {
+            'level': config('REQUEST_LOG_LEVEL', default='INFO'),
+            'handlers': ['console'],
+            'propagate': False,
+        },
+        'fit.slow_queries': {
+            'level': 'WARNING',
             'handlers': ['console'],
+            'propagate': False,
         },
     },
 }
@@ -0,0 +1,104 @@
+import hashlib
+
+from django.conf import settings
+from django.db import connections
+
+from fit.routers import ReplicaRouter, read_alias
+
+# Планы, дни, упражнения и архивы пользователя живут в одном шарде (SHARDING['ALIASES']).
+# Шард выбирается rendezvous-хешированием id пользователя: при добавлении шарда
+# переезжает только ~1/N пользователей (команда rebalance_shards).
+
+
+def shard_aliases():
+    return settings.SHARDING['ALIASES']
+
+
+def shard_for_user(user_id):
+    aliases = shard_aliases()
+    if len(aliases) == 1:
+        return aliases[0]
+    return max(aliases, key=lambda alias: hashlib.blake2b(f'{alias}:{user_id}'.encode(), digest_size=8).digest())
+
+
+def is_sharded(model):
+    return model._meta.label_lower in settings.SHARDING['MODELS']
+
+
+def instance_shard(instance):
+    if instance._state.db:
+        return instance._state.db
+    user_id = getattr(instance, 'id_user_id', None)
+    if user_id is not None:
+        return shard_for_user(user_id)
+    # Несохранённые дни, упражнения и архивы - в шард родителя, если он уже загружен
+    for parent in instance._state.fields_cache.values():
+        if parent is not None and is_sharded(type(parent)) and parent._state.db:
+            return parent._state.db
+    return None
+
+
+class ShardRouter:
+    # Запросы к шардированным моделям без явного using() направляются по instance из hints
+    # (связанные менеджеры, save() новых объектов). Plan.objects.for_user() задаёт шард сам.
+    # Пользователь и предпочтения, полученные через план, читаются из основной базы.
+
+    def db_for_read(self, model, **hints):
+        if len(shard_aliases()) == 1:
+            return None
+        instance = hints.get('instance')
+        if is_sharded(model):
+            return instance_shard(instance) if instance is not None else None
+        if instance is not None and is_sharded(type(instance)):
+            return ReplicaRouter().db_for_read(model) or 'default'
+        return None
+
+    def db_for_write(self, model, **hints):
+        if len(shard_aliases()) == 1:
+            return None
+        instance = hints.get('instance')
+        if is_sharded(model) and instance is not None:
+            alias = instance_shard(instance)
+            if alias:
+                read_alias.set(None)
+            return alias
+        if instance is not None and is_sharded(type(instance)):
+            return ReplicaRouter().db_for_write(model)
+        return None
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Шарды получают полную схему: миграции plans ссылаются на таблицы authUser
+        if db in shard_aliases()[1:]:
+            return True
+        return None
+
+
+def reserve_id_ranges(using):
+    # Каждому шарду - свой диапазон id (ID_STEP * номер шарда), чтобы при переносе
+    # пользователя между шардами id планов, дней и упражнений не пересекались
+    aliases = shard_aliases()
+    if using not in aliases or aliases.index(using) == 0:
+        return
+    from django.apps import apps
+
+    start = aliases.index(using) * settings.SHARDING['ID_STEP']
+    connection = connections[using]
+    with connection.cursor() as cursor:
+        for label in settings.SHARDING['MODELS']:
+            model = apps.get_model(label)
+            if not model._meta.pk.get_internal_type().endswith('AutoField'):
+                continue
+            table = model._meta.db_table
+            if connection.vendor == 'sqlite':
+                cursor.execute('DELETE FROM sqlite_sequence WHERE name = %s AND seq < %s', [table, start])
+                cursor.execute(
+                    'INSERT INTO sqlite_sequence (name, seq) SELECT %s, %s '
+                    'WHERE NOT EXISTS (SELECT 1 FROM sqlite_sequence WHERE name = %s)', [table, start, table])
+            elif connection.vendor == 'postgresql':
+                cursor.execute(
+                    f'SELECT setval(pg_get_serial_sequence(%s, %s), '
+                    f'GREATEST(%s, (SELECT COALESCE(MAX({connection.ops.quote_name(model._meta.pk.column)}), 0) '
+                    f'FROM {connection.ops.quote_name(table)})))', [table, model._meta.pk.column, start])
@@ -0,0 +1,24 @@
+import tempfile
+
+from django.conf import settings
+from django.test.runner import DiscoverRunner
+from django.test.utils import override_settings
+
+
+class TestRunner(DiscoverRunner):
+    # Метрики тестов пишутся во временный каталог, а не в METRICS['DIR'] проекта
+
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        self.metrics_dir = tempfile.TemporaryDirectory()
+        self.metrics_override = override_settings(METRICS={**settings.METRICS, 'DIR': self.metrics_dir.name})
+        self.metrics_override.enable()
+
+    def teardown_test_environment(self, **kwargs):
+        from fit.metrics import registry
+
+        # Иначе atexit сбросит накопленные в тестах значения в каталог проекта
+        registry._values = {}
+        self.metrics_override.disable()
+        self.metrics_dir.cleanup()
+        super().teardown_test_environment(**kwargs)
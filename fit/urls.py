@@ -14,16 +14,30 @@ Including another URLconf
     1. Import the include() function: from django.urls import include, path
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
+from django.conf import settings
+from django.conf.urls.static import static
 from django.contrib import admin
 from django.urls import path, include
-from drf_spectacular.views import SpectacularAPIView, SpectacularSwaggerView, SpectacularRedocView
+from drf_spectacular.views import SpectacularSwaggerView, SpectacularRedocView
+
+from authUser.media import serve_avatar
+from fit.metrics import metrics_view
+from fit.profiling import ProfileDownloadView, ProfileListView
+from fit.schema import CachedSchemaView
 
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/v1/auth/', include('authUser.urls')),
     path('api/v1/traning/', include('plans.urls')),
-    path('api/v1/schema/', SpectacularAPIView.as_view(), name='schema'),
+    path('api/v1/schema/', CachedSchemaView.as_view(), name='schema'),
     path('api/v1/schema/swagger-ui/', SpectacularSwaggerView.as_view(url_name='schema'), name='swagger-ui'),
     path('api/v1/schema/redoc/', SpectacularRedocView.as_view(url_name='schema'), name='redoc'),
+    path('media/avatars/<path:path>', serve_avatar, name='avatar-media'),
+    path('metrics', metrics_view, name='metrics'),
+    path('api/v1/profiles/', ProfileListView.as_view(), name='profiles'),
+    path('api/v1/profiles/<str:profile_id>/<str:kind>/', ProfileDownloadView.as_view(), name='profile-download'),
 
 ]
+
+if settings.DEBUG:
+    urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
@@ -1,9 +1,49 @@
 from django.contrib import admin
-from .models import Preferences, Weekly_Schedule, Exercises, Plan
+from .models import Preferences, Weekly_Schedule, Exercises, Plan, PlanArchive, PlanTemplate, TokenUsage, ExerciseProgress
+
+
+class PlanCountersAdmin(admin.ModelAdmin):
+    # Правки дней и упражнений через админку пересчитывают счётчики плана
+
+    def get_plan(self, obj):
+        return obj.plan_id
+
+    def save_model(self, request, obj, form, change):
+        # День или упражнение могли перенести в другой план: пересчитываются оба
+        previous = self.get_plan(type(obj).objects.using(obj._state.db).get(pk=obj.pk)) if change else None
+        super().save_model(request, obj, form, change)
+        plan = self.get_plan(obj)
+        plan.update_counters()
+        if previous is not None and previous.pk != plan.pk:
+            previous.update_counters()
+
+    def delete_model(self, request, obj):
+        plan = self.get_plan(obj)
+        super().delete_model(request, obj)
+        plan.update_counters()
+
+    def delete_queryset(self, request, queryset):
+        plans = {self.get_plan(obj) for obj in queryset}
+        super().delete_queryset(request, queryset)
+        for plan in plans:
+            plan.update_counters()
+
+
+class WeeklyScheduleAdmin(PlanCountersAdmin):
+    pass
+
+
+class ExercisesAdmin(PlanCountersAdmin):
+    def get_plan(self, obj):
+        return obj.weekly_schedule_id.plan_id
+
 
 # Register your models here.
 admin.site.register(Preferences)
-admin.site.register(Weekly_Schedule)
-admin.site.register(Exercises)
+admin.site.register(Weekly_Schedule, WeeklyScheduleAdmin)
+admin.site.register(Exercises, ExercisesAdmin)
 admin.site.register(Plan)
-
+admin.site.register(PlanTemplate)
+admin.site.register(PlanArchive)
+admin.site.register(TokenUsage)
+admin.site.register(ExerciseProgress)
@@ -1,6 +1,15 @@
 from django.apps import AppConfig
+from django.core.checks import Tags, register
+from django.db.models.signals import post_migrate
 
 
 class PlansConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'plans'
+
+    def ready(self):
+        from fit.routers import check_replica_cache
+        from .signals import reserve_plan_id_ranges
+
+        post_migrate.connect(reserve_plan_id_ranges, sender=self)
+        register(check_replica_cache, Tags.database)
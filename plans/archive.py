@@ -0,0 +1,71 @@
+import json
+import zlib
+
+from django.core.exceptions import ImproperlyConfigured
+from django.db import transaction
+
+from fit.sharding import shard_aliases
+from .models import Exercises, Plan, PlanArchive, Weekly_Schedule
+from .serializers import WeeklyScheduleSerializer
+
+
+def zstd_module():
+    # zstandard - необязательная зависимость, нужна только для CODEC='zstd'
+    try:
+        import zstandard
+    except ImportError:
+        raise ImproperlyConfigured("Для архивации планов в zstd установите пакет zstandard")
+    return zstandard
+
+
+def compress(codec, raw, level):
+    if codec == 'zlib':
+        return zlib.compress(raw, level)
+    if codec == 'zstd':
+        return zstd_module().ZstdCompressor(level=level).compress(raw)
+    raise ImproperlyConfigured(f"Неизвестный кодек архива: {codec}")
+
+
+def decompress(codec, data):
+    if codec == 'zlib':
+        return zlib.decompress(data)
+    if codec == 'zstd':
+        return zstd_module().ZstdDecompressor().decompress(data)
+    raise ImproperlyConfigured(f"Неизвестный кодек архива: {codec}")
+
+
+def load_schedule(archive):
+    # Готовое представление WeeklyScheduleSerializer на момент архивации, с исходными id
+    return json.loads(decompress(archive.codec, bytes(archive.data)))
+
+
+def archive_plans(before, codec, level, batch_size):
+    # Планы, не изменявшиеся с before: дни и упражнения заменяются одним сжатым документом.
+    # Сама строка Plan остаётся - список планов и счётчики продолжают работать без изменений
+    archived = raw_size = compressed_size = 0
+    for db in shard_aliases():
+        while True:
+            with transaction.atomic(using=db):
+                plans = list(
+                    Plan.objects.using(db).select_for_update()
+                    .filter(archived=False, updated_at__lt=before)
+                    .order_by('pk')
+                    .prefetch_related('weekly_schedule_set__exercises_set')[:batch_size]
+                )
+                if not plans:
+                    break
+                archives = []
+                for plan in plans:
+                    raw = json.dumps(WeeklyScheduleSerializer(plan.weekly_schedule_set.all(), many=True).data,
+                                     ensure_ascii=False, separators=(',', ':')).encode()
+                    data = compress(codec, raw, level)
+                    archives.append(PlanArchive(plan=plan, codec=codec, data=data))
+                    raw_size += len(raw)
+                    compressed_size += len(data)
+                PlanArchive.objects.using(db).bulk_create(archives)
+                Exercises.objects.using(db).filter(weekly_schedule_id__plan_id__in=plans).delete()
+                Weekly_Schedule.objects.using(db).filter(plan_id__in=plans).delete()
+                # update() не трогает updated_at, порядок списка планов не меняется
+                Plan.objects.using(db).filter(pk__in=[plan.pk for plan in plans]).update(archived=True)
+            archived += len(plans)
+    return archived, raw_size, compressed_size
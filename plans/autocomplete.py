@@ -0,0 +1,128 @@
+import heapq
+import logging
+import threading
+import time
+from bisect import bisect_left, insort
+
+from django.conf import settings
+from django.db import connections
+from django.db.models import Count
+
+from fit.sharding import shard_aliases
+
+logger = logging.getLogger(__name__)
+
+
+def normalize_name(name):
+    return ' '.join(str(name).split()).lower()
+
+
+class ExerciseIndex:
+    # Подсказки по названиям упражнений из памяти процесса.
+    # Отсортированный список нормализованных названий: префикс ищется через bisect,
+    # среди совпадений берутся самые частые. Новые планы этого процесса добавляются сразу
+    # (add после коммита save_plan), удаления и записи других процессов подтягиваются
+    # полной перестройкой не чаще REBUILD_INTERVAL. Первая загрузка идёт в запросе (одна на процесс,
+    # остальные запросы её ждут), устаревший индекс перестраивается в фоновом потоке,
+    # а запросы тем временем отвечают по старому.
+
+    def __init__(self):
+        self._keys = []
+        self._entries = {}
+        self._lock = threading.Lock()
+        self._build_lock = threading.Lock()
+        self._rebuilding = False
+        self._built_at = None
+        # Лучшие подсказки для коротких префиксов: под них попадает большая часть индекса
+        self._top = {}
+
+    def build(self):
+        from .models import Exercises
+
+        counts = {}
+        for db in shard_aliases():
+            rows = Exercises.objects.using(db).order_by().values('name').annotate(count=Count('id'))
+            for row in rows.iterator():
+                self._count(counts, row['name'], row['count'])
+        with self._lock:
+            self._entries = counts
+            self._keys = sorted(counts)
+            self._top = {}
+            self._built_at = time.monotonic()
+
+    def _count(self, entries, name, amount):
+        key = normalize_name(name)
+        if not key:
+            return False
+        entry = entries.get(key)
+        if entry is None:
+            # Показывается написание, встреченное первым
+            entries[key] = [name.strip(), amount]
+            return True
+        entry[1] += amount
+        return False
+
+    def ensure_fresh(self):
+        if self._built_at is None:
+            with self._build_lock:
+                if self._built_at is None:
+                    self.build()
+            return
+        if time.monotonic() - self._built_at < settings.EXERCISE_AUTOCOMPLETE['REBUILD_INTERVAL']:
+            return
+        with self._lock:
+            if self._rebuilding:
+                return
+            self._rebuilding = True
+        threading.Thread(target=self._rebuild, name='exercise-index-rebuild', daemon=True).start()
+
+    def _rebuild(self):
+        try:
+            with self._build_lock:
+                self.build()
+        except Exception:
+            logger.exception("Exercise index rebuild failed")
+        finally:
+            self._rebuilding = False
+            # Соединения фонового потока иначе остались бы открытыми
+            connections.close_all()
+
+    def add(self, names):
+        if self._built_at is None:
+            # Индекс ещё не загружен - новые названия попадут в него при первой загрузке
+            return
+        with self._lock:
+            self._top = {}
+            for name in names:
+                if self._count(self._entries, name, 1):
+                    insort(self._keys, normalize_name(name))
+
+    def suggest(self, prefix, limit):
+        self.ensure_fresh()
+        prefix = normalize_name(prefix)
+        with self._lock:
+            entries = self._entries
+            top = self._top.get(prefix)
+            if top is None:
+                top = self._rank(prefix, settings.EXERCISE_AUTOCOMPLETE['MAX_LIMIT'])
+                if len(prefix) <= 2:
+                    self._top[prefix] = top
+            return [{"name": entries[key][0], "count": entries[key][1]} for key in top[:limit]]
+
+    def _rank(self, prefix, limit):
+        keys, entries = self._keys, self._entries
+        start = bisect_left(keys, prefix)
+        # Все ключи с префиксом лежат подряд: верхняя граница - следующий за префиксом ключ
+        end = bisect_left(keys, prefix + '\uffff', start)
+        return heapq.nsmallest(limit, keys[start:end], key=lambda key: (-entries[key][1], key))
+
+    def clear(self):
+        with self._lock:
+            self._keys = []
+            self._entries = {}
+            self._top = {}
+            self._built_at = None
+            self._rebuilding = False
+
+
+exercise_index = ExerciseIndex()
@@ -0,0 +1,137 @@
+import atexit
+import logging
+import threading
+import time
+from datetime import datetime, time as dt_time, timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from fit.caches import is_shared_cache
+
+logger = logging.getLogger(__name__)
+
+
+class TokenBudget:
+    # Дневной расход токенов LLM по пользователям.
+    # Текущий расход - счётчики в общем кэше: проверка лимита перед генерацией не ходит в БД.
+    # Приращения копятся в памяти процесса и пишутся в TokenUsage пачкой раз в FLUSH_INTERVAL.
+    # При промахе кэша счётчик один раз загружается из TokenUsage (плюс ещё не записанное).
+    # Кэш в памяти процесса (без REDIS_URL) не общий: тогда расход пишется в TokenUsage сразу,
+    # а счётчик живёт LOCAL_TTL и перечитывается из БД, иначе каждый воркер считал бы свой лимит.
+
+    def __init__(self):
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._flushed_at = time.monotonic()
+
+    def keys(self, user_id, day):
+        prefix = f'plans:budget:{user_id}:{day.isoformat()}'
+        return f'{prefix}:tokens', f'{prefix}:generations'
+
+    def usage(self, user_id, day=None):
+        from .models import TokenUsage
+
+        day = day or timezone.localdate()
+        tokens_key, generations_key = self.keys(user_id, day)
+        values = cache.get_many([tokens_key, generations_key])
+        if len(values) == 2:
+            return values[tokens_key], values[generations_key]
+
+        row = TokenUsage.objects.filter(id_user_id=user_id, day=day).values_list(
+            'prompt_tokens', 'completion_tokens', 'generations').first() or (0, 0, 0)
+        with self._lock:
+            pending = self._pending.get((user_id, day), (0, 0, 0))
+        tokens = row[0] + row[1] + pending[0] + pending[1]
+        generations = row[2] + pending[2]
+        # add: если другой процесс успел загрузить счётчик, его значение не перезаписывается
+        timeout = 2 * 24 * 3600 if is_shared_cache() else settings.TOKEN_BUDGET['LOCAL_TTL']
+        cache.add(tokens_key, tokens, timeout)
+        cache.add(generations_key, generations, timeout)
+        return cache.get(tokens_key, tokens), cache.get(generations_key, generations)
+
+    def status(self, user_id):
+        config = settings.TOKEN_BUDGET
+        day = timezone.localdate()
+        tokens, generations = self.usage(user_id, day)
+        resets_at = timezone.make_aware(datetime.combine(day + timedelta(days=1), dt_time.min))
+        return {
+            "date": day,
+            "tokens_used": tokens,
+            "tokens_limit": config['DAILY_TOKENS'] or None,
+            "tokens_remaining": max(config['DAILY_TOKENS'] - tokens, 0) if config['DAILY_TOKENS'] else None,
+            "generations_used": generations,
+            "generations_limit": config['DAILY_GENERATIONS'] or None,
+            "generations_remaining": (max(config['DAILY_GENERATIONS'] - generations, 0)
+                                      if config['DAILY_GENERATIONS'] else None),
+            "resets_at": resets_at,
+        }
+
+    def exceeded(self, user_id):
+        # Лимит 0 - без ограничения
+        config = settings.TOKEN_BUDGET
+        tokens, generations = self.usage(user_id)
+        return (bool(config['DAILY_TOKENS']) and tokens >= config['DAILY_TOKENS']) or (
+            bool(config['DAILY_GENERATIONS']) and generations >= config['DAILY_GENERATIONS'])
+
+    def record(self, user_id, usage):
+        prompt = getattr(usage, 'prompt_tokens', 0) or 0
+        completion = getattr(usage, 'completion_tokens', 0) or 0
+        day = timezone.localdate()
+        self.usage(user_id, day)
+        tokens_key, generations_key = self.keys(user_id, day)
+        try:
+            cache.incr(tokens_key, prompt + completion)
+            cache.incr(generations_key)
+        except ValueError:
+            # Ключ вытеснен из кэша между usage() и incr - значение загрузится из БД при следующей проверке
+            pass
+        with self._lock:
+            current = self._pending.get((user_id, day), (0, 0, 0))
+            self._pending[(user_id, day)] = (current[0] + prompt, current[1] + completion, current[2] + 1)
+        if not is_shared_cache() or time.monotonic() - self._flushed_at >= settings.TOKEN_BUDGET['FLUSH_INTERVAL']:
+            self.flush()
+
+    def flush(self):
+        from .models import TokenUsage
+
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            self._flushed_at = time.monotonic()
+        if not pending:
+            return
+        try:
+            with transaction.atomic():
+                for (user_id, day), (prompt, completion, generations) in pending.items():
+                    increments = {
+                        'prompt_tokens': F('prompt_tokens') + prompt,
+                        'completion_tokens': F('completion_tokens') + completion,
+                        'generations': F('generations') + generations,
+                    }
+                    if TokenUsage.objects.filter(id_user_id=user_id, day=day).update(**increments):
+                        continue
+                    try:
+                        with transaction.atomic():
+                            TokenUsage.objects.create(id_user_id=user_id, day=day, prompt_tokens=prompt,
+                                                      completion_tokens=completion, generations=generations)
+                    except IntegrityError:
+                        # Строку за этот день только что создал другой процесс
+                        TokenUsage.objects.filter(id_user_id=user_id, day=day).update(**increments)
+        except Exception:
+            # Расход не теряется: вернётся в очередь до следующей записи
+            logger.exception("Token usage flush failed")
+            with self._lock:
+                for key, values in pending.items():
+                    current = self._pending.get(key, (0, 0, 0))
+                    self._pending[key] = tuple(a + b for a, b in zip(current, values))
+
+    def clear(self):
+        with self._lock:
+            self._pending = {}
+
+
+token_budget = TokenBudget()
+atexit.register(token_budget.flush)
@@ -0,0 +1,131 @@
+import calendar
+import hashlib
+from datetime import timedelta, timezone as dt_timezone
+
+from django.core import signing
+
+from .serializers import WeeklyScheduleSerializer
+
+# Дни недели, как их называет LLM в weekly_schedule
+WEEKDAYS = {
+    'понедельник': 0, 'пн': 0, 'monday': 0, 'mon': 0,
+    'вторник': 1, 'вт': 1, 'tuesday': 1, 'tue': 1,
+    'среда': 2, 'ср': 2, 'wednesday': 2, 'wed': 2,
+    'четверг': 3, 'чт': 3, 'thursday': 3, 'thu': 3,
+    'пятница': 4, 'пт': 4, 'friday': 4, 'fri': 4,
+    'суббота': 5, 'сб': 5, 'saturday': 5, 'sat': 5,
+    'воскресенье': 6, 'вс': 6, 'sunday': 6, 'sun': 6,
+}
+
+FEED_SALT = 'plans.calendar'
+
+
+def weekday_number(day):
+    return WEEKDAYS.get(str(day or '').strip().strip('.,:').lower())
+
+
+def add_months(day, months):
+    month = day.month - 1 + months
+    year = day.year + month // 12
+    month = month % 12 + 1
+    return day.replace(year=year, month=month, day=min(day.day, calendar.monthrange(year, month)[1]))
+
+
+def plan_period(plan):
+    # Первый день программы и день после последнего; длительность в месяцах, по умолчанию один
+    return plan.starts_on, add_months(plan.starts_on, plan.program_duration or 1)
+
+
+def load_plan_schedule(plan):
+    if plan.archived:
+        from .archive import load_schedule
+
+        return load_schedule(plan.archive)
+    return WeeklyScheduleSerializer(plan.weekly_schedule_set.prefetch_related('exercises_set'), many=True).data
+
+
+def iter_sessions(schedule, start, end):
+    # Тренировки плана по датам в [start, end). Дни с нераспознанным названием пропускаются
+    by_weekday = {}
+    for day in schedule:
+        weekday = weekday_number(day['day'])
+        if weekday is not None:
+            by_weekday.setdefault(weekday, []).append(day)
+    if not by_weekday:
+        return
+    current = start
+    while current < end:
+        for day in by_weekday.get(current.weekday(), ()):
+            yield current, day
+        current += timedelta(days=1)
+
+
+def feed_token(user_id, plan_id):
+    # Календарные приложения не передают JWT: ссылка на ленту подписана SECRET_KEY
+    return signing.Signer(salt=FEED_SALT).sign(f'{user_id}-{plan_id}')
+
+
+def read_feed_token(token):
+    try:
+        user_id, plan_id = signing.Signer(salt=FEED_SALT).unsign(token).split('-')
+        return int(user_id), int(plan_id)
+    except (signing.BadSignature, ValueError):
+        return None
+
+
+def feed_etag(plan):
+    version = f'{plan.pk}:{plan.updated_at.isoformat()}:{plan.starts_on}:{plan.program_duration}'
+    return '"' + hashlib.sha256(version.encode()).hexdigest()[:32] + '"'
+
+
+def escape_text(value):
+    return (str(value or '').replace('\\', '\\\\').replace(';', '\\;').replace(',', '\\,')
+            .replace('\r\n', '\\n').replace('\n', '\\n'))
+
+
+def fold(line):
+    # RFC 5545: строки не длиннее 75 октетов, продолжение начинается с пробела.
+    # Режется по символам, чтобы не разорвать многобайтовую букву UTF-8
+    parts, current, size = [], [], 0
+    for char in line:
+        length = len(char.encode())
+        if size + length > 75:
+            parts.append(''.join(current))
+            current, size = [' '], 1
+        current.append(char)
+        size += length
+    parts.append(''.join(current))
+    return '\r\n'.join(parts) + '\r\n'
+
+
+def exercise_line(exercise):
+    details = ' x '.join(value for value in (exercise.get('sets'), exercise.get('reps')) if value)
+    if exercise.get('rest'):
+        details = f"{details}, отдых {exercise['rest']}" if details else f"отдых {exercise['rest']}"
+    return f"{exercise['name']}: {details}" if details else exercise['name']
+
+
+def iter_ical(plan, schedule):
+    # Лента отдаётся по одному событию: весь год в памяти не собирается
+    stamp = plan.updated_at.astimezone(dt_timezone.utc).strftime('%Y%m%dT%H%M%SZ')
+    yield ''.join(fold(line) for line in (
+        'BEGIN:VCALENDAR',
+        'VERSION:2.0',
+        'PRODID:-//FitGenie//Plans//RU',
+        'CALSCALE:GREGORIAN',
+        f'X-WR-CALNAME:{escape_text(plan.name)}',
+    ))
+    start, end = plan_period(plan)
+    for index, (day, session) in enumerate(iter_sessions(schedule, start, end)):
+        description = '\n'.join(exercise_line(exercise) for exercise in session['exercises'])
+        yield ''.join(fold(line) for line in (
+            'BEGIN:VEVENT',
+            f'UID:plan-{plan.pk}-{day:%Y%m%d}-{index}@fitgenie',
+            f'DTSTAMP:{stamp}',
+            f'DTSTART;VALUE=DATE:{day:%Y%m%d}',
+            f'DTEND;VALUE=DATE:{day + timedelta(days=1):%Y%m%d}',
+            f'SUMMARY:{escape_text(session["focus"] or plan.name)}',
+            f'DESCRIPTION:{escape_text(description)}',
+            'END:VEVENT',
+        ))
+    yield fold('END:VCALENDAR')
@@ -0,0 +1,33 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from plans.archive import archive_plans, compress
+
+
+class Command(BaseCommand):
+    help = "Переносит дни и упражнения планов, не изменявшихся N дней, в сжатый архив (PlanArchive)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=None, help="По умолчанию PLAN_ARCHIVE['AFTER_DAYS']")
+        parser.add_argument('--codec', choices=('zlib', 'zstd'), default=None)
+        parser.add_argument('--batch-size', type=int, default=None)
+
+    def handle(self, *args, **options):
+        config = settings.PLAN_ARCHIVE
+        days = options['days'] if options['days'] is not None else config['AFTER_DAYS']
+        codec = options['codec'] or config['CODEC']
+        level = config['LEVEL'][codec]
+        try:
+            # Проверка кодека до начала работы, а не на первой пачке
+            compress(codec, b'', level)
+        except ImproperlyConfigured as e:
+            raise CommandError(str(e))
+
+        archived, raw_size, compressed_size = archive_plans(
+            timezone.now() - timedelta(days=days), codec, level, options['batch_size'] or config['BATCH_SIZE'])
+        ratio = raw_size / compressed_size if compressed_size else 0
+        self.stdout.write(f"Archived {archived} plans: {raw_size} -> {compressed_size} bytes ({ratio:.1f}x, {codec})")
@@ -0,0 +1,106 @@
+import json
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Avg, Count
+
+from plans.models import PlanTemplate, Preferences
+from plans.services import build_plan_prompt, generate_plan_data
+from plans.templates import PROFILE_FIELDS, make_profile, profile_key, profile_preferences
+
+# Грубая оценка для русского текста, точное число токенов знает только модель
+CHARS_PER_TOKEN = 3
+DEFAULT_COMPLETION_TOKENS = 1500
+
+
+class Command(BaseCommand):
+    help = ("Заранее генерирует планы для самых частых профилей предпочтений и сохраняет их как шаблоны. "
+            "Готовые профили пропускаются, поэтому прерванный запуск можно просто повторить")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--top', type=int, default=50, help="Сколько самых частых профилей взять из базы")
+        parser.add_argument('--min-count', type=int, default=2, help="Минимальное число пользователей с профилем")
+        parser.add_argument('--from-file', help="JSON-файл со списком профилей вместо базы")
+        parser.add_argument('--concurrency', type=int, default=4, help="Одновременных запросов к LLM")
+        parser.add_argument('--model', default=None)
+        parser.add_argument('--dry-run', action='store_true', help="Только оценить число запросов и стоимость")
+
+    def handle(self, *args, **options):
+        if options['concurrency'] < 1:
+            raise CommandError("--concurrency должен быть не меньше 1")
+        model = options['model'] or settings.PLAN_TEMPLATES['MODEL']
+        profiles = self.load_profiles(options)
+        done = set(PlanTemplate.objects.filter(profile_key__in=profiles).values_list('profile_key', flat=True))
+        pending = {key: profile for key, profile in profiles.items() if key not in done}
+        self.stdout.write(f"Profiles: {len(profiles)}, already generated: {len(done)}, to generate: {len(pending)}")
+
+        if options['dry_run']:
+            self.estimate(pending)
+            return
+
+        generated = failed = 0
+        with ThreadPoolExecutor(max_workers=options['concurrency']) as executor:
+            futures = {
+                executor.submit(generate_plan_data, profile_preferences(profile), model): key
+                for key, profile in pending.items()
+            }
+            try:
+                for future in as_completed(futures):
+                    key = futures[future]
+                    try:
+                        plan_data, usage = future.result()
+                    except Exception as e:
+                        failed += 1
+                        self.stderr.write(f"{key[:12]} failed: {type(e).__name__}: {e}")
+                        continue
+                    # Шаблон сохраняется сразу: при повторном запуске этот профиль будет пропущен
+                    PlanTemplate.objects.get_or_create(profile_key=key, defaults={
+                        'profile': pending[key],
+                        'plan_data': plan_data,
+                        'model': model,
+                        'prompt_tokens': getattr(usage, 'prompt_tokens', 0) or 0,
+                        'completion_tokens': getattr(usage, 'completion_tokens', 0) or 0,
+                    })
+                    generated += 1
+                    self.stdout.write(f"[{generated + failed}/{len(pending)}] {key[:12]} {pending[key]['goal']}")
+            except KeyboardInterrupt:
+                for future in futures:
+                    future.cancel()
+                self.stdout.write("Interrupted, run the command again to continue")
+        self.stdout.write(f"Generated {generated}, failed {failed}")
+
+    def load_profiles(self, options):
+        if options['from_file']:
+            try:
+                with open(options['from_file'], encoding='utf-8') as f:
+                    entries = json.load(f)
+                profiles = [make_profile(entry) for entry in entries]
+            except (OSError, ValueError, KeyError, TypeError) as e:
+                raise CommandError(f"Не удалось прочитать профили: {e}")
+            return {profile_key(profile): profile for profile in profiles}
+
+        # Сначала группировка по точным значениям в БД, затем по округлённым профилям
+        counts = Counter()
+        by_key = {}
+        for row in Preferences.objects.values(*PROFILE_FIELDS).annotate(users=Count('id')).order_by().iterator():
+            profile = make_profile(row)
+            key = profile_key(profile)
+            counts[key] += row['users']
+            by_key[key] = profile
+        return {
+            key: by_key[key]
+            for key, users in counts.most_common(options['top'])
+            if users >= options['min_count']
+        }
+
+    def estimate(self, pending):
+        prompt_tokens = sum(len(build_plan_prompt(profile_preferences(p))) for p in pending.values()) // CHARS_PER_TOKEN
+        # Средний размер ответа по уже сгенерированным шаблонам, если они есть
+        average = PlanTemplate.objects.filter(completion_tokens__gt=0).aggregate(avg=Avg('completion_tokens'))['avg']
+        completion_tokens = int((average or DEFAULT_COMPLETION_TOKENS) * len(pending))
+        price = settings.PLAN_TEMPLATES['PRICE_PER_1K']
+        cost = prompt_tokens / 1000 * price['prompt'] + completion_tokens / 1000 * price['completion']
+        self.stdout.write(f"Estimated tokens: {prompt_tokens} prompt, {completion_tokens} completion")
+        self.stdout.write(f"Estimated cost: ${cost:.2f}")
@@ -0,0 +1,74 @@
+from datetime import datetime, timezone
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from fit.sharding import shard_aliases, shard_for_user
+from plans.models import ExerciseProgress, Exercises, Plan, PlanArchive, Weekly_Schedule, WorkoutSet
+from plans.workouts import rolled_through
+
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+
+def move_user_plans(user_id, source, target):
+    # Копия в целевой шард с теми же id (диапазоны id у шардов не пересекаются), затем удаление
+    # из исходного. Между двумя базами нет общей транзакции: если команда упала посередине,
+    # повторный запуск пропустит уже скопированные строки (ignore_conflicts) и удалит исходные
+    plans = list(Plan.objects.using(source).filter(id_user_id=user_id))
+    schedules = list(Weekly_Schedule.objects.using(source).filter(plan_id__id_user_id=user_id))
+    exercises = list(Exercises.objects.using(source).filter(weekly_schedule_id__plan_id__id_user_id=user_id))
+    archives = list(PlanArchive.objects.using(source).filter(plan__id_user_id=user_id))
+    workout_sets = list(WorkoutSet.objects.using(source).filter(id_user_id=user_id))
+    # created_at журнала при копировании получит текущее время, и месяцы с подходами
+    # пересчитаются следующей свёрткой. Переносятся только свёртки месяцев, журнал которых уже удалён;
+    # они не должны сдвинуть границу свёртки целевого шарда
+    periods = {workout_set.period for workout_set in workout_sets}
+    progress = [row for row in ExerciseProgress.objects.using(source).filter(id_user_id=user_id)
+                if row.period not in periods]
+    watermark = rolled_through(target) or EPOCH
+    for row in progress:
+        row.rolled_through = min(row.rolled_through, watermark)
+    updated_at = {plan.pk: plan.updated_at for plan in plans}
+
+    with transaction.atomic(using=target):
+        Plan.objects.using(target).bulk_create(plans, ignore_conflicts=True)
+        # bulk_create проставляет auto_now заново, а от updated_at зависит порядок списка планов
+        for pk, value in updated_at.items():
+            Plan.objects.using(target).filter(pk=pk).update(updated_at=value)
+        Weekly_Schedule.objects.using(target).bulk_create(schedules, ignore_conflicts=True)
+        Exercises.objects.using(target).bulk_create(exercises, ignore_conflicts=True)
+        PlanArchive.objects.using(target).bulk_create(archives, ignore_conflicts=True)
+        WorkoutSet.objects.using(target).bulk_create(workout_sets, ignore_conflicts=True)
+        ExerciseProgress.objects.using(target).bulk_create(progress, ignore_conflicts=True)
+
+    with transaction.atomic(using=source):
+        Plan.objects.using(source).filter(id_user_id=user_id).delete()
+        WorkoutSet.objects.using(source).filter(id_user_id=user_id).delete()
+        ExerciseProgress.objects.using(source).filter(id_user_id=user_id).delete()
+    return len(plans)
+
+
+class Command(BaseCommand):
+    help = "Переносит планы пользователей в их шард после изменения PLAN_SHARDS"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help="Только показать, сколько пользователей переедет")
+
+    def handle(self, *args, **options):
+        users = plans = 0
+        for source in shard_aliases():
+            user_ids = set(Plan.objects.using(source).order_by().values_list('id_user_id', flat=True).distinct())
+            user_ids.update(WorkoutSet.objects.using(source).order_by().values_list('id_user_id', flat=True).distinct())
+            for user_id in sorted(user_ids):
+                target = shard_for_user(user_id)
+                if target == source:
+                    continue
+                users += 1
+                if options['dry_run']:
+                    self.stdout.write(f"user {user_id}: {source} -> {target}")
+                    continue
+                plans += move_user_plans(user_id, source, target)
+        if options['dry_run']:
+            self.stdout.write(f"{users} users to move")
+        else:
+            self.stdout.write(f"Moved {plans} plans of {users} users")
@@ -0,0 +1,26 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from plans.workouts import prune_workouts, rollup_workouts
+
+
+class Command(BaseCommand):
+    help = "Сворачивает журнал подходов в ExerciseProgress и удаляет старые записи журнала"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--retention-months', type=int, default=None,
+                            help="Хранить подходы за N полных месяцев, 0 - все. По умолчанию "
+                                 "WORKOUT_LOG['RETENTION_MONTHS']")
+
+    def handle(self, *args, **options):
+        months = options['retention_months']
+        if months is None:
+            months = settings.WORKOUT_LOG['RETENTION_MONTHS']
+        # API принимает подходы за RETENTION_MONTHS: более глубокая чистка оставила бы месяцы,
+        # свёртку которых затрёт первый же задним числом добавленный подход
+        configured = settings.WORKOUT_LOG['RETENTION_MONTHS']
+        if months and (not configured or months < configured):
+            raise CommandError("--retention-months не может быть меньше WORKOUT_LOG['RETENTION_MONTHS']")
+        rolled = rollup_workouts()
+        pruned = prune_workouts(months) if months else 0
+        self.stdout.write(f"Rolled up {rolled} user-months, pruned {pruned} sets")
@@ -0,0 +1,48 @@
+# Generated by Django 5.1.2 on 2026-10-19 17:32
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def fill_counters(apps, schema_editor):
+    Plan = apps.get_model('plans', 'Plan')
+    plans = Plan.objects.using(schema_editor.connection.alias).annotate(
+        days=Count('weekly_schedule', distinct=True),
+        exercises=Count('weekly_schedule__exercises', distinct=True),
+    )
+    for plan in plans:
+        Plan.objects.using(schema_editor.connection.alias).filter(pk=plan.pk).update(
+            days_count=plan.days, exercises_count=plan.exercises
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('plans', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='plan',
+            name='days_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='plan',
+            name='exercises_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='plan',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AddIndex(
+            model_name='plan',
+            index=models.Index(fields=['id_user', '-updated_at', '-id'], name='plan_user_updated_idx'),
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 5.1.2 on 2026-10-19 18:08
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('plans', '0002_plan_counters'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PlanTemplate',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('profile_key', models.CharField(max_length=64, unique=True)),
+                ('profile', models.JSONField()),
+                ('plan_data', models.JSONField()),
+                ('model', models.CharField(max_length=50)),
+                ('prompt_tokens', models.PositiveIntegerField(default=0)),
+                ('completion_tokens', models.PositiveIntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+    ]
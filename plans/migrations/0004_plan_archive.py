@@ -0,0 +1,28 @@
+# Generated by Django 5.1.2 on 2026-10-19 18:10
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('plans', '0003_plan_template'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PlanArchive',
+            fields=[
+                ('plan', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='archive', serialize=False, to='plans.plan')),
+                ('codec', models.CharField(max_length=10)),
+                ('data', models.BinaryField()),
+                ('archived_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='plan',
+            name='archived',
+            field=models.BooleanField(default=False),
+        ),
+    ]
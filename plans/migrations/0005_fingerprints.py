@@ -0,0 +1,47 @@
+# Generated by Django 5.1.2 on 2026-10-19 18:11
+
+import hashlib
+import json
+
+from django.db import migrations, models
+
+# Копия plans.models.GENERATION_FIELDS и preferences_fingerprint на момент миграции
+GENERATION_FIELDS = ('gender', 'age', 'height', 'weight', 'goal', 'experience_level', 'workout_frequency',
+                     'prefer_workout_ex', 'time_of_program')
+
+
+def preferences_fingerprint(values):
+    normalized = {
+        field: ' '.join(value.split()) if isinstance(value, str) else float(value)
+        for field, value in ((field, values[field]) for field in GENERATION_FIELDS)
+    }
+    return hashlib.sha256(json.dumps(normalized, sort_keys=True, ensure_ascii=False).encode()).hexdigest()
+
+
+def fill_fingerprints(apps, schema_editor):
+    # Планы остаются без отпечатка: из чего они сгенерированы, неизвестно, поэтому они считаются устаревшими
+    Preferences = apps.get_model('plans', 'Preferences')
+    db = schema_editor.connection.alias
+    for values in Preferences.objects.using(db).values('pk', *GENERATION_FIELDS).iterator():
+        Preferences.objects.using(db).filter(pk=values['pk']).update(fingerprint=preferences_fingerprint(values))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('plans', '0004_plan_archive'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='plan',
+            name='preferences_fingerprint',
+            field=models.CharField(blank=True, default='', max_length=64),
+        ),
+        migrations.AddField(
+            model_name='preferences',
+            name='fingerprint',
+            field=models.CharField(blank=True, default='', editable=False, max_length=64),
+        ),
+        migrations.RunPython(fill_fingerprints, migrations.RunPython.noop),
+    ]
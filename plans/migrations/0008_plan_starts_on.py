@@ -0,0 +1,27 @@
+# Generated by Django 5.1.2 on 2026-10-19 18:27
+
+import django.utils.timezone
+from django.db import migrations, models
+from django.db.models.functions import TruncDate
+
+
+def fill_starts_on(apps, schema_editor):
+    # Дата создания не хранилась: программа существующих планов считается начатой в день последнего изменения
+    Plan = apps.get_model('plans', 'Plan')
+    Plan.objects.using(schema_editor.connection.alias).update(starts_on=TruncDate('updated_at'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('plans', '0007_plan_shard_keys'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='plan',
+            name='starts_on',
+            field=models.DateField(default=django.utils.timezone.localdate),
+        ),
+        migrations.RunPython(fill_starts_on, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,52 @@
+# Generated by Django 5.1.2 on 2026-10-19 18:30
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('plans', '0008_plan_starts_on'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ExerciseProgress',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('exercise_key', models.CharField(max_length=25)),
+                ('exercise_name', models.CharField(max_length=25)),
+                ('period', models.DateField()),
+                ('sets', models.PositiveIntegerField(default=0)),
+                ('reps', models.PositiveIntegerField(default=0)),
+                ('volume', models.FloatField(default=0)),
+                ('max_weight', models.FloatField(blank=True, null=True)),
+                ('last_performed_at', models.DateTimeField()),
+                ('rolled_through', models.DateTimeField(db_index=True)),
+                ('id_user', models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('id_user', 'exercise_key', 'period'), name='exercise_progress_uniq')],
+            },
+        ),
+        migrations.CreateModel(
+            name='WorkoutSet',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('exercise_name', models.CharField(max_length=25)),
+                ('performed_at', models.DateTimeField()),
+                ('period', models.DateField()),
+                ('reps', models.PositiveIntegerField()),
+                ('weight', models.FloatField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('exercise', models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, to='plans.exercises')),
+                ('id_user', models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['id_user', 'period'], name='workout_set_user_period_idx'), models.Index(fields=['created_at'], name='workout_set_created_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 5.1.2 on 2026-10-19 18:59
+
+from django.db import migrations, models
+from django.db.models import Max
+
+
+def fill_rollup_state(apps, schema_editor):
+    # Граница уже выполненных свёрток - как раньше, максимум rolled_through по шарду
+    db = schema_editor.connection.alias
+    ExerciseProgress = apps.get_model('plans', 'ExerciseProgress')
+    WorkoutRollupState = apps.get_model('plans', 'WorkoutRollupState')
+    value = ExerciseProgress.objects.using(db).aggregate(value=Max('rolled_through'))['value']
+    if value is not None:
+        WorkoutRollupState.objects.using(db).create(pk=1, rolled_through=value)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('plans', '0009_workout_log'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='WorkoutRollupState',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('rolled_through', models.DateTimeField()),
+            ],
+        ),
+        migrations.RunPython(fill_rollup_state, migrations.RunPython.noop),
+    ]
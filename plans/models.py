@@ -1,8 +1,25 @@
+import hashlib
+import json
+
 from django.db import models
 from django.core.validators import MinValueValidator, MaxValueValidator
+from django.utils import timezone
 from authUser.models import CustomUser
 # Create your models here.
 
+# Поля Preferences, которые попадают в промпт генерации плана
+GENERATION_FIELDS = ('gender', 'age', 'height', 'weight', 'goal', 'experience_level', 'workout_frequency',
+                     'prefer_workout_ex', 'time_of_program')
+
+
+def preferences_fingerprint(values):
+    # Числа приводятся к float (180 и 180.0 - одно значение), в строках схлопываются пробелы
+    normalized = {
+        field: ' '.join(value.split()) if isinstance(value, str) else float(value)
+        for field, value in ((field, values[field]) for field in GENERATION_FIELDS)
+    }
+    return hashlib.sha256(json.dumps(normalized, sort_keys=True, ensure_ascii=False).encode()).hexdigest()
+
 
 class Preferences(models.Model):
     exp_level_Choice = [
@@ -51,18 +68,59 @@ class Preferences(models.Model):
     )
 
     id_user = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name='preferences')
+    # Хеш GENERATION_FIELDS, пересчитывается при каждом save()
+    fingerprint = models.CharField(max_length=64, blank=True, default='', editable=False)
+
+    def save(self, *args, **kwargs):
+        self.fingerprint = preferences_fingerprint({field: getattr(self, field) for field in GENERATION_FIELDS})
+        if kwargs.get('update_fields') is not None:
+            kwargs['update_fields'] = {*kwargs['update_fields'], 'fingerprint'}
+        super().save(*args, **kwargs)
 
     def __str__(self):
         return f"{self.id_user} | {self.goal} | {self.experience_level}"
 
 
+class PlanQuerySet(models.QuerySet):
+    def for_user(self, user_id):
+        # Планы пользователя лежат в его шарде (fit.sharding). С одним шардом база выбирается
+        # роутерами, чтобы безопасные чтения уходили на реплику (fit.routers)
+        from fit.sharding import shard_aliases, shard_for_user
+
+        queryset = self.filter(id_user_id=user_id)
+        return queryset if len(shard_aliases()) == 1 else queryset.using(shard_for_user(user_id))
+
+
 class Plan(models.Model):
-    id_user = models.ForeignKey(CustomUser, on_delete=models.CASCADE)
-    id_preferences = models.ForeignKey(Preferences, on_delete=models.CASCADE)
+    # Пользователь и предпочтения могут быть в другой базе, чем план (шарды), поэтому без
+    # внешних ключей в БД; планы удаляются вместе с предпочтениями сигналом (plans.signals)
+    id_user = models.ForeignKey(CustomUser, on_delete=models.DO_NOTHING, db_constraint=False)
+    id_preferences = models.ForeignKey(Preferences, on_delete=models.DO_NOTHING, db_constraint=False)
     name = models.CharField(max_length=25)
     description = models.TextField(null=True, blank=True)
     program_duration = models.IntegerField(null=True, blank=True)
+    # Первый день программы: от него дни недели плана раскладываются по датам (plans.calendar_feed)
+    starts_on = models.DateField(default=timezone.localdate)
+    # Денормализованные счётчики для списка планов, обновляются при записи плана
+    days_count = models.PositiveIntegerField(default=0)
+    exercises_count = models.PositiveIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+    # Дни и упражнения перенесены в PlanArchive (команда archive_plans)
+    archived = models.BooleanField(default=False)
+    # Preferences.fingerprint на момент генерации; не совпадает с текущим - план устарел
+    preferences_fingerprint = models.CharField(max_length=64, blank=True, default='')
+
+    objects = PlanQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['id_user', '-updated_at', '-id'], name='plan_user_updated_idx'),
+        ]
 
+    def update_counters(self):
+        self.days_count = self.weekly_schedule_set.count()
+        self.exercises_count = Exercises.objects.using(self._state.db).filter(weekly_schedule_id__plan_id=self).count()
+        self.save(update_fields=['days_count', 'exercises_count', 'updated_at'])
 
     def __str__(self):
         return self.name
@@ -91,6 +149,106 @@ class Exercises(models.Model):
         return self.name
 
 
+class PlanArchive(models.Model):
+    # Дни и упражнения холодного плана одним сжатым JSON-документом
+    plan = models.OneToOneField(Plan, on_delete=models.CASCADE, primary_key=True, related_name='archive')
+    codec = models.CharField(max_length=10)
+    data = models.BinaryField()
+    archived_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.plan_id} | {self.codec}"
+
+
+class TokenUsage(models.Model):
+    # Расход токенов LLM пользователем за день (plans.budget, пишется пачками)
+    id_user = models.ForeignKey(CustomUser, on_delete=models.CASCADE)
+    day = models.DateField()
+    prompt_tokens = models.PositiveIntegerField(default=0)
+    completion_tokens = models.PositiveIntegerField(default=0)
+    generations = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['id_user', 'day'], name='token_usage_user_day_uniq'),
+        ]
+
+    def __str__(self):
+        return f"{self.id_user_id} | {self.day}"
+
+
+class PlanTemplate(models.Model):
+    # Заранее сгенерированный план для типового профиля предпочтений (команда pregenerate_plans).
+    # profile - округлённые значения Preferences, profile_key - их хеш
+    profile_key = models.CharField(max_length=64, unique=True)
+    profile = models.JSONField()
+    plan_data = models.JSONField()
+    model = models.CharField(max_length=50)
+    prompt_tokens = models.PositiveIntegerField(default=0)
+    completion_tokens = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.profile.get('goal')} | {self.profile_key[:12]}"
+
+
+class WorkoutSet(models.Model):
+    # Выполненный подход (plans.workouts). Таблица только дополняется: строки пишутся пачками
+    # из буфера и не изменяются. period - месяц тренировки: по нему строятся свёртки
+    # ExerciseProgress и удаляются старые записи. Упражнение может быть уже удалено
+    # или архивировано, поэтому без внешних ключей в БД и с копией названия
+    id_user = models.ForeignKey(CustomUser, on_delete=models.DO_NOTHING, db_constraint=False)
+    exercise = models.ForeignKey(Exercises, on_delete=models.DO_NOTHING, db_constraint=False)
+    exercise_name = models.CharField(max_length=25)
+    performed_at = models.DateTimeField()
+    period = models.DateField()
+    reps = models.PositiveIntegerField()
+    weight = models.FloatField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['id_user', 'period'], name='workout_set_user_period_idx'),
+            models.Index(fields=['created_at'], name='workout_set_created_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.id_user_id} | {self.exercise_name} | {self.performed_at}"
+
+
+class ExerciseProgress(models.Model):
+    # Свёртка WorkoutSet за месяц по пользователю и упражнению (команда rollup_workouts).
+    # rolled_through - граница created_at подходов, вошедших в свёртку
+    id_user = models.ForeignKey(CustomUser, on_delete=models.DO_NOTHING, db_constraint=False)
+    exercise_key = models.CharField(max_length=25)
+    exercise_name = models.CharField(max_length=25)
+    period = models.DateField()
+    sets = models.PositiveIntegerField(default=0)
+    reps = models.PositiveIntegerField(default=0)
+    volume = models.FloatField(default=0)
+    max_weight = models.FloatField(null=True, blank=True)
+    last_performed_at = models.DateTimeField()
+    rolled_through = models.DateTimeField(db_index=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['id_user', 'exercise_key', 'period'], name='exercise_progress_uniq'),
+        ]
+
+    def __str__(self):
+        return f"{self.id_user_id} | {self.exercise_name} | {self.period}"
+
+
+class WorkoutRollupState(models.Model):
+    # Граница created_at, до которой журнал шарда полностью свёрнут. Одна строка на шард,
+    # сдвигается только после успешного прохода rollup_workouts по всему шарду
+    rolled_through = models.DateTimeField()
+
+    def __str__(self):
+        return f"{self.rolled_through}"
+
+
+
 
 
 
@@ -128,4 +286,4 @@ class Exercises(models.Model):
 #     exercise = models.ForeignKey(Exercise, on_delete=models.CASCADE)
 #
 #     def __str__(self):
-#         return self
\ No newline at end of file
+#         return self
@@ -0,0 +1,517 @@
+from drf_spectacular.types import OpenApiTypes
+from drf_spectacular.utils import extend_schema, OpenApiExample, OpenApiResponse, OpenApiParameter
+
+from .serializers import PreferencesSerializer, PlanSerializer, PlanDetailSerializer
+from .views import PreferencesAPIView, GeneratePlanAPIView, TokenBudgetAPIView, ExerciseAutocompleteAPIView, \
+    PlanCalendarAPIView, PlanCalendarFeedAPIView, WorkoutSetsAPIView, WorkoutProgressAPIView
+
+# Описания OpenAPI для views приложения. Применяются хуком fit.schema.apply_view_schemas
+# только при генерации схемы, поэтому не строятся при импорте views.
+
+
+def apply():
+    extend_schema(
+        summary="Создать предпочтения",
+        description="Создаёт новый объект Preferences.",
+        parameters=[
+            OpenApiParameter(
+                name="Authorization",
+                description="Bearer access token для аутентификации",
+                required=True,
+                type=OpenApiTypes.STR,
+                location=OpenApiParameter.HEADER,
+                examples=[
+                    OpenApiExample(
+                        "Пример токена",
+                        summary="Bearer Token",
+                        value="Bearer eyJhbGciOiJIUzI1NiIsInR5..."
+                    )
+                ]
+            )
+        ],
+        request=PreferencesSerializer,
+        responses={
+            201: OpenApiResponse(
+                response=PreferencesSerializer,
+                description="Объект Preferences создан успешно."
+            ),
+            400: OpenApiResponse(
+                response=OpenApiTypes.OBJECT,
+                examples=[
+                    OpenApiExample(
+                        "Ошибка валидации",
+                        summary="Ошибка валидации данных",
+                        description="Предоставлены некорректные данные.",
+                        value={"error": "Invalid data"}
+                    )
+                ]
+            )
+        },
+        tags=['preferences']
+    )(PreferencesAPIView.post)
+
+    extend_schema(
+        summary="Получить предпочтения",
+        description="Возвращает объект Preferences по ID или список всех объектов, если ID не указан.",
+        parameters=[
+            OpenApiParameter(
+                name="Authorization",
+                description="Bearer access token для аутентификации",
+                required=True,
+                type=OpenApiTypes.STR,
+                location=OpenApiParameter.HEADER,
+                examples=[
+                    OpenApiExample(
+                        "Пример токена",
+                        summary="Bearer Token",
+                        value="Bearer eyJhbGciOiJIUzI1NiIsInR5..."
+                    )
+                ]
+            )
+        ],
+        responses={
+            200: OpenApiResponse(
+                response=PreferencesSerializer(many=True),
+                description="Успешное получение предпочтений."
+            ),
+            404: OpenApiResponse(
+                response=OpenApiTypes.OBJECT,
+                examples=[
+                    OpenApiExample(
+                        "Объект не найден",
+                        summary="Предпочтения не найдены",
+                        description="Указанный объект предпочтений отсутствует в базе данных.",
+                        value={"error": "Preferences not found"}
+                    )
+                ]
+            )
+        },
+        tags=['preferences']
+
+    )(PreferencesAPIView.get)
+
+    extend_schema(
+        summary="Обновить предпочтения",
+        description="Обновляет объект Preferences по ID.",
+        parameters=[
+            OpenApiParameter(
+                name="Authorization",
+                description="Bearer access token для аутентификации",
+                required=True,
+                type=OpenApiTypes.STR,
+                location=OpenApiParameter.HEADER,
+                examples=[
+                    OpenApiExample(
+                        "Пример токена",
+                        summary="Bearer Token",
+                        value="Bearer eyJhbGciOiJIUzI1NiIsInR5..."
+                    )
+                ]
+            )
+        ],
+        request=PreferencesSerializer,
+        responses={
+            200: OpenApiResponse(
+                response=PreferencesSerializer,
+                description="Предпочтения успешно обновлены."
+            ),
+            404: OpenApiResponse(
+                response=OpenApiTypes.OBJECT,
+                examples=[
+                    OpenApiExample(
+                        "Объект не найден",
+                        summary="Предпочтения не найдены",
+                        description="Указанный объект предпочтений отсутствует в базе данных.",
+                        value={"error": "Preferences not found"}
+                    )
+                ]
+            ),
+            400: OpenApiResponse(
+                response=OpenApiTypes.OBJECT,
+                examples=[
+                    OpenApiExample(
+                        "Ошибка валидации",
+                        summary="Некорректные данные",
+                        description="Предоставлены некорректные данные для обновления предпочтений.",
+                        value={"error": "Invalid data"}
+                    )
+                ]
+            )
+        },
+        tags=['preferences']
+    )(PreferencesAPIView.put)
+
+    extend_schema(
+        summary="Удаление предпочтений пользователя",
+        parameters=[
+            OpenApiParameter(
+                name="Authorization",
+                description="Bearer access token для аутентификации",
+                required=True,
+                type=OpenApiTypes.STR,
+                location=OpenApiParameter.HEADER,
+                examples=[
+                    OpenApiExample(
+                        "Пример токена",
+                        summary="Bearer Token",
+                        value="eyJhbGciOiJIUzI1NiIsInR5..."
+                    )
+                ]
+            )
+        ],
+        responses={
+            204: OpenApiResponse(
+                description="Удалено успешно.",
+            ),
+            404: OpenApiResponse(
+                description="Объект не найден.",
+                examples=[
+                    OpenApiExample(
+                        "Пример ошибки",
+                        summary="Объект отсутствует",
+                        value={"error": "Preferences not found"}
+                    )
+                ]
+            )
+        },
+        tags=['preferences']
+    )(PreferencesAPIView.delete)
+
+    extend_schema(
+        summary="Сгенерировать тренировочный план",
+        description=(
+            "Генерирует тренировочный план на основе предпочтений пользователя с использованием OpenAI."
+        ),
+        parameters=[
+            OpenApiParameter(
+                name="Authorization",
+                description="Bearer access token для аутентификации",
+                required=True,
+                type=OpenApiTypes.STR,
+                location=OpenApiParameter.HEADER,
+                examples=[
+                    OpenApiExample(
+                        "Пример токена",
+                        summary="Bearer Token",
+                        value="eyJhbGciOiJIUzI1NiIsInR5..."
+                    )
+                ]
+            )
+        ],
+        request=PreferencesSerializer,
+        responses={
+            201: PlanSerializer,
+            400: OpenApiExample(
+                "Ошибка валидации",
+                value={"error": "Invalid preferences data"}
+            ),
+            429: OpenApiResponse(
+                response=OpenApiTypes.OBJECT,
+                description="Дневной лимит токенов или генераций исчерпан, в budget - текущий расход."
+            ),
+            500: OpenApiExample(
+                "Ошибка сервера",
+                value={"error": "OpenAI error"}
+            ),
+        },
+        tags=['plan generation']
+    )(GeneratePlanAPIView.post)
+
+    extend_schema(
+        summary="Получить список сгенерированных планов",
+        description=(
+            "По `plan_pk` и/или `preferences_pk` возвращает полные планы. Без идентификаторов возвращает "
+            "краткий список всех планов пользователя, отсортированный по дате изменения. "
+            "С параметром `ids` возвращает несколько полных планов за один запрос."
+        ),
+        parameters=[
+            OpenApiParameter(
+                name="Authorization",
+                description="Bearer access token для аутентификации",
+                required=True,
+                type=OpenApiTypes.STR,
+                location=OpenApiParameter.HEADER,
+                examples=[
+                    OpenApiExample(
+                        "Пример токена",
+                        summary="Bearer Token",
+                        value="eyJhbGciOiJIUzI1NiIsInR5..."
+                    )
+                ]
+            ),
+            OpenApiParameter(
+                name="ids",
+                description="ID планов через запятую (не больше 20), только для `plan/`",
+                required=False,
+                type=OpenApiTypes.STR,
+                location=OpenApiParameter.QUERY,
+                examples=[
+                    OpenApiExample(
+                        "Несколько планов",
+                        summary="Пакетный запрос",
+                        value="1,2,3"
+                    )
+                ]
+            )
+        ],
+        responses={
+            200: PlanDetailSerializer(many=True),
+        },
+        tags=["plan generation"]
+    )(GeneratePlanAPIView.get)
+
+    extend_schema(
+        summary="Удалить план или все планы для предпочтений",
+        description=(
+                "Удаляет конкретный план по `plan_pk` и `preferences_pk`, все планы для указанных предпочтений "
+                "по `preferences_pk`, или все планы, если не указан `preferences_pk` и `plan_pk`."
+        ),
+        parameters=[
+            OpenApiParameter(
+                name="Authorization",
+                description="Bearer access token для аутентификации",
+                required=True,
+                type=OpenApiTypes.STR,
+                location=OpenApiParameter.HEADER,
+                examples=[
+                    OpenApiExample(
+                        "Пример токена",
+                        summary="Bearer Token",
+                        value="eyJhbGciOiJIUzI1NiIsInR5..."
+                    )
+                ]
+            )
+        ],
+        request=None,
+        responses={
+            200: OpenApiResponse(
+                response=OpenApiTypes.OBJECT,
+                examples=[
+                    OpenApiExample(
+                        "Успешное удаление плана",
+                        summary="Успешное удаление",
+                        description="План был успешно удалён.",
+                        value={"message": "План успешно удалён"}
+                    ),
+                    OpenApiExample(
+                        "Успешное удаление планов",
+                        summary="Успешное удаление всех планов",
+                        description="Все планы для указанных предпочтений были успешно удалены.",
+                        value={"message": "Планы успешно удалены"}
+                    )
+                ]
+            ),
+            404: OpenApiResponse(
+                response=OpenApiTypes.OBJECT,
+                examples=[
+                    OpenApiExample(
+                        "План не найден",
+                        summary="План не найден",
+                        description="Указанный план не найден в базе данных.",
+                        value={"error": "План не найден"}
+                    ),
+                    OpenApiExample(
+                        "Планы не найдены",
+                        summary="Планы не найдены",
+                        description="Для указанных предпочтений планы не найдены.",
+                        value={"error": "Планы для указанных предпочтений не найдены"}
+                    )
+                ]
+            ),
+            400: OpenApiResponse(
+                response=OpenApiTypes.OBJECT,
+                examples=[
+                    OpenApiExample(
+                        "Некорректный запрос",
+                        summary="Некорректный запрос",
+                        description="Не указаны идентификаторы предпочтений или плана.",
+                        value={"error": "Не указаны ID предпочтений или плана"}
+                    )
+                ]
+            )
+        },
+        tags=['plan generation']
+    )(GeneratePlanAPIView.delete)
+
+    extend_schema(
+        summary="Дневной бюджет генерации",
+        description="Расход токенов LLM и число генераций за сегодня, лимиты и время сброса. "
+                    "null в лимите - без ограничения.",
+        responses={
+            200: OpenApiResponse(
+                response=OpenApiTypes.OBJECT,
+                examples=[
+                    OpenApiExample(
+                        "Бюджет",
+                        value={
+                            "date": "2026-10-19", "tokens_used": 12400, "tokens_limit": 50000,
+                            "tokens_remaining": 37600, "generations_used": 6, "generations_limit": 20,
+                            "generations_remaining": 14, "resets_at": "2026-10-20T00:00:00+03:00",
+                        }
+                    )
+                ]
+            )
+        },
+        tags=['plan generation']
+    )(TokenBudgetAPIView.get)
+
+    extend_schema(
+        summary="Подсказки названий упражнений",
+        description="Названия упражнений из всех планов, начинающиеся с q (без учёта регистра), "
+                    "по убыванию частоты.",
+        parameters=[
+            OpenApiParameter(name="q", type=OpenApiTypes.STR, location=OpenApiParameter.QUERY, required=True,
+                             description="Начало названия"),
+            OpenApiParameter(name="limit", type=OpenApiTypes.INT, location=OpenApiParameter.QUERY,
+                             description="Число подсказок, по умолчанию 10, не больше 50"),
+        ],
+        responses={
+            200: OpenApiResponse(
+                response=OpenApiTypes.OBJECT,
+                examples=[
+                    OpenApiExample(
+                        "Подсказки",
+                        value={"results": [{"name": "Bench Press", "count": 412},
+                                           {"name": "Bent-over Row", "count": 230}]}
+                    )
+                ]
+            ),
+            400: OpenApiResponse(
+                response=OpenApiTypes.OBJECT,
+                examples=[OpenApiExample("Нет запроса", value={"error": "Не указан параметр q"})]
+            ),
+        },
+        tags=['plan generation']
+    )(ExerciseAutocompleteAPIView.get)
+
+    extend_schema(
+        summary="Календарь тренировок плана",
+        description="Дни недели плана, разложенные по датам программы (от starts_on на program_duration месяцев) "
+                    "в окне from..to включительно. По умолчанию - 28 дней с сегодняшнего, не больше 366. "
+                    "ical_url - подписанная ссылка на iCal-ленту для календарных приложений.",
+        parameters=[
+            OpenApiParameter(name="from", type=OpenApiTypes.DATE, location=OpenApiParameter.QUERY,
+                             description="Начало окна, по умолчанию сегодня"),
+            OpenApiParameter(name="to", type=OpenApiTypes.DATE, location=OpenApiParameter.QUERY,
+                             description="Конец окна включительно"),
+        ],
+        responses={
+            200: OpenApiResponse(
+                response=OpenApiTypes.OBJECT,
+                examples=[
+                    OpenApiExample(
+                        "Календарь",
+                        value={
+                            "plan": 5, "starts_on": "2026-10-19", "ends_on": "2027-04-18",
+                            "from": "2026-10-19", "to": "2026-10-25",
+                            "sessions": [{"date": "2026-10-19", "day": "Понедельник", "focus": "Нижняя часть тела",
+                                          "exercises": [{"id": 1, "name": "Приседания", "sets": "4", "reps": "6-8",
+                                                         "rest": "2-3 минуты", "notes": ""}]}],
+                            "ical_url": "https://example.com/api/v1/traning/calendar/1-5:7GZp0yEX.ics",
+                        }
+                    )
+                ]
+            ),
+            400: OpenApiResponse(
+                response=OpenApiTypes.OBJECT,
+                examples=[OpenApiExample("Неверное окно", value={"error": "Дата to раньше from"})]
+            ),
+            404: OpenApiResponse(
+                response=OpenApiTypes.OBJECT,
+                examples=[OpenApiExample("План не найден", value={"error": "План не найден"})]
+            ),
+        },
+        tags=['plan generation']
+    )(PlanCalendarAPIView.get)
+
+    extend_schema(
+        summary="iCal-лента плана",
+        description="Тренировки всей программы в формате iCalendar (text/calendar), отдаются потоком. "
+                    "Доступ по подписанной ссылке из ical_url, без авторизации. Поддерживаются "
+                    "If-None-Match и If-Modified-Since: неизменившийся план - 304 без тела.",
+        responses={
+            (200, 'text/calendar'): OpenApiTypes.STR,
+            304: OpenApiResponse(description="План не изменился"),
+            404: OpenApiResponse(
+                response=OpenApiTypes.OBJECT,
+                examples=[OpenApiExample("План не найден", value={"error": "План не найден"})]
+            ),
+        },
+        tags=['plan generation']
+    )(PlanCalendarFeedAPIView.get)
+
+    extend_schema(
+        summary="Запись выполненных подходов",
+        description="Пачка подходов по упражнениям планов пользователя (до 500 за запрос). Запись буферизуется "
+                    "и выполняется пачкой, поэтому ответ - 202: подходы появляются в истории в течение пары секунд. "
+                    "performed_at по умолчанию - время запроса. "
+                    "Поддерживается заголовок Idempotency-Key.",
+        request={
+            'application/json': {
+                'type': 'object',
+                'properties': {
+                    'sets': {
+                        'type': 'array',
+                        'items': {
+                            'type': 'object',
+                            'properties': {
+                                'exercise': {'type': 'integer'},
+                                'reps': {'type': 'integer'},
+                                'weight': {'type': 'number', 'nullable': True},
+                                'performed_at': {'type': 'string', 'format': 'date-time'},
+                            },
+                            'required': ['exercise', 'reps'],
+                        },
+                    },
+                },
+                'required': ['sets'],
+            }
+        },
+        examples=[
+            OpenApiExample(
+                "Подходы",
+                value={"sets": [{"exercise": 12, "reps": 8, "weight": 60, "performed_at": "2026-10-19T19:05:00+03:00"},
+                                {"exercise": 12, "reps": 8, "weight": 62.5}]},
+                request_only=True
+            )
+        ],
+        responses={
+            202: OpenApiResponse(
+                response=OpenApiTypes.OBJECT,
+                examples=[OpenApiExample("Принято", value={"accepted": 2})]
+            ),
+            400: OpenApiResponse(
+                response=OpenApiTypes.OBJECT,
+                examples=[OpenApiExample("Чужое упражнение",
+                                         value={"error": "Упражнения не найдены", "not_found": [77]})]
+            ),
+        },
+        tags=['workouts']
+    )(WorkoutSetsAPIView.post)
+
+    extend_schema(
+        summary="История упражнений по месяцам",
+        description="Подходы, повторы, объём (повторы x вес) и максимальный вес по упражнениям за последние "
+                    "months месяцев (по умолчанию 6, не больше 24). Упражнения с одинаковым названием "
+                    "из разных планов объединяются.",
+        parameters=[
+            OpenApiParameter(name="months", type=OpenApiTypes.INT, location=OpenApiParameter.QUERY,
+                             description="Число месяцев, включая текущий"),
+            OpenApiParameter(name="exercise", type=OpenApiTypes.STR, location=OpenApiParameter.QUERY,
+                             description="Название упражнения"),
+        ],
+        responses={
+            200: OpenApiResponse(
+                response=OpenApiTypes.OBJECT,
+                examples=[
+                    OpenApiExample(
+                        "История",
+                        value={"results": [{"exercise": "Приседания", "period": "2026-10-01", "sets": 12, "reps": 84,
+                                            "volume": 5460.0, "max_weight": 70.0,
+                                            "last_performed_at": "2026-10-19T19:05:00+03:00"}]}
+                    )
+                ]
+            )
+        },
+        tags=['workouts']
+    )(WorkoutProgressAPIView.get)
@@ -1,3 +1,4 @@
+from django.conf import settings
 from rest_framework import serializers
 from .models import Preferences, Plan, Exercises, Weekly_Schedule
 
@@ -47,6 +48,25 @@ class PlanDetailSerializer(serializers.ModelSerializer):
         model = Plan
         fields = ["id", "name", "description", "program_duration", "weekly_schedule"]
 
+    def to_representation(self, instance):
+        data = super().to_representation(instance)
+        if instance.archived:
+            # Архивный план: дни и упражнения восстанавливаются из сжатого документа
+            from .archive import load_schedule
+
+            data["weekly_schedule"] = load_schedule(instance.archive)
+        return data
+
+
+class PlanSummarySerializer(serializers.ModelSerializer):
+    preferences_id = serializers.IntegerField(source="id_preferences_id", read_only=True)
+    stale = serializers.BooleanField(read_only=True)
+
+    class Meta:
+        model = Plan
+        fields = ["id", "name", "program_duration", "preferences_id", "days_count", "exercises_count",
+                  "updated_at", "stale"]
+
 
 class PlanSerializer(serializers.ModelSerializer):
     weekly_schedule = WeeklyScheduleSerializer(many=True)
@@ -58,7 +78,11 @@ class PlanSerializer(serializers.ModelSerializer):
     def create(self, validated_data):
         weekly_schedule_data = validated_data.pop('weekly_schedule')
 
-        plan = Plan.objects.create(**validated_data)
+        plan = Plan.objects.create(
+            days_count=len(weekly_schedule_data),
+            exercises_count=sum(len(schedule_data['exercises']) for schedule_data in weekly_schedule_data),
+            **validated_data
+        )
 
         for schedule_data in weekly_schedule_data:
             exercises_data = schedule_data.pop('exercises')
@@ -71,3 +95,17 @@ class PlanSerializer(serializers.ModelSerializer):
         return plan
 
 
+class WorkoutSetInputSerializer(serializers.Serializer):
+    exercise = serializers.IntegerField(min_value=1)
+    reps = serializers.IntegerField(min_value=0, max_value=1000)
+    weight = serializers.FloatField(min_value=0, max_value=1000, required=False, allow_null=True)
+    performed_at = serializers.DateTimeField(required=False)
+
+    def validate_performed_at(self, value):
+        # Журнал старых месяцев удалён prune_workouts: свёртка по одному новому подходу затёрла бы историю
+        from .workouts import month_start, retention_start
+
+        months = settings.WORKOUT_LOG['RETENTION_MONTHS']
+        if months and month_start(value) < retention_start(months):
+            raise serializers.ValidationError(f"Подходы старше {months} мес. не принимаются")
+        return value
@@ -0,0 +1,181 @@
+import json
+import threading
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import transaction
+
+from fit.metrics import llm_duration, llm_errors, llm_tokens
+from fit.sharding import shard_for_user
+from .autocomplete import exercise_index
+from .models import Plan, Weekly_Schedule, Exercises
+
+
+def save_plan(plan_data, user, preferences):
+    # Весь план пишется одной транзакцией и пачками: блокировка на запись
+    # берётся один раз, а не на каждый день и упражнение. База - шард пользователя
+    db = shard_for_user(user.pk)
+    with transaction.atomic(using=db):
+        plan = Plan.objects.using(db).create(
+            name=plan_data["name"],
+            description=plan_data["description"],
+            program_duration=plan_data["program_duration"],
+            days_count=len(plan_data["weekly_schedule"]),
+            exercises_count=sum(len(day["exercises"]) for day in plan_data["weekly_schedule"]),
+            id_user=user,
+            id_preferences=preferences,
+            preferences_fingerprint=preferences.fingerprint,
+        )
+
+        schedules = Weekly_Schedule.objects.using(db).bulk_create([
+            Weekly_Schedule(plan_id=plan, day=day["day"], focus=day["focus"])
+            for day in plan_data["weekly_schedule"]
+        ])
+
+        Exercises.objects.using(db).bulk_create([
+            Exercises(
+                weekly_schedule_id=schedule,
+                name=exercise["name"],
+                sets=exercise["sets"],
+                reps=exercise["reps"],
+                rest=exercise["rest"],
+                notes=exercise["notes"]
+            )
+            for schedule, day in zip(schedules, plan_data["weekly_schedule"])
+            for exercise in day["exercises"]
+        ])
+        names = [exercise["name"] for day in plan_data["weekly_schedule"] for exercise in day["exercises"]]
+        transaction.on_commit(lambda: exercise_index.add(names), using=db)
+
+    return plan
+
+
+_llm_client = None
+_llm_client_lock = threading.Lock()
+
+
+def get_llm_client():
+    # SDK openai (вместе с httpx и pydantic) импортируется при первой генерации плана,
+    # а не при загрузке views: это заметная часть времени старта воркера
+    global _llm_client
+    if _llm_client is None:
+        with _llm_client_lock:
+            if _llm_client is None:
+                from openai import OpenAI
+
+                _llm_client = OpenAI(api_key=settings.OPENAI_API_KEY, base_url=settings.OPENAI_BASE_URL)
+    return _llm_client
+
+
+def create_completion(client, **kwargs):
+    # Запрос к LLM с метриками: длительность, токены и ошибки по типу
+    model = kwargs.get("model", "")
+    start = time.perf_counter()
+    try:
+        completion = client.chat.completions.create(**kwargs)
+    except Exception as e:
+        llm_duration.observe(time.perf_counter() - start, model=model, outcome="error")
+        llm_errors.inc(model=model, error=type(e).__name__)
+        raise
+    llm_duration.observe(time.perf_counter() - start, model=model, outcome="ok")
+    if completion.usage is not None:
+        llm_tokens.inc(completion.usage.prompt_tokens, model=model, kind="prompt")
+        llm_tokens.inc(completion.usage.completion_tokens, model=model, kind="completion")
+    return completion
+
+
+def build_plan_prompt(preferences):
+    return f"""
+        Составь тренировочный план на русском языке в виде корректного JSON. Формат:
+        {{
+            "name": "string",
+            "description": "string",
+            "program_duration": "integer",
+            "weekly_schedule": [
+                {{
+                    "day": "string",
+                    "focus": "string",
+                    "exercises": [
+                        {{
+                            "name": "string",
+                            "sets": "string",
+                            "reps": "string",
+                            "rest": "string",
+                            "notes": "string"
+                        }}
+                    ]
+                }}
+            ]
+        }}
+        Пример:
+        {{
+            "name": "План набора массы",
+            "description": "Шестимесячная программа для набора мышечной массы.",
+            "program_duration": 6,
+            "weekly_schedule": [
+                {{
+                    "day": "Понедельник",
+                    "focus": "Нижняя часть тела",
+                    "exercises": [
+                        {{
+                            "name": "Приседания",
+                            "sets": "4",
+                            "reps": "6-8",
+                            "rest": "2-3 минуты",
+                            "notes": "Сосредоточьтесь на технике и глубине, используйте рабочий вес."
+                        }}
+                    ]
+                }}
+            ]
+        }}
+        Пол: {preferences.get_gender_display() or "не указан"}.
+        Возраст: {preferences.age or "не указан"}.
+        Рост: {preferences.height or "не указан"} см.
+        Вес: {preferences.weight or "не указан"} кг.
+        Уровень подготовки: {preferences.get_experience_level_display() or "не указан"}.
+        Цель: {preferences.goal or "не указана"}.
+        Частота тренировок: {preferences.workout_frequency or "не указана"} раза в неделю.
+        Предпочтения: {preferences.prefer_workout_ex or "не указаны"}.
+        Программа рассчитана на {preferences.time_of_program or "не указано"} месяцев.
+
+        Ответ должен быть строго в формате JSON без пояснений, комментариев, текста или примеров. Только корректный JSON.
+        """
+
+
+def generate_plan_data(preferences, model="gpt-4o"):
+    # Возвращает план и usage ответа; json.JSONDecodeError, если модель ответила не JSON
+    completion = create_completion(
+        get_llm_client(),
+        model=model,
+        messages=[
+            {"role": "system", "content": "You are a good sport coach with large background."},
+            {"role": "user", "content": build_plan_prompt(preferences)}
+        ],
+        max_tokens=1500,
+        temperature=0.6,
+    )
+    plan_text = completion.choices[0].message.content
+    cleaned_text = plan_text.replace("```json", "").replace("```", "").strip()
+    return json.loads(cleaned_text), completion.usage
+
+
+_generations = 0
+_generations_lock = threading.Lock()
+
+
+@contextmanager
+def track_generation():
+    # Число генераций, идущих сейчас в этом процессе: по нему определяется пик нагрузки
+    global _generations
+    with _generations_lock:
+        _generations += 1
+    try:
+        yield
+    finally:
+        with _generations_lock:
+            _generations -= 1
+
+
+def generations_in_flight():
+    return _generations
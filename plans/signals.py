@@ -0,0 +1,26 @@
+from django.db.models.signals import pre_delete
+from django.dispatch import receiver
+
+from authUser.models import CustomUser
+from fit.sharding import reserve_id_ranges, shard_for_user
+from .models import ExerciseProgress, Plan, Preferences, WorkoutSet
+from .workouts import workout_log
+
+
+@receiver(pre_delete, sender=Preferences)
+def delete_preferences_plans(sender, instance, **kwargs):
+    # Каскад из основной базы не доходит до шарда с планами
+    Plan.objects.for_user(instance.id_user_id).filter(id_preferences_id=instance.pk).delete()
+
+
+@receiver(pre_delete, sender=CustomUser)
+def delete_user_workouts(sender, instance, **kwargs):
+    # Журнал и свёртки лежат в шарде без внешних ключей; подходы из буфера процесса пишутся раньше удаления
+    workout_log.flush()
+    db = shard_for_user(instance.pk)
+    WorkoutSet.objects.using(db).filter(id_user_id=instance.pk).delete()
+    ExerciseProgress.objects.using(db).filter(id_user_id=instance.pk).delete()
+
+
+def reserve_plan_id_ranges(sender, using, **kwargs):
+    reserve_id_ranges(using)
@@ -0,0 +1,63 @@
+import hashlib
+import json
+
+from django.conf import settings
+
+from fit.metrics import plan_template_lookups
+from .models import GENERATION_FIELDS, PlanTemplate, Preferences
+from .services import generations_in_flight
+
+PROFILE_FIELDS = GENERATION_FIELDS
+
+
+def normalize_text(value):
+    return ' '.join(str(value).split()).lower()
+
+
+def round_to(value, step):
+    return max(step, int(round(float(value) / step) * step))
+
+
+def make_profile(values):
+    # Типовой профиль: возраст, рост и вес округляются до шага из PLAN_TEMPLATES,
+    # текстовые поля приводятся к нижнему регистру без лишних пробелов
+    steps = settings.PLAN_TEMPLATES
+    return {
+        'gender': values['gender'],
+        'age': round_to(values['age'], steps['AGE_STEP']),
+        'height': round_to(values['height'], steps['HEIGHT_STEP']),
+        'weight': round_to(values['weight'], steps['WEIGHT_STEP']),
+        'goal': normalize_text(values['goal']),
+        'experience_level': values['experience_level'],
+        'workout_frequency': int(values['workout_frequency']),
+        'prefer_workout_ex': normalize_text(values['prefer_workout_ex']),
+        'time_of_program': int(values['time_of_program']),
+    }
+
+
+def profile_from_preferences(preferences):
+    return make_profile({field: getattr(preferences, field) for field in PROFILE_FIELDS})
+
+
+def profile_key(profile):
+    return hashlib.sha256(json.dumps(profile, sort_keys=True, ensure_ascii=False).encode()).hexdigest()
+
+
+def profile_preferences(profile):
+    # Несохранённый объект Preferences для построения промпта
+    return Preferences(**profile)
+
+
+def should_serve_template():
+    mode = settings.PLAN_TEMPLATES['SERVE']
+    if mode == 'always':
+        return True
+    if mode == 'peak':
+        return generations_in_flight() >= settings.PLAN_TEMPLATES['PEAK_IN_FLIGHT']
+    return False
+
+
+def find_template(preferences):
+    template = PlanTemplate.objects.filter(profile_key=profile_key(profile_from_preferences(preferences))).first()
+    plan_template_lookups.inc(result='hit' if template is not None else 'miss')
+    return template
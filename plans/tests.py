@@ -1,3 +1,1074 @@
-from django.test import TestCase
+import gzip
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import timedelta
+from io import StringIO
+from pathlib import Path
+from types import SimpleNamespace
+from unittest import mock
 
-# Create your tests here.
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import MiddlewareNotUsed
+from django.core.management import CommandError, call_command
+from django.db import router
+from django.db.models import F, QuerySet
+from django.http import HttpResponse
+from django.utils import timezone
+from django.test import Client, RequestFactory, SimpleTestCase, TestCase, override_settings
+from openai import OpenAI
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+
+from bench.fake_openai import CANNED_PLAN, FakeOpenAIServer
+from fit.metrics import registry
+from fit import schema
+from fit.querylog import QueryInstrumentationMiddleware
+from fit.routers import ReplicaRouter, ReplicaRoutingMiddleware, check_replica_cache
+from authUser.models import CustomUser
+from authUser.revocation import revocation_list
+from authUser.tokens import ClaimsRefreshToken
+from plans.autocomplete import exercise_index
+from plans.budget import token_budget
+from plans.calendar_feed import add_months
+from plans.models import (ExerciseProgress, Exercises, Plan, PlanArchive, PlanTemplate, Preferences, TokenUsage,
+                          Weekly_Schedule, WorkoutSet)
+from plans.services import create_completion, save_plan
+from plans.workouts import WorkoutLog, month_start, prune_workouts, rollup_workouts, workout_log
+
+BASE_DIR = Path(settings.BASE_DIR)
+
+SEED = """
+import django
+django.setup()
+from authUser.models import CustomUser
+from plans.models import Preferences
+user = CustomUser.objects.create_user("loadtest", "loadtest@example.com", "Passw0rd!")
+Preferences.objects.create(id_user=user, gender="M", age=30, height=180, weight=80, goal="mass",
+                           workout_frequency=3, prefer_workout_ex="barbell", time_of_program=3)
+"""
+
+WRITER = """
+import sys
+import time
+import django
+django.setup()
+from django.db import transaction
+from authUser.models import CustomUser
+from plans.models import Preferences
+from plans.services import save_plan
+user = CustomUser.objects.get(nickname="loadtest")
+plan = {
+    "name": "Load test", "description": "", "program_duration": 3,
+    "weekly_schedule": [
+        {"day": day, "focus": "Full body", "exercises": [
+            {"name": f"Exercise {i}", "sets": "3", "reps": "10", "rest": "60s", "notes": ""} for i in range(6)
+        ]} for day in ("Monday", "Wednesday", "Friday")
+    ],
+}
+# Все процессы стартуют одновременно, чтобы записи действительно пересекались
+time.sleep(max(0.0, float(sys.argv[2]) - time.time()))
+for _ in range(int(sys.argv[1])):
+    # Чтение и запись в одной транзакции, как при генерации плана
+    with transaction.atomic():
+        preferences = Preferences.objects.get(id_user=user)
+        save_plan(plan, user, preferences)
+"""
+
+COUNT = """
+import django
+django.setup()
+from plans.models import Plan, Exercises
+print(Plan.objects.count(), Exercises.objects.count())
+"""
+
+
+class SQLiteConcurrentPlanWritesTests(SimpleTestCase):
+    # Несколько процессов одновременно пишут планы в один файл SQLite
+    # с профилем DB_PROFILE=sqlite: ни одна запись не должна упасть с "database is locked"
+
+    processes = 8
+    plans_per_process = 25
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.env = {
+            **os.environ,
+            'DJANGO_SETTINGS_MODULE': 'fit.settings',
+            'DB_PROFILE': 'sqlite',
+            'DB_NAME': os.path.join(self.tmp.name, 'concurrency.sqlite3'),
+            'OPEN_API_KEY': os.environ.get('OPEN_API_KEY', 'test'),
+        }
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def run_python(self, code, *args):
+        return subprocess.run([sys.executable, '-c', code, *args], cwd=BASE_DIR, env=self.env,
+                              capture_output=True, text=True, timeout=300)
+
+    def test_parallel_plan_creation(self):
+        migrate = subprocess.run([sys.executable, 'manage.py', 'migrate', '--verbosity', '0'], cwd=BASE_DIR,
+                                 env=self.env, capture_output=True, text=True, timeout=300)
+        self.assertEqual(migrate.returncode, 0, migrate.stderr[-2000:])
+        self.assertEqual(self.run_python(SEED).returncode, 0)
+
+        start_at = time.time() + 3
+        writers = []
+        for i in range(self.processes):
+            # stderr в файл: переполненный pipe остановил бы процесс посреди транзакции
+            log = open(os.path.join(self.tmp.name, f'writer-{i}.log'), 'w+')
+            writers.append((log, subprocess.Popen(
+                [sys.executable, '-c', WRITER, str(self.plans_per_process), str(start_at)], cwd=BASE_DIR,
+                env=self.env, stdout=subprocess.DEVNULL, stderr=log
+            )))
+        for log, writer in writers:
+            with log:
+                writer.wait(timeout=300)
+                log.seek(0)
+                self.assertEqual(writer.returncode, 0, log.read()[-2000:])
+
+        counts = self.run_python(COUNT).stdout.split()[-2:]
+        total = self.processes * self.plans_per_process
+        self.assertEqual(counts, [str(total), str(total * 18)])
+
+
+SHARD_SEED = """
+import django
+django.setup()
+from django.conf import settings
+from authUser.models import CustomUser
+from fit.sharding import shard_aliases, shard_for_user
+from plans.models import Plan, Preferences
+from plans.services import save_plan
+plan = {
+    "name": "Shard test", "description": "", "program_duration": 3,
+    "weekly_schedule": [
+        {"day": day, "focus": "Full body", "exercises": [
+            {"name": f"Exercise {i}", "sets": "3", "reps": "10", "rest": "60s", "notes": ""} for i in range(2)
+        ]} for day in ("Monday", "Friday")
+    ],
+}
+for i in range(12):
+    user = CustomUser.objects.create_user(f"shard{i}", f"shard{i}@example.com", "Passw0rd!")
+    preferences = Preferences.objects.create(id_user=user, gender="M", age=30, height=180, weight=80, goal="mass",
+                                             workout_frequency=3, prefer_workout_ex="barbell", time_of_program=3)
+    for _ in range(2):
+        saved = save_plan(plan, user, preferences)
+        db = shard_for_user(user.pk)
+        assert saved._state.db == db, (saved._state.db, db)
+        index = shard_aliases().index(db)
+        assert index * settings.SHARDING["ID_STEP"] < saved.pk, (db, saved.pk)
+        assert saved.weekly_schedule_set.count() == 2
+    assert Plan.objects.for_user(user.pk).count() == 2
+# Удаление предпочтений убирает планы пользователя из его шарда
+Preferences.objects.filter(id_user__nickname="shard0").delete()
+user = CustomUser.objects.get(nickname="shard0")
+assert not Plan.objects.for_user(user.pk).exists()
+print(*(Plan.objects.using(db).count() for db in shard_aliases()))
+"""
+
+SHARD_STATE = """
+import json
+import django
+django.setup()
+from django.db.models import Count
+from authUser.models import CustomUser
+from fit.sharding import shard_aliases, shard_for_user
+from plans.models import Plan
+state = {}
+for user in CustomUser.objects.filter(nickname__startswith="shard"):
+    plans = Plan.objects.for_user(user.pk).annotate(exercises=Count("weekly_schedule__exercises")).order_by("pk")
+    state[user.nickname] = [[plan.pk, plan.updated_at.isoformat(), plan.exercises] for plan in plans]
+for db in shard_aliases():
+    for user_id in Plan.objects.using(db).values_list("id_user_id", flat=True):
+        assert shard_for_user(user_id) == db, (user_id, db)
+print(json.dumps(state, sort_keys=True))
+"""
+
+
+class PlanListTests(TestCase):
+    def setUp(self):
+        self.user = CustomUser.objects.create_user("lister", "lister@example.com", "Passw0rd!")
+        self.preferences = Preferences.objects.create(
+            id_user=self.user, gender="M", age=30, height=180, weight=80, goal="mass",
+            workout_frequency=3, prefer_workout_ex="barbell", time_of_program=1)
+        self.plans = [
+            save_plan(plan_with_exercises(*[f"Exercise {i}" for i in range(count)]), self.user, self.preferences)
+            for count in (1, 2, 3)
+        ]
+        self.api = APIClient()
+        self.api.force_authenticate(self.user)
+        self.url = '/api/v1/traning/plan/'
+
+    def test_summary_list_counters(self):
+        results = self.api.get(self.url).json()["results"]
+        self.assertEqual([(r["id"], r["days_count"], r["exercises_count"]) for r in results],
+                         [(plan.pk, 1, count) for plan, count in reversed(list(zip(self.plans, (1, 2, 3))))])
+        self.assertNotIn("weekly_schedule", results[0])
+
+    def test_plan_reads_go_through_replica_router(self):
+        # Реплики в тестовой базе нет: роутер только записывает свой выбор, запрос идёт в default
+        routed = []
+        db_for_read = ReplicaRouter.db_for_read
+
+        def spy(router, model, **hints):
+            routed.append((model._meta.label_lower, db_for_read(router, model, **hints)))
+
+        with override_settings(READ_REPLICA={**settings.READ_REPLICA, 'ALIAS': 'replica'}), \
+                mock.patch.object(ReplicaRouter, 'db_for_read', spy):
+            self.assertEqual(self.api.get(self.url).status_code, 200)
+            self.assertEqual(self.api.get(f'{self.url}{self.plans[0].pk}/info/').status_code, 200)
+        self.assertEqual({alias for label, alias in routed if label == 'plans.plan'}, {'replica'})
+
+    def test_batch_keeps_order_and_filters_foreign_ids(self):
+        other = CustomUser.objects.create_user("other", "other@example.com", "Passw0rd!")
+        foreign = save_plan(plan_with_exercises("Squat"), other, Preferences.objects.create(
+            id_user=other, gender="F", age=25, height=165, weight=55, goal="cardio",
+            workout_frequency=2, prefer_workout_ex="bike", time_of_program=1))
+        ids = [self.plans[2].pk, foreign.pk, self.plans[0].pk, self.plans[2].pk]
+        data = self.api.get(self.url, {'ids': ','.join(map(str, ids))}).json()
+        self.assertEqual([plan["id"] for plan in data["results"]], [self.plans[2].pk, self.plans[0].pk])
+        self.assertEqual(len(data["results"][0]["weekly_schedule"][0]["exercises"]), 3)
+        self.assertEqual(data["not_found"], [foreign.pk])
+
+        self.assertEqual(self.api.get(self.url, {'ids': '1,x'}).status_code, 400)
+        self.assertEqual(self.api.get(self.url, {'ids': ','}).status_code, 400)
+        self.assertEqual(self.api.get(self.url, {'ids': ','.join(map(str, range(1, 22)))}).status_code, 400)
+        self.assertEqual(self.api.get(self.url, {'ids': ','.join(map(str, range(1, 21)))}).status_code, 200)
+
+    def test_admin_move_updates_both_plans(self):
+        admin = CustomUser.objects.create_superuser("root", "root@example.com", "Passw0rd!")
+        client = Client()
+        client.force_login(admin)
+        source, target = self.plans[2], self.plans[0]
+        day = source.weekly_schedule_set.get()
+        response = client.post(f'/admin/plans/weekly_schedule/{day.pk}/change/',
+                               {'plan_id': target.pk, 'day': day.day, 'focus': day.focus})
+        self.assertEqual(response.status_code, 302)
+        source.refresh_from_db()
+        target.refresh_from_db()
+        self.assertEqual((source.days_count, source.exercises_count), (0, 0))
+        self.assertEqual((target.days_count, target.exercises_count), (2, 4))
+
+        exercise = Exercises.objects.filter(weekly_schedule_id=day).first()
+        other_day = Weekly_Schedule.objects.filter(plan_id=self.plans[1]).get()
+        response = client.post(f'/admin/plans/exercises/{exercise.pk}/change/', {
+            'weekly_schedule_id': other_day.pk, 'name': exercise.name, 'sets': exercise.sets,
+            'reps': exercise.reps, 'rest': exercise.rest, 'notes': exercise.notes})
+        self.assertEqual(response.status_code, 302)
+        target.refresh_from_db()
+        self.plans[1].refresh_from_db()
+        self.assertEqual(target.exercises_count, 3)
+        self.assertEqual(self.plans[1].exercises_count, 3)
+
+
+class PlanShardingTests(SimpleTestCase):
+    # Планы в нескольких файлах SQLite (PLAN_SHARDS): запись в шард пользователя,
+    # свои диапазоны id, перенос пользователей командой rebalance_shards
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.env = {
+            **os.environ,
+            'DJANGO_SETTINGS_MODULE': 'fit.settings',
+            'DB_PROFILE': 'sqlite',
+            'DB_NAME': os.path.join(self.tmp.name, 'shards.sqlite3'),
+            'PLAN_SHARDS': '3',
+            'OPEN_API_KEY': os.environ.get('OPEN_API_KEY', 'test'),
+        }
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def run_manage(self, *args):
+        result = subprocess.run([sys.executable, 'manage.py', *args], cwd=BASE_DIR, env=self.env,
+                                capture_output=True, text=True, timeout=300)
+        self.assertEqual(result.returncode, 0, result.stderr[-2000:])
+        return result.stdout
+
+    def run_python(self, code):
+        result = subprocess.run([sys.executable, '-c', code], cwd=BASE_DIR, env=self.env,
+                                capture_output=True, text=True, timeout=300)
+        self.assertEqual(result.returncode, 0, result.stderr[-2000:])
+        return result.stdout
+
+    def migrate(self, shards):
+        self.env['PLAN_SHARDS'] = str(shards)
+        for alias in ['default'] + [f'plans_{i}' for i in range(1, shards)]:
+            self.run_manage('migrate', '--database', alias, '--verbosity', '0')
+
+    def test_plans_are_spread_and_rebalanced(self):
+        self.migrate(3)
+        counts = [int(count) for count in self.run_python(SHARD_SEED).split()]
+        self.assertEqual(sum(counts), 22)
+        self.assertEqual(len([count for count in counts if count]), 3)
+        before = json.loads(self.run_python(SHARD_STATE))
+
+        self.migrate(4)
+        self.assertIn('users to move', self.run_manage('rebalance_shards', '--dry-run'))
+        self.assertIn('Moved', self.run_manage('rebalance_shards'))
+        after = json.loads(self.run_python(SHARD_STATE))
+        self.assertEqual(after, before)
+        self.assertIn('Moved 0 plans of 0 users', self.run_manage('rebalance_shards'))
+
+
+@override_settings(READ_REPLICA={'ALIAS': 'replica', 'APPS': ('plans', 'authUser'), 'PIN_SECONDS': 5})
+class ReplicaRoutingTests(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+        self.factory = RequestFactory()
+        self.middleware = ReplicaRoutingMiddleware(self.route)
+
+    def route(self, request):
+        response = HttpResponse()
+        response.alias = router.db_for_read(Plan)
+        return response
+
+    def auth(self, user_id):
+        token = AccessToken()
+        token['user_id'] = user_id
+        return {'HTTP_AUTHORIZATION': f'Bearer {token}'}
+
+    def test_safe_requests_read_from_replica(self):
+        response = self.middleware(self.factory.get('/api/v1/traning/plan/', **self.auth(1)))
+        self.assertEqual(response.alias, 'replica')
+
+    def test_writes_use_primary(self):
+        response = self.middleware(self.factory.post('/api/v1/traning/plan/', **self.auth(1)))
+        self.assertEqual(response.alias, 'default')
+
+    def test_user_reads_own_writes(self):
+        self.middleware(self.factory.post('/api/v1/traning/preferences/', **self.auth(1)))
+        own = self.middleware(self.factory.get('/api/v1/traning/preferences/', **self.auth(1)))
+        other = self.middleware(self.factory.get('/api/v1/traning/preferences/', **self.auth(2)))
+        self.assertEqual(own.alias, 'default')
+        self.assertEqual(other.alias, 'replica')
+
+    def test_replica_requires_shared_cache(self):
+        self.assertEqual([error.id for error in check_replica_cache()], ['fit.E001'])
+        with mock.patch('fit.routers.is_shared_cache', return_value=True):
+            self.assertEqual(check_replica_cache(), [])
+
+    def test_other_apps_stay_on_primary(self):
+        from django.contrib.sessions.models import Session
+
+        self.middleware = ReplicaRoutingMiddleware(lambda request: HttpResponse(router.db_for_read(Session)))
+        response = self.middleware(self.factory.get('/admin/'))
+        self.assertEqual(response.content, b'default')
+
+
+class QueryInstrumentationTests(TestCase):
+    def make_middleware(self, **options):
+        settings_value = {**settings.QUERY_INSTRUMENTATION, **options}
+        with override_settings(QUERY_INSTRUMENTATION=settings_value):
+            return QueryInstrumentationMiddleware(lambda request: HttpResponse(Plan.objects.count()))
+
+    def test_request_summary_and_server_timing(self):
+        middleware = self.make_middleware(ENABLED=True, SLOW_QUERY_MS=0)
+        with self.assertLogs('fit.requests', 'INFO') as requests_log, \
+                self.assertLogs('fit.slow_queries', 'WARNING') as slow_log:
+            response = middleware(RequestFactory().get('/api/v1/traning/plan/'))
+        self.assertRegex(response['Server-Timing'], r'^db;dur=[\d.]+;desc="1 queries", app;dur=[\d.]+$')
+        self.assertIn('"db_queries": 1', requests_log.output[0])
+        self.assertIn('plans_plan', slow_log.output[0])
+
+    def test_disabled(self):
+        with self.assertRaises(MiddlewareNotUsed):
+            self.make_middleware(ENABLED=False)
+
+
+class ProfilingTests(TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        override = override_settings(PROFILING={**settings.PROFILING, 'DIR': self.tmp.name, 'MAX_PROFILES': 2})
+        override.enable()
+        self.addCleanup(override.disable)
+        self.staff = CustomUser.objects.create_user('admin1', 'admin1@example.com', 'Passw0rd!', is_staff=True)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(self.staff)}')
+
+    def test_staff_request_is_profiled(self):
+        response = self.client.get('/api/v1/traning/plan/', HTTP_X_PROFILE='1')
+        profile_id = response['X-Profile-Id']
+        self.assertEqual(sorted(p.name for p in Path(self.tmp.name).iterdir()),
+                         [f'{profile_id}.prof', f'{profile_id}.tracemalloc', f'{profile_id}.txt'])
+
+        download = self.client.get(f'/api/v1/profiles/{profile_id}/txt/')
+        self.assertEqual(download.status_code, 200)
+        self.assertIn(b'/api/v1/traning/plan/', b''.join(download.streaming_content))
+
+    def test_retention(self):
+        for _ in range(3):
+            self.client.get('/api/v1/traning/plan/?_profile=1')
+        self.assertEqual(len(list(Path(self.tmp.name).glob('*.prof'))), 2)
+        self.assertEqual(len(self.client.get('/api/v1/profiles/').json()), 2)
+
+    def test_regular_users_are_not_profiled(self):
+        user = CustomUser.objects.create_user('user1', 'user1@example.com', 'Passw0rd!')
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(user)}')
+        response = self.client.get('/api/v1/traning/plan/', HTTP_X_PROFILE='1')
+        self.assertFalse(response.has_header('X-Profile-Id'))
+        self.assertEqual(list(Path(self.tmp.name).iterdir()), [])
+        self.assertEqual(self.client.get('/api/v1/profiles/').status_code, 403)
+
+    def test_refresh_and_revoked_tokens_are_not_profiled(self):
+        refresh = ClaimsRefreshToken.for_user(self.staff)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {refresh}')
+        self.assertFalse(self.client.get('/api/v1/traning/plan/', HTTP_X_PROFILE='1').has_header('X-Profile-Id'))
+
+        access = refresh.access_token
+        access.blacklist()
+        self.addCleanup(revocation_list.clear)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {access}')
+        self.assertFalse(self.client.get('/api/v1/traning/plan/', HTTP_X_PROFILE='1').has_header('X-Profile-Id'))
+        self.assertEqual(list(Path(self.tmp.name).iterdir()), [])
+
+
+class FakeCompletions:
+    def __init__(self, error=None):
+        self.error = error
+
+    def create(self, **kwargs):
+        if self.error:
+            raise self.error
+        return SimpleNamespace(usage=SimpleNamespace(prompt_tokens=120, completion_tokens=800))
+
+
+class MetricsTests(TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        override = override_settings(METRICS={**settings.METRICS, 'DIR': self.tmp.name, 'TOKEN': ''})
+        override.enable()
+        self.addCleanup(override.disable)
+        registry._values = {}
+        registry._pid = None
+
+    def scrape(self):
+        response = self.client.get('/metrics')
+        self.assertEqual(response.status_code, 200)
+        return response.content.decode()
+
+    def test_request_metrics_are_summed_across_processes(self):
+        # Файл "другого воркера" с одним запросом к тому же view
+        key = '["token_obtain_pair", "POST", "401"]'
+        Path(self.tmp.name, '99999-deadbeef.json').write_text(f'{{"http_requests_total": {{{json.dumps(key)}: 2}}}}')
+
+        self.client.post('/api/v1/auth/login/', {'nickname': 'nobody', 'password': 'x'}, content_type='application/json')
+        body = self.scrape()
+        self.assertIn('http_requests_total{view="token_obtain_pair",method="POST",status="401"} 3', body)
+        self.assertIn('http_request_duration_seconds_count{view="token_obtain_pair",method="POST"} 1', body)
+        self.assertIn('http_request_db_seconds_bucket{view="token_obtain_pair",le="+Inf"} 1', body)
+
+    def test_llm_metrics(self):
+        create_completion(SimpleNamespace(chat=SimpleNamespace(completions=FakeCompletions())), model="gpt-4o")
+        with self.assertRaises(TimeoutError):
+            create_completion(SimpleNamespace(chat=SimpleNamespace(completions=FakeCompletions(TimeoutError()))),
+                              model="gpt-4o")
+        body = self.scrape()
+        self.assertIn('llm_tokens_total{model="gpt-4o",kind="completion"} 800', body)
+        self.assertIn('llm_errors_total{model="gpt-4o",error="TimeoutError"} 1', body)
+        self.assertIn('llm_request_duration_seconds_count{model="gpt-4o",outcome="ok"} 1', body)
+
+    def test_flush_without_values_writes_nothing(self):
+        registry.flush()
+        self.assertEqual(list(Path(self.tmp.name).iterdir()), [])
+
+    def test_dead_process_files_are_compacted(self):
+        key = '["token_obtain_pair", "POST", "401"]'
+        for name in ('99998-deadbeef.json', '99999-deadbeef.json'):
+            Path(self.tmp.name, name).write_text(f'{{"http_requests_total": {{{json.dumps(key)}: 2}}}}')
+        for _ in range(2):
+            with mock.patch('fit.metrics.os.kill', side_effect=ProcessLookupError):
+                body = self.scrape()
+            self.assertIn('http_requests_total{view="token_obtain_pair",method="POST",status="401"} 4', body)
+        self.assertFalse(Path(self.tmp.name, '99998-deadbeef.json').exists())
+        self.assertTrue(Path(self.tmp.name, 'archive.json').exists())
+
+    @override_settings(METRICS={**settings.METRICS, 'TOKEN': 'secret'})
+    def test_token_required(self):
+        self.assertEqual(self.client.get('/metrics').status_code, 403)
+
+
+class FakeOpenAIServerTests(SimpleTestCase):
+    def test_openai_client_against_fake_server(self):
+        server = FakeOpenAIServer(latency=0.01).start()
+        self.addCleanup(server.stop)
+        client = OpenAI(api_key='test', base_url=server.base_url, max_retries=0)
+
+        completion = create_completion(client, model="gpt-4o", messages=[{"role": "user", "content": "план"}])
+        content = completion.choices[0].message.content.replace("```json", "").replace("```", "").strip()
+        self.assertEqual(json.loads(content), CANNED_PLAN)
+        self.assertGreater(completion.usage.completion_tokens, 0)
+
+
+class ColdStartImportTests(SimpleTestCase):
+    # Загрузка URLconf (то, что делает воркер при старте) не должна тянуть SDK openai и описания схемы
+    lazy_modules = {'openai', 'httpx', 'dotenv', 'plans.schema', 'authUser.schema'}
+
+    def test_urlconf_import_is_lazy(self):
+        result = subprocess.run(
+            [sys.executable, '-X', 'importtime', '-c', 'import django; django.setup(); import fit.urls'],
+            cwd=BASE_DIR, env={**os.environ, 'DJANGO_SETTINGS_MODULE': 'fit.settings'},
+            capture_output=True, text=True, timeout=120,
+        )
+        self.assertEqual(result.returncode, 0, result.stderr[-2000:])
+        imported = {
+            line.rsplit('|', 1)[1].strip()
+            for line in result.stderr.splitlines() if line.startswith('import time:')
+        }
+        self.assertIn('plans.views', imported)
+        self.assertEqual(imported & self.lazy_modules, set())
+
+
+class CachedSchemaTests(SimpleTestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        override = override_settings(SCHEMA_CACHE={'DIR': self.tmp.name, 'CODE_VERSION': 'test-1'})
+        override.enable()
+        self.addCleanup(override.disable)
+        schema._documents.clear()
+
+    def test_schema_is_built_once_and_revalidated_by_etag(self):
+        with mock.patch.object(schema, 'build_schema_files', wraps=schema.build_schema_files) as build:
+            first = self.client.get('/api/v1/schema/', HTTP_ACCEPT='application/json')
+            second = self.client.get('/api/v1/schema/', HTTP_ACCEPT='application/json')
+        self.assertEqual(build.call_count, 1)
+        self.assertEqual(first.content, second.content)
+        self.assertIn('/api/v1/traning/plan/', json.loads(first.content)['paths'])
+        self.assertTrue(Path(self.tmp.name, 'schema-test-1.yaml.gz').exists())
+
+        cached = self.client.get('/api/v1/schema/', HTTP_ACCEPT='application/json', HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(cached.status_code, 304)
+
+    def test_gzip(self):
+        plain = self.client.get('/api/v1/schema/')
+        compressed = self.client.get('/api/v1/schema/', HTTP_ACCEPT_ENCODING='gzip, br')
+        self.assertEqual(compressed['Content-Encoding'], 'gzip')
+        self.assertEqual(gzip.decompress(compressed.content), plain.content)
+        self.assertEqual(compressed['ETag'], plain['ETag'])
+
+    def test_new_code_version_rebuilds(self):
+        call_command('build_schema', stdout=StringIO())
+        with override_settings(SCHEMA_CACHE={'DIR': self.tmp.name, 'CODE_VERSION': 'test-2'}):
+            call_command('build_schema', stdout=StringIO())
+        self.assertEqual(sorted(p.name for p in Path(self.tmp.name).iterdir()),
+                         ['schema-test-2.json', 'schema-test-2.json.gz', 'schema-test-2.yaml', 'schema-test-2.yaml.gz'])
+
+
+class RouteScopedMiddlewareTests(TestCase):
+    def test_admin_keeps_sessions_and_csrf(self):
+        CustomUser.objects.create_superuser('root1', 'root1@example.com', 'Passw0rd!')
+        client = Client(enforce_csrf_checks=True)
+        login_page = client.get('/admin/login/')
+        self.assertEqual(login_page['X-Frame-Options'], 'DENY')
+        csrf_token = login_page.cookies['csrftoken'].value
+
+        rejected = client.post('/admin/login/', {'username': 'root1', 'password': 'Passw0rd!'})
+        self.assertEqual(rejected.status_code, 403)
+        response = client.post('/admin/login/', {'username': 'root1', 'password': 'Passw0rd!',
+                                                 'csrfmiddlewaretoken': csrf_token, 'next': '/admin/'})
+        self.assertRedirects(response, '/admin/')
+        self.assertEqual(client.get('/admin/').status_code, 200)
+
+    def test_api_skips_session_stack(self):
+        user = CustomUser.objects.create_user('api1', 'api1@example.com', 'Passw0rd!')
+        client = APIClient(enforce_csrf_checks=True)
+        client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(user)}')
+        response = client.put('/api/v1/auth/current-user/', {'first_name': 'A', 'last_name': 'B'}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(response.has_header('X-Frame-Options'))
+        self.assertNotIn('Cookie', response.get('Vary', ''))
+        self.assertEqual(response.cookies, {})
+
+
+class FakePlanClient:
+    def __init__(self):
+        self.calls = 0
+        self.chat = SimpleNamespace(completions=self)
+
+    def create(self, **kwargs):
+        self.calls += 1
+        return SimpleNamespace(
+            choices=[SimpleNamespace(message=SimpleNamespace(content=json.dumps(CANNED_PLAN, ensure_ascii=False)))],
+            usage=SimpleNamespace(prompt_tokens=400, completion_tokens=900),
+        )
+
+
+class PlanTemplateTests(TestCase):
+    def setUp(self):
+        self.client_llm = FakePlanClient()
+        patcher = mock.patch('plans.services.get_llm_client', return_value=self.client_llm)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        cache.clear()
+        self.addCleanup(token_budget.clear)
+        for i, age in reversed(list(enumerate((30, 31, 44)))):
+            user = CustomUser.objects.create_user(f"tpl{i}", f"tpl{i}@example.com", "Passw0rd!")
+            # 30 и 31 год с разным регистром цели попадают в один профиль
+            self.preferences = Preferences.objects.create(
+                id_user=user, gender="M", age=age, height=181, weight=79, goal="Масса " if i else "масса",
+                workout_frequency=3, prefer_workout_ex="штанга", time_of_program=3)
+
+    def pregenerate(self, *args):
+        out = StringIO()
+        call_command('pregenerate_plans', '--concurrency', '2', *args, stdout=out, stderr=StringIO())
+        return out.getvalue()
+
+    def test_dry_run_estimates_cost(self):
+        out = self.pregenerate('--dry-run', '--min-count', '1')
+        self.assertIn("Profiles: 2, already generated: 0, to generate: 2", out)
+        self.assertIn("Estimated cost: $", out)
+        self.assertFalse(PlanTemplate.objects.exists())
+
+    def test_pregeneration_is_resumable(self):
+        self.pregenerate()
+        template = PlanTemplate.objects.get()
+        self.assertEqual(template.profile["age"], 30)
+        self.assertEqual(template.plan_data, CANNED_PLAN)
+        self.assertEqual(template.completion_tokens, 900)
+
+        out = self.pregenerate('--min-count', '1')
+        self.assertIn("already generated: 1, to generate: 1", out)
+        self.assertEqual(PlanTemplate.objects.count(), 2)
+        self.assertEqual(self.client_llm.calls, 2)
+
+    def test_generation_served_from_template(self):
+        self.pregenerate()
+        api = APIClient()
+        api.force_authenticate(self.preferences.id_user)
+        url = f'/api/v1/traning/preferences/{self.preferences.pk}/plan/'
+
+        response = api.post(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(response.has_header('X-Plan-Source'))
+        self.assertEqual(self.client_llm.calls, 2)
+
+        with override_settings(PLAN_TEMPLATES={**settings.PLAN_TEMPLATES, 'SERVE': 'always'}):
+            response = api.post(url + '?force=1')
+        self.assertEqual(response['X-Plan-Source'], 'template')
+        self.assertEqual(response.json()["plan"], CANNED_PLAN)
+        self.assertEqual(self.client_llm.calls, 2)
+        self.assertEqual(Plan.objects.filter(id_user=self.preferences.id_user).count(), 2)
+
+
+class PlanArchiveTests(TestCase):
+    def setUp(self):
+        self.user = CustomUser.objects.create_user("archive", "archive@example.com", "Passw0rd!")
+        self.preferences = Preferences.objects.create(
+            id_user=self.user, gender="F", age=25, height=165, weight=58, goal="сила",
+            workout_frequency=3, prefer_workout_ex="гантели", time_of_program=3)
+        self.cold = save_plan(CANNED_PLAN, self.user, self.preferences)
+        self.hot = save_plan(CANNED_PLAN, self.user, self.preferences)
+        Plan.objects.filter(pk=self.cold.pk).update(updated_at=self.cold.updated_at - timedelta(days=200))
+        self.api = APIClient()
+        self.api.force_authenticate(self.user)
+
+    def test_archived_plan_reads_unchanged(self):
+        detail = f'/api/v1/traning/preferences/{self.preferences.pk}/plan/{self.cold.pk}/info/'
+        batch = f'/api/v1/traning/plan/?ids={self.cold.pk},{self.hot.pk}'
+        before = self.api.get(detail).json(), self.api.get(batch).json()
+
+        out = StringIO()
+        call_command('archive_plans', '--days', '180', stdout=out)
+        self.assertIn("Archived 1 plans", out.getvalue())
+        self.assertTrue(Plan.objects.get(pk=self.cold.pk).archived)
+        self.assertEqual(PlanArchive.objects.get().codec, 'zlib')
+        self.assertFalse(Weekly_Schedule.objects.filter(plan_id=self.cold).exists())
+        self.assertFalse(Exercises.objects.filter(weekly_schedule_id__plan_id=self.cold).exists())
+        self.assertTrue(Weekly_Schedule.objects.filter(plan_id=self.hot).exists())
+
+        self.assertEqual((self.api.get(detail).json(), self.api.get(batch).json()), before)
+        summary = self.api.get('/api/v1/traning/plan/').json()["results"]
+        self.assertEqual([plan["exercises_count"] for plan in summary], [18, 18])
+
+    def test_zstd_requires_package(self):
+        with mock.patch.dict(sys.modules, {'zstandard': None}):
+            with self.assertRaises(CommandError):
+                call_command('archive_plans', '--codec', 'zstd', stdout=StringIO())
+        self.assertFalse(PlanArchive.objects.exists())
+
+
+class PreferencesFingerprintTests(TestCase):
+    def setUp(self):
+        self.client_llm = FakePlanClient()
+        patcher = mock.patch('plans.services.get_llm_client', return_value=self.client_llm)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        cache.clear()
+        self.addCleanup(token_budget.clear)
+        user = CustomUser.objects.create_user("fingerprint", "fingerprint@example.com", "Passw0rd!")
+        self.preferences = Preferences.objects.create(
+            id_user=user, gender="M", age=35, height=175, weight=82, goal="похудение",
+            workout_frequency=4, prefer_workout_ex="бег", time_of_program=2)
+        self.api = APIClient()
+        self.api.force_authenticate(user)
+        self.generate_url = f'/api/v1/traning/preferences/{self.preferences.pk}/plan/'
+        self.info_url = f'/api/v1/traning/preferences/{self.preferences.pk}/info/'
+
+    def stale_flags(self):
+        return [plan["stale"] for plan in self.api.get('/api/v1/traning/plan/').json()["results"]]
+
+    def test_unchanged_preferences_reuse_plan(self):
+        self.assertEqual(self.api.post(self.generate_url).status_code, 200)
+        # Те же значения (и лишние пробелы) не меняют отпечаток
+        self.api.put(self.info_url, {"goal": " похудение ", "height": 175.0}, format='json')
+        self.assertEqual(self.stale_flags(), [False])
+
+        response = self.api.post(self.generate_url)
+        self.assertEqual(response['X-Plan-Source'], 'existing')
+        self.assertEqual(response.json()["plan"]["name"], CANNED_PLAN["name"])
+        self.assertEqual(self.client_llm.calls, 1)
+        self.assertEqual(Plan.objects.count(), 1)
+
+    def test_changed_preferences_mark_plan_stale(self):
+        self.api.post(self.generate_url)
+        self.api.put(self.info_url, {"workout_frequency": 5}, format='json')
+        self.assertEqual(self.stale_flags(), [True])
+
+        response = self.api.post(self.generate_url)
+        self.assertFalse(response.has_header('X-Plan-Source'))
+        self.assertEqual(self.client_llm.calls, 2)
+        self.assertEqual(self.stale_flags(), [False, True])
+
+
+@override_settings(TOKEN_BUDGET={'DAILY_TOKENS': 3000, 'DAILY_GENERATIONS': 0, 'FLUSH_INTERVAL': 3600,
+                                'LOCAL_TTL': 2})
+class TokenBudgetTests(TestCase):
+    def setUp(self):
+        self.client_llm = FakePlanClient()
+        patcher = mock.patch('plans.services.get_llm_client', return_value=self.client_llm)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        cache.clear()
+        self.addCleanup(token_budget.clear)
+        self.user = CustomUser.objects.create_user("budget", "budget@example.com", "Passw0rd!")
+        self.preferences = Preferences.objects.create(
+            id_user=self.user, gender="F", age=28, height=168, weight=60, goal="выносливость",
+            workout_frequency=3, prefer_workout_ex="велосипед", time_of_program=1)
+        self.api = APIClient()
+        self.api.force_authenticate(self.user)
+        self.url = f'/api/v1/traning/preferences/{self.preferences.pk}/plan/?force=1'
+
+    def test_quota_is_enforced_without_queries(self):
+        # 1300 токенов на генерацию (FakePlanClient): третья превышает лимит 3000
+        for _ in range(3):
+            self.assertEqual(self.api.post(self.url).status_code, 200)
+        with self.assertNumQueries(0):
+            self.assertTrue(token_budget.exceeded(self.user.id))
+        response = self.api.post(self.url)
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(self.client_llm.calls, 3)
+
+        budget = self.api.get('/api/v1/traning/budget/').json()
+        self.assertEqual(budget["tokens_used"], 3900)
+        self.assertEqual(budget["tokens_remaining"], 0)
+        self.assertIsNone(budget["generations_limit"])
+
+    @mock.patch('plans.budget.is_shared_cache', return_value=True)
+    def test_usage_is_flushed_in_batches(self, shared):
+        self.api.post(self.url)
+        self.api.post(self.url)
+        self.assertFalse(TokenUsage.objects.exists())
+
+        token_budget.flush()
+        usage = TokenUsage.objects.get()
+        self.assertEqual((usage.prompt_tokens, usage.completion_tokens, usage.generations), (800, 1800, 2))
+
+        # После потери кэша расход восстанавливается из БД
+        cache.clear()
+        self.assertEqual(token_budget.usage(self.user.id), (2600, 2))
+
+    def test_usage_is_shared_between_processes_without_shared_cache(self):
+        self.api.post(self.url)
+        self.assertEqual(TokenUsage.objects.get().generations, 1)
+        # Счётчик в памяти процесса живёт LOCAL_TTL, затем перечитывается из БД с расходом других воркеров
+        with self.settings(TOKEN_BUDGET={**settings.TOKEN_BUDGET, 'LOCAL_TTL': 0.05}):
+            cache.clear()
+            self.assertEqual(token_budget.usage(self.user.id), (1300, 1))
+            TokenUsage.objects.update(prompt_tokens=F('prompt_tokens') + 1000)
+            time.sleep(0.1)
+            self.assertEqual(token_budget.usage(self.user.id), (2300, 1))
+
+
+def plan_with_exercises(*names):
+    return {
+        "name": "Autocomplete", "description": "", "program_duration": 1,
+        "weekly_schedule": [{"day": "Monday", "focus": "Full body", "exercises": [
+            {"name": name, "sets": "3", "reps": "10", "rest": "60s", "notes": ""} for name in names
+        ]}],
+    }
+
+
+class ExerciseAutocompleteTests(TestCase):
+    def setUp(self):
+        exercise_index.clear()
+        self.addCleanup(exercise_index.clear)
+        self.user = CustomUser.objects.create_user("suggest", "suggest@example.com", "Passw0rd!")
+        self.preferences = Preferences.objects.create(
+            id_user=self.user, gender="M", age=30, height=180, weight=80, goal="mass",
+            workout_frequency=3, prefer_workout_ex="barbell", time_of_program=1)
+        save_plan(plan_with_exercises("Bench Press", "Bent-over Row", "Squat"), self.user, self.preferences)
+        save_plan(plan_with_exercises("bench  press", "Bent-over Row", "Bench Dip"), self.user, self.preferences)
+        self.api = APIClient()
+        self.api.force_authenticate(self.user)
+
+    def test_prefix_ranked_by_frequency(self):
+        response = self.api.get('/api/v1/traning/exercises/autocomplete/', {'q': 'BEN'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["results"], [
+            {"name": "Bench Press", "count": 2},
+            {"name": "Bent-over Row", "count": 2},
+            {"name": "Bench Dip", "count": 1},
+        ])
+        self.assertEqual(exercise_index.suggest('bench d', 10), [{"name": "Bench Dip", "count": 1}])
+        self.assertEqual(exercise_index.suggest('x', 10), [])
+        self.assertEqual(len(self.api.get('/api/v1/traning/exercises/autocomplete/',
+                                          {'q': 'be', 'limit': 1}).json()["results"]), 1)
+        self.assertEqual(self.api.get('/api/v1/traning/exercises/autocomplete/').status_code, 400)
+
+    def test_new_plans_update_index_without_queries(self):
+        exercise_index.suggest('s', 10)
+        with self.captureOnCommitCallbacks(execute=True):
+            save_plan(plan_with_exercises("Squat", "Shoulder Press"), self.user, self.preferences)
+        with self.assertNumQueries(0):
+            self.assertEqual(exercise_index.suggest('s', 10), [
+                {"name": "Squat", "count": 2},
+                {"name": "Shoulder Press", "count": 1},
+            ])
+
+
+    def test_stale_index_is_rebuilt_once_in_background(self):
+        exercise_index.suggest('s', 10)
+        exercise_index._built_at -= settings.EXERCISE_AUTOCOMPLETE['REBUILD_INTERVAL']
+        started, release = threading.Event(), threading.Event()
+
+        def slow_build():
+            started.set()
+            release.wait(2)
+
+        with mock.patch.object(exercise_index, 'build', side_effect=slow_build) as build:
+            # Пока идёт перестройка, запросы отвечают по старому индексу
+            with self.assertNumQueries(0):
+                for _ in range(3):
+                    self.assertEqual(exercise_index.suggest('s', 10), [{"name": "Squat", "count": 1}])
+            self.assertTrue(started.wait(2))
+            release.set()
+            while exercise_index._rebuilding:
+                time.sleep(0.01)
+        self.assertEqual(build.call_count, 1)
+
+class PlanCalendarTests(TestCase):
+    def setUp(self):
+        self.user = CustomUser.objects.create_user("calendar", "calendar@example.com", "Passw0rd!")
+        self.preferences = Preferences.objects.create(
+            id_user=self.user, gender="M", age=30, height=180, weight=80, goal="mass",
+            workout_frequency=3, prefer_workout_ex="barbell", time_of_program=1)
+        plan_data = {
+            "name": "Календарь", "description": "", "program_duration": 1,
+            "weekly_schedule": [
+                {"day": "Понедельник", "focus": "Ноги, ягодицы", "exercises": [
+                    {"name": "Приседания", "sets": "4", "reps": "6-8", "rest": "2 минуты",
+                     "notes": "Сосредоточьтесь на технике и глубине; используйте рабочий вес"}]},
+                {"day": "Среда", "focus": "Спина", "exercises": []},
+                {"day": "Friday", "focus": "Грудь", "exercises": []},
+                {"day": "День отдыха", "focus": "Растяжка", "exercises": []},
+            ],
+        }
+        self.plan = save_plan(plan_data, self.user, self.preferences)
+        # Понедельник, программа на месяц: 2026-01-05 .. 2026-02-04
+        Plan.objects.filter(pk=self.plan.pk).update(starts_on="2026-01-05")
+        self.api = APIClient()
+        self.api.force_authenticate(self.user)
+        self.url = f'/api/v1/traning/plan/{self.plan.pk}/calendar/'
+
+    def test_window_is_expanded_into_dates(self):
+        data = self.api.get(self.url, {'from': '2026-01-01', 'to': '2026-01-11'}).json()
+        self.assertEqual([(s["date"], s["focus"]) for s in data["sessions"]], [
+            ("2026-01-05", "Ноги, ягодицы"), ("2026-01-07", "Спина"), ("2026-01-09", "Грудь")])
+        self.assertEqual(data["sessions"][0]["exercises"][0]["name"], "Приседания")
+        self.assertEqual((data["starts_on"], data["ends_on"]), ("2026-01-05", "2026-02-04"))
+
+        tail = self.api.get(self.url, {'from': '2026-02-01', 'to': '2026-03-01'}).json()["sessions"]
+        self.assertEqual([s["date"] for s in tail], ["2026-02-02", "2026-02-04"])
+
+        self.assertEqual(self.api.get(self.url, {'from': '2026-01-10', 'to': '2026-01-01'}).status_code, 400)
+        self.assertEqual(self.api.get(self.url, {'from': 'завтра'}).status_code, 400)
+        self.assertEqual(self.api.get(self.url, {'from': '2026-01-01', 'to': '2027-06-01'}).status_code, 400)
+
+        other = CustomUser.objects.create_user("stranger", "stranger@example.com", "Passw0rd!")
+        self.api.force_authenticate(other)
+        self.assertEqual(self.api.get(self.url).status_code, 404)
+
+    def test_ical_feed_with_conditional_get(self):
+        feed_url = self.api.get(self.url).json()["ical_url"].replace('http://testserver', '')
+        feed = Client()
+        response = feed.get(feed_url, HTTP_ACCEPT='text/calendar')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        self.assertEqual(response['Content-Type'], 'text/calendar; charset=utf-8')
+        body = b''.join(response.streaming_content).decode()
+        # 5 понедельников, 5 сред и 4 пятницы программы
+        self.assertEqual(body.count('BEGIN:VEVENT'), 14)
+        self.assertIn('DTSTART;VALUE=DATE:20260105', body)
+        self.assertIn('SUMMARY:Ноги\\, ягодицы', body)
+        self.assertTrue(all(len(line.encode()) <= 75 for line in body.split('\r\n')))
+        self.assertTrue(body.endswith('END:VCALENDAR\r\n'))
+
+        with self.assertNumQueries(1):
+            cached = feed.get(feed_url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(cached.status_code, 304)
+        self.assertEqual(feed.get(feed_url, HTTP_IF_MODIFIED_SINCE=response['Last-Modified']).status_code, 304)
+
+        time.sleep(0.01)
+        Plan.objects.get(pk=self.plan.pk).update_counters()
+        self.assertEqual(feed.get(feed_url, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 200)
+        self.assertEqual(feed.get(feed_url.replace('.ics', 'x.ics')).status_code, 404)
+
+
+@override_settings(WORKOUT_LOG={**settings.WORKOUT_LOG, 'BUFFER_SIZE': 1000, 'FLUSH_INTERVAL': 60, 'ROLLUP_GRACE': 0})
+class WorkoutLogTests(TestCase):
+    def setUp(self):
+        # Буфер сбрасывается явно: фоновый поток писал бы мимо транзакции теста
+        override = override_settings(WORKOUT_LOG={**settings.WORKOUT_LOG, 'FLUSH_THREAD': False})
+        override.enable()
+        self.addCleanup(override.disable)
+        workout_log.flush()
+        self.addCleanup(workout_log.clear)
+        self.user = CustomUser.objects.create_user("lifter", "lifter@example.com", "Passw0rd!")
+        preferences = Preferences.objects.create(
+            id_user=self.user, gender="M", age=30, height=180, weight=80, goal="mass",
+            workout_frequency=3, prefer_workout_ex="barbell", time_of_program=1)
+        plan = save_plan(plan_with_exercises("Приседания", "Жим лёжа"), self.user, preferences)
+        self.squat, self.bench = Exercises.objects.filter(weekly_schedule_id__plan_id=plan).order_by("pk")
+        self.api = APIClient()
+        self.api.force_authenticate(self.user)
+        self.url = '/api/v1/traning/workouts/sets/'
+
+    def test_sets_are_buffered_and_written_in_bulk(self):
+        sets = [
+            {"exercise": self.squat.pk, "reps": 8, "weight": 60},
+            {"exercise": self.squat.pk, "reps": 6, "weight": 70},
+            {"exercise": self.bench.pk, "reps": 10},
+        ]
+        response = self.api.post(self.url, {"sets": sets}, format='json')
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response.json(), {"accepted": 3})
+        self.assertEqual(WorkoutSet.objects.count(), 0)
+        with self.assertNumQueries(1):
+            workout_log.flush()
+        self.assertEqual(list(WorkoutSet.objects.order_by("pk").values_list("exercise_name", "reps")),
+                         [("Приседания", 8), ("Приседания", 6), ("Жим лёжа", 10)])
+
+        other = CustomUser.objects.create_user("other", "other@example.com", "Passw0rd!")
+        self.api.force_authenticate(other)
+        response = self.api.post(self.url, {"sets": sets}, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()["not_found"], [self.squat.pk, self.bench.pk])
+        self.assertEqual(self.api.post(self.url, {"sets": []}, format='json').status_code, 400)
+        self.assertEqual(self.api.post(self.url, {"sets": [{"exercise": self.squat.pk, "reps": -1}]},
+                                       format='json').status_code, 400)
+
+    def test_rollups_keep_history_after_pruning(self):
+        now = timezone.now()
+        earlier = now - timedelta(days=40)
+        self.api.post(self.url, {"sets": [
+            {"exercise": self.squat.pk, "reps": 5, "weight": 100, "performed_at": earlier.isoformat()},
+            {"exercise": self.squat.pk, "reps": 5, "weight": 110, "performed_at": earlier.isoformat()},
+            {"exercise": self.squat.pk, "reps": 8, "weight": 80},
+        ]}, format='json')
+        workout_log.flush()
+        self.assertEqual(rollup_workouts(), 2)
+        self.assertEqual(rollup_workouts(), 0)
+        old = ExerciseProgress.objects.get(period=month_start(earlier))
+        self.assertEqual((old.sets, old.reps, old.volume, old.max_weight), (2, 10, 1050.0, 110.0))
+
+        # Ещё не свёрнутый подход попадает в историю из журнала
+        time.sleep(0.01)
+        self.api.post(self.url, {"sets": [{"exercise": self.squat.pk, "reps": 8, "weight": 85}]}, format='json')
+        results = self.api.get('/api/v1/traning/workouts/progress/', {'exercise': 'приседания'}).json()["results"]
+        self.assertEqual([(r["period"], r["sets"], r["max_weight"]) for r in results], [
+            (month_start(now).isoformat(), 2, 85.0), (month_start(earlier).isoformat(), 2, 110.0)])
+
+        self.assertEqual(prune_workouts(0, now=now), 2)
+        self.assertFalse(WorkoutSet.objects.filter(period=month_start(earlier)).exists())
+        results = self.api.get('/api/v1/traning/workouts/progress/').json()["results"]
+        self.assertEqual([(r["exercise"], r["sets"]) for r in results], [("Приседания", 2), ("Приседания", 2)])
+
+    def test_buffer_is_flushed_without_new_writes(self):
+        log = WorkoutLog()
+        flushed = threading.Event()
+        with self.settings(WORKOUT_LOG={**settings.WORKOUT_LOG, 'FLUSH_THREAD': True, 'FLUSH_INTERVAL': 0.05}), \
+                mock.patch.object(log, 'flush', side_effect=flushed.set):
+            log.record([])
+            flushed.clear()
+            self.assertTrue(flushed.wait(2))
+
+    def test_interrupted_rollup_is_repeated(self):
+        other = CustomUser.objects.create_user("lifter2", "lifter2@example.com", "Passw0rd!")
+        other_plan = save_plan(plan_with_exercises("Приседания"), other, Preferences.objects.create(
+            id_user=other, gender="M", age=30, height=180, weight=80, goal="mass",
+            workout_frequency=3, prefer_workout_ex="barbell", time_of_program=1))
+        other_api = APIClient()
+        other_api.force_authenticate(other)
+        other_api.post(self.url, {"sets": [{"exercise": Exercises.objects.get(
+            weekly_schedule_id__plan_id=other_plan).pk, "reps": 5, "weight": 100}]}, format='json')
+        self.api.post(self.url, {"sets": [{"exercise": self.squat.pk, "reps": 5, "weight": 100}]}, format='json')
+        workout_log.flush()
+
+        # Первый месяц свёрнут, на втором проход падает
+        bulk_create = QuerySet.bulk_create
+        calls = []
+
+        def failing_bulk_create(queryset, *args, **kwargs):
+            calls.append(1)
+            if len(calls) > 1:
+                raise RuntimeError("rollup failed")
+            return bulk_create(queryset, *args, **kwargs)
+
+        later = timezone.now() + timedelta(minutes=5)
+        with mock.patch.object(QuerySet, 'bulk_create', failing_bulk_create), self.assertRaises(RuntimeError):
+            rollup_workouts(now=later)
+        self.assertEqual(ExerciseProgress.objects.count(), 1)
+
+        # История не удваивает уже свёрнутый месяц и видит несвёрнутый
+        for api in (self.api, other_api):
+            results = api.get('/api/v1/traning/workouts/progress/').json()["results"]
+            self.assertEqual([r["sets"] for r in results], [1])
+        self.assertEqual(prune_workouts(0, now=later + timedelta(days=62)), 0)
+
+        self.assertEqual(rollup_workouts(now=later), 2)
+        self.assertEqual(ExerciseProgress.objects.count(), 2)
+        self.assertEqual(rollup_workouts(now=later), 0)
+
+    def test_sets_older_than_retention_are_rejected(self):
+        old = add_months(month_start(timezone.now()), -2)
+        with self.settings(WORKOUT_LOG={**settings.WORKOUT_LOG, 'RETENTION_MONTHS': 2}):
+            response = self.api.post(self.url, {"sets": [
+                {"exercise": self.squat.pk, "reps": 5, "performed_at": f"{old.isoformat()}T12:00:00Z"}]}, format='json')
+            self.assertEqual(response.status_code, 202)
+            response = self.api.post(self.url, {"sets": [
+                {"exercise": self.squat.pk, "reps": 5, "performed_at": f"{add_months(old, -1).isoformat()}T12:00:00Z"},
+            ]}, format='json')
+            self.assertEqual(response.status_code, 400)
+            self.assertIn("performed_at", response.json()[0])
+            with self.assertRaises(CommandError):
+                call_command('rollup_workouts', '--retention-months', '1', stdout=StringIO())
+
+    def test_deleting_user_removes_workouts(self):
+        self.api.post(self.url, {"sets": [{"exercise": self.squat.pk, "reps": 5, "weight": 100}]}, format='json')
+        workout_log.flush()
+        rollup_workouts(now=timezone.now() + timedelta(minutes=5))
+        self.api.post(self.url, {"sets": [{"exercise": self.squat.pk, "reps": 6, "weight": 90}]}, format='json')
+        self.assertEqual(ExerciseProgress.objects.filter(id_user_id=self.user.pk).count(), 1)
+
+        self.assertEqual(self.api.delete('/api/v1/auth/current-user/').status_code, 200)
+        self.assertFalse(WorkoutSet.objects.filter(id_user_id=self.user.pk).exists())
+        self.assertFalse(ExerciseProgress.objects.filter(id_user_id=self.user.pk).exists())
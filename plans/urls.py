@@ -1,5 +1,6 @@
 from django.urls import path
-from .views import PreferencesAPIView, GeneratePlanAPIView
+from .views import PreferencesAPIView, GeneratePlanAPIView, TokenBudgetAPIView, ExerciseAutocompleteAPIView, \
+    PlanCalendarAPIView, PlanCalendarFeedAPIView, WorkoutSetsAPIView, WorkoutProgressAPIView
 
 urlpatterns = [
     path('preferences/', PreferencesAPIView.as_view(), name='preferences-list'),
@@ -9,5 +10,11 @@ urlpatterns = [
          name='preferences|generate-plan-detail'),
     path('plan/', GeneratePlanAPIView.as_view(), name='generate-plan-list'),
     path('plan/<int:plan_pk>/info/', GeneratePlanAPIView.as_view(), name='generate-plan-detail'),
+    path('plan/<int:plan_pk>/calendar/', PlanCalendarAPIView.as_view(), name='plan-calendar'),
+    path('calendar/<str:token>.ics', PlanCalendarFeedAPIView.as_view(), name='plan-calendar-feed'),
+    path('workouts/sets/', WorkoutSetsAPIView.as_view(), name='workout-sets'),
+    path('workouts/progress/', WorkoutProgressAPIView.as_view(), name='workout-progress'),
+    path('budget/', TokenBudgetAPIView.as_view(), name='token-budget'),
+    path('exercises/autocomplete/', ExerciseAutocompleteAPIView.as_view(), name='exercise-autocomplete'),
 
 ]
\ No newline at end of file
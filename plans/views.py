@@ -1,33 +1,34 @@
-import os
 import json
 
 from django_filters.rest_framework import DjangoFilterBackend
-from dotenv import load_dotenv
-from drf_spectacular.types import OpenApiTypes
-from openai import OpenAI
 from django.conf import settings
-from datetime import datetime, timedelta
+from django.http import StreamingHttpResponse
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+from datetime import date, timedelta
 from rest_framework.filters import OrderingFilter, SearchFilter
 
 from .filters import PreferencesFilter
 from rest_framework.pagination import PageNumberPagination
 from rest_framework.parsers import JSONParser
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.permissions import AllowAny, IsAuthenticated
 from rest_framework.renderers import JSONRenderer
 from rest_framework.views import APIView
 from rest_framework.response import Response
-from rest_framework import status, viewsets
+from rest_framework import status
 from rest_framework.viewsets import ModelViewSet
-from .models import Preferences, Plan, Exercises, Weekly_Schedule
-from .serializers import PreferencesSerializer, PlanSerializer, ExerciseSerializer, WeeklyScheduleSerializer, \
-    PlanDetailSerializer
-from drf_spectacular.utils import extend_schema, OpenApiExample, OpenApiResponse, OpenApiParameter
-
-load_dotenv()
-
-client = OpenAI(
-    api_key=settings.OPENAI_API_KEY
-)
+from fit.sharding import shard_for_user
+from .models import Preferences, Plan, Exercises, WorkoutSet
+from .autocomplete import exercise_index
+from .calendar_feed import (add_months, feed_etag, feed_token, iter_ical, iter_sessions, load_plan_schedule,
+                            plan_period, read_feed_token)
+from .budget import token_budget
+from .services import generate_plan_data, save_plan, track_generation
+from .templates import find_template, should_serve_template
+from .workouts import exercise_history, month_start, workout_log
+from .serializers import PreferencesSerializer, PlanDetailSerializer, PlanSummarySerializer, WorkoutSetInputSerializer
 
 
 class CustomPagination(PageNumberPagination):
@@ -36,6 +37,12 @@ class CustomPagination(PageNumberPagination):
     max_page_size = 10
 
 
+class PlanSummaryPagination(PageNumberPagination):
+    page_size = 20
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+
+
 class PreferencesViewSet(ModelViewSet):
     queryset = Preferences.objects.all().order_by('id')  # Добавляем сортировку
     serializer_class = PreferencesSerializer
@@ -52,6 +59,7 @@ class PreferencesViewSet(ModelViewSet):
 
 class PreferencesAPIView(APIView):
     permission_classes = [IsAuthenticated]
+    token_claims_user = True  # нужен только request.user.id, пользователь берётся из токена
     parser_classes = [JSONParser]
     renderer_classes = [JSONRenderer]
     filter_backends = [DjangoFilterBackend, OrderingFilter, SearchFilter]
@@ -59,45 +67,6 @@ class PreferencesAPIView(APIView):
     ordering_fields = ['age', 'gender', 'experience_level']
     search_fields = ['goal', 'prefer_workout_ex']
 
-    @extend_schema(
-        summary="Создать предпочтения",
-        description="Создаёт новый объект Preferences.",
-        parameters=[
-            OpenApiParameter(
-                name="Authorization",
-                description="Bearer access token для аутентификации",
-                required=True,
-                type=OpenApiTypes.STR,
-                location=OpenApiParameter.HEADER,
-                examples=[
-                    OpenApiExample(
-                        "Пример токена",
-                        summary="Bearer Token",
-                        value="Bearer eyJhbGciOiJIUzI1NiIsInR5..."
-                    )
-                ]
-            )
-        ],
-        request=PreferencesSerializer,
-        responses={
-            201: OpenApiResponse(
-                response=PreferencesSerializer,
-                description="Объект Preferences создан успешно."
-            ),
-            400: OpenApiResponse(
-                response=OpenApiTypes.OBJECT,
-                examples=[
-                    OpenApiExample(
-                        "Ошибка валидации",
-                        summary="Ошибка валидации данных",
-                        description="Предоставлены некорректные данные.",
-                        value={"error": "Invalid data"}
-                    )
-                ]
-            )
-        },
-        tags=['preferences']
-    )
     def post(self, request):
         data = request.data.copy()
         data['id_user'] = request.user.id
@@ -108,46 +77,6 @@ class PreferencesAPIView(APIView):
             return Response({"message": "Preferences created successfully"}, status=status.HTTP_201_CREATED)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
-    @extend_schema(
-        summary="Получить предпочтения",
-        description="Возвращает объект Preferences по ID или список всех объектов, если ID не указан.",
-        parameters=[
-            OpenApiParameter(
-                name="Authorization",
-                description="Bearer access token для аутентификации",
-                required=True,
-                type=OpenApiTypes.STR,
-                location=OpenApiParameter.HEADER,
-                examples=[
-                    OpenApiExample(
-                        "Пример токена",
-                        summary="Bearer Token",
-                        value="Bearer eyJhbGciOiJIUzI1NiIsInR5..."
-                    )
-                ]
-            )
-        ],
-        responses={
-            200: OpenApiResponse(
-                response=PreferencesSerializer(many=True),
-                description="Успешное получение предпочтений."
-            ),
-            404: OpenApiResponse(
-                response=OpenApiTypes.OBJECT,
-                examples=[
-                    OpenApiExample(
-                        "Объект не найден",
-                        summary="Предпочтения не найдены",
-                        description="Указанный объект предпочтений отсутствует в базе данных.",
-                        value={"error": "Preferences not found"}
-                    )
-                ]
-            )
-        },
-        tags=['preferences']
-
-    )
-
     def get(self, request, preferences_pk=None):
         paginator = CustomPagination()
         # filterset = PreferencesFilter(request.GET, queryset=Preferences.objects.all())
@@ -179,57 +108,6 @@ class PreferencesAPIView(APIView):
         return paginator.get_paginated_response(serializer.data)
 
 
-    @extend_schema(
-        summary="Обновить предпочтения",
-        description="Обновляет объект Preferences по ID.",
-        parameters=[
-            OpenApiParameter(
-                name="Authorization",
-                description="Bearer access token для аутентификации",
-                required=True,
-                type=OpenApiTypes.STR,
-                location=OpenApiParameter.HEADER,
-                examples=[
-                    OpenApiExample(
-                        "Пример токена",
-                        summary="Bearer Token",
-                        value="Bearer eyJhbGciOiJIUzI1NiIsInR5..."
-                    )
-                ]
-            )
-        ],
-        request=PreferencesSerializer,
-        responses={
-            200: OpenApiResponse(
-                response=PreferencesSerializer,
-                description="Предпочтения успешно обновлены."
-            ),
-            404: OpenApiResponse(
-                response=OpenApiTypes.OBJECT,
-                examples=[
-                    OpenApiExample(
-                        "Объект не найден",
-                        summary="Предпочтения не найдены",
-                        description="Указанный объект предпочтений отсутствует в базе данных.",
-                        value={"error": "Preferences not found"}
-                    )
-                ]
-            ),
-            400: OpenApiResponse(
-                response=OpenApiTypes.OBJECT,
-                examples=[
-                    OpenApiExample(
-                        "Ошибка валидации",
-                        summary="Некорректные данные",
-                        description="Предоставлены некорректные данные для обновления предпочтений.",
-                        value={"error": "Invalid data"}
-                    )
-                ]
-            )
-        },
-        tags=['preferences']
-    )
-
     def put(self, request, preferences_pk):
         try:
             preferences = Preferences.objects.get(pk=preferences_pk, id_user=request.user.id)
@@ -242,42 +120,6 @@ class PreferencesAPIView(APIView):
             return Response(serializer.data, status=status.HTTP_200_OK)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
-    @extend_schema(
-        summary="Удаление предпочтений пользователя",
-        parameters=[
-            OpenApiParameter(
-                name="Authorization",
-                description="Bearer access token для аутентификации",
-                required=True,
-                type=OpenApiTypes.STR,
-                location=OpenApiParameter.HEADER,
-                examples=[
-                    OpenApiExample(
-                        "Пример токена",
-                        summary="Bearer Token",
-                        value="eyJhbGciOiJIUzI1NiIsInR5..."
-                    )
-                ]
-            )
-        ],
-        responses={
-            204: OpenApiResponse(
-                description="Удалено успешно.",
-            ),
-            404: OpenApiResponse(
-                description="Объект не найден.",
-                examples=[
-                    OpenApiExample(
-                        "Пример ошибки",
-                        summary="Объект отсутствует",
-                        value={"error": "Preferences not found"}
-                    )
-                ]
-            )
-        },
-        tags=['preferences']
-    )
-
     def delete(self, request, preferences_pk):
         user = request.user
         try:
@@ -293,154 +135,46 @@ class PreferencesAPIView(APIView):
 
 class GeneratePlanAPIView(APIView):
     permission_classes = [IsAuthenticated]
-    @extend_schema(
-        summary="Сгенерировать тренировочный план",
-        description=(
-            "Генерирует тренировочный план на основе предпочтений пользователя с использованием OpenAI."
-        ),
-        parameters=[
-            OpenApiParameter(
-                name="Authorization",
-                description="Bearer access token для аутентификации",
-                required=True,
-                type=OpenApiTypes.STR,
-                location=OpenApiParameter.HEADER,
-                examples=[
-                    OpenApiExample(
-                        "Пример токена",
-                        summary="Bearer Token",
-                        value="eyJhbGciOiJIUzI1NiIsInR5..."
-                    )
-                ]
-            )
-        ],
-        request=PreferencesSerializer,
-        responses={
-            201: PlanSerializer,
-            400: OpenApiExample(
-                "Ошибка валидации",
-                value={"error": "Invalid preferences data"}
-            ),
-            500: OpenApiExample(
-                "Ошибка сервера",
-                value={"error": "OpenAI error"}
-            ),
-        },
-        tags=['plan generation']
-    )
+    max_batch_size = 20
+    idempotent_methods = ('POST',)  # см. authUser.idempotency
+
     def post(self, request, preferences_pk):
         try:
             preferences = Preferences.objects.get(pk=preferences_pk, id_user=request.user.id)
         except Preferences.DoesNotExist:
             return Response({"error": "предпочтения не найдены"}, status=status.HTTP_404_NOT_FOUND)
 
-        prompt = f"""
-        Составь тренировочный план на русском языке в виде корректного JSON. Формат:
-        {{
-            "name": "string",
-            "description": "string",
-            "program_duration": "integer",
-            "weekly_schedule": [
-                {{
-                    "day": "string",
-                    "focus": "string",
-                    "exercises": [
-                        {{
-                            "name": "string",
-                            "sets": "string",
-                            "reps": "string",
-                            "rest": "string",
-                            "notes": "string"
-                        }}
-                    ]
-                }}
-            ]
-        }}
-        Пример:
-        {{
-            "name": "План набора массы",
-            "description": "Шестимесячная программа для набора мышечной массы.",
-            "program_duration": 6,
-            "weekly_schedule": [
-                {{
-                    "day": "Понедельник",
-                    "focus": "Нижняя часть тела",
-                    "exercises": [
-                        {{
-                            "name": "Приседания",
-                            "sets": "4",
-                            "reps": "6-8",
-                            "rest": "2-3 минуты",
-                            "notes": "Сосредоточьтесь на технике и глубине, используйте рабочий вес."
-                        }}
-                    ]
-                }}
-            ]
-        }}
-        Пол: {preferences.get_gender_display() or "не указан"}.
-        Возраст: {preferences.age or "не указан"}.
-        Рост: {preferences.height or "не указан"} см.
-        Вес: {preferences.weight or "не указан"} кг.
-        Уровень подготовки: {preferences.get_experience_level_display() or "не указан"}.
-        Цель: {preferences.goal or "не указана"}.
-        Частота тренировок: {preferences.workout_frequency or "не указана"} раза в неделю.
-        Предпочтения: {preferences.prefer_workout_ex or "не указаны"}.
-        Программа рассчитана на {preferences.time_of_program or "не указано"} месяцев.
-
-        Ответ должен быть строго в формате JSON без пояснений, комментариев, текста или примеров. Только корректный JSON.
-        """
+        # План по текущим предпочтениям уже есть - LLM не нужен (?force=1 - сгенерировать заново)
+        if request.query_params.get("force") != "1":
+            plan = Plan.objects.for_user(request.user.id).filter(
+                id_preferences_id=preferences.pk, preferences_fingerprint=preferences.fingerprint
+            ).select_related("archive").order_by("-updated_at", "-id").first()
+            if plan is not None:
+                response = Response({"plan": PlanDetailSerializer(plan).data}, status=status.HTTP_200_OK)
+                response['X-Plan-Source'] = 'existing'
+                return response
+
         try:
+            # В пик (или всегда, см. PLAN_TEMPLATES['SERVE']) план берётся из заранее сгенерированных шаблонов
+            template = find_template(preferences) if should_serve_template() else None
+            if template is not None:
+                save_plan(template.plan_data, request.user, preferences)
+                response = Response({"plan": template.plan_data}, status=status.HTTP_200_OK)
+                response['X-Plan-Source'] = 'template'
+                return response
 
-            completion = client.chat.completions.create(
-                model="gpt-4o",
-                messages=[
-                    {"role": "system", "content": "You are a good sport coach with large background."},
-                    {"role": "user", "content": prompt}
-                ],
-                max_tokens=1500,
-                temperature=0.6,
-            )
-
-            plan_dict = completion.model_dump()
-            plan_text = plan_dict["choices"][0]["message"]["content"]
-
-            cleaned_text = plan_text.replace("```json", "").strip()
-            cleaned_text = cleaned_text.replace("```", "").strip()
-
-            print(cleaned_text)
-
-            # plan_text = completion['choices'][0]['message']['content']
-            plan_data = json.loads(cleaned_text)
-            print(plan_data["name"])
-            print(plan_data["description"])
-
-            plan = Plan.objects.create(
-                name=plan_data["name"],
-                description=plan_data["description"],
-                program_duration=plan_data["program_duration"],
-                id_user=request.user,
-                id_preferences = Preferences.objects.get(pk=preferences_pk)
-            )
-
-            for day in plan_data["weekly_schedule"]:
-                weekly_schedule = Weekly_Schedule.objects.create(
-                    plan_id=plan,
-                    day=day["day"],
-                    focus=day["focus"]
-                )
-
-                for exercise in day["exercises"]:
-                    Exercises.objects.create(
-                        weekly_schedule_id=weekly_schedule,
-                        name=exercise["name"],
-                        sets=exercise["sets"],
-                        reps=exercise["reps"],
-                        rest=exercise["rest"],
-                        notes=exercise["notes"]
-                    )
+            if token_budget.exceeded(request.user.id):
+                return Response({"error": "Дневной лимит генерации планов исчерпан",
+                                 "budget": token_budget.status(request.user.id)},
+                                status=status.HTTP_429_TOO_MANY_REQUESTS)
+
+            with track_generation():
+                plan_data, usage = generate_plan_data(preferences)
+            token_budget.record(request.user.id, usage)
+
+            save_plan(plan_data, request.user, preferences)
 
             return Response({"plan": plan_data}, status=status.HTTP_200_OK)
-            #print(plan_text)
 
         except json.JSONDecodeError as e:
             return Response({"error": "Ошибка парсинга JSON", "details": str(e)},
@@ -451,141 +185,85 @@ class GeneratePlanAPIView(APIView):
                             status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 
-    @extend_schema(
-        summary="Получить список сгенерированных планов",
-        parameters=[
-            OpenApiParameter(
-                name="Authorization",
-                description="Bearer access token для аутентификации",
-                required=True,
-                type=OpenApiTypes.STR,
-                location=OpenApiParameter.HEADER,
-                examples=[
-                    OpenApiExample(
-                        "Пример токена",
-                        summary="Bearer Token",
-                        value="eyJhbGciOiJIUzI1NiIsInR5..."
-                    )
-                ]
-            )
-        ],
-        responses={
-            200: PlanDetailSerializer(many=True),
-        },
-        tags=["plan generation"]
-    )
     def get(self, request, preferences_pk=None, plan_pk=None):
         paginator = CustomPagination()
 
         if preferences_pk and plan_pk:
             try:
-                plan = Plan.objects.get(pk=plan_pk, id_preferences_id=preferences_pk, id_user=request.user)
+                plan = Plan.objects.for_user(request.user.id).select_related("archive").get(
+                    pk=plan_pk, id_preferences_id=preferences_pk)
                 serializer = PlanDetailSerializer(plan)
                 return Response(serializer.data, status=status.HTTP_200_OK)
             except Plan.DoesNotExist:
                 return Response({"error": "План не найден"}, status=status.HTTP_404_NOT_FOUND)
 
         elif preferences_pk:
-            plans = Plan.objects.filter(id_preferences_id=preferences_pk, id_user=request.user)
+            plans = Plan.objects.for_user(request.user.id).filter(id_preferences_id=preferences_pk).select_related(
+                "archive")
             paginated_plans = paginator.paginate_queryset(plans, request)
             serializer = PlanDetailSerializer(paginated_plans, many=True)
             return paginator.get_paginated_response(serializer.data)
 
         elif plan_pk:
-            plans = Plan.objects.filter(pk=plan_pk, id_user=request.user)
+            plans = Plan.objects.for_user(request.user.id).filter(pk=plan_pk).select_related("archive")
             paginated_plans = paginator.paginate_queryset(plans, request)
             serializer = PlanDetailSerializer(paginated_plans, many=True)
             return paginator.get_paginated_response(serializer.data)
 
+        elif "ids" in request.query_params:
+            return self.get_batch(request)
+
         else:
-            plans = Plan.objects.filter(id_user=request.user)
+            # Краткий список строится одним запросом по индексу (id_user, updated_at)
+            paginator = PlanSummaryPagination()
+            plans = Plan.objects.for_user(request.user.id).only(
+                "id", "name", "program_duration", "id_preferences_id", "days_count", "exercises_count",
+                "updated_at", "preferences_fingerprint"
+            ).order_by("-updated_at", "-id")
             paginated_plans = paginator.paginate_queryset(plans, request)
-            serializer = PlanDetailSerializer(paginated_plans, many=True)
+            # stale - предпочтения изменились после генерации плана. Предпочтения в основной базе,
+            # планы - в шарде, поэтому сравнение не JOIN'ом, а по словарю отпечатков пользователя
+            fingerprints = dict(Preferences.objects.filter(id_user=request.user.id).values_list("pk", "fingerprint"))
+            for plan in paginated_plans:
+                plan.stale = plan.preferences_fingerprint != fingerprints.get(plan.id_preferences_id)
+            serializer = PlanSummarySerializer(paginated_plans, many=True)
             return paginator.get_paginated_response(serializer.data)
 
-    @extend_schema(
-        summary="Удалить план или все планы для предпочтений",
-        description=(
-                "Удаляет конкретный план по `plan_pk` и `preferences_pk`, все планы для указанных предпочтений "
-                "по `preferences_pk`, или все планы, если не указан `preferences_pk` и `plan_pk`."
-        ),
-        parameters=[
-            OpenApiParameter(
-                name="Authorization",
-                description="Bearer access token для аутентификации",
-                required=True,
-                type=OpenApiTypes.STR,
-                location=OpenApiParameter.HEADER,
-                examples=[
-                    OpenApiExample(
-                        "Пример токена",
-                        summary="Bearer Token",
-                        value="eyJhbGciOiJIUzI1NiIsInR5..."
-                    )
-                ]
-            )
-        ],
-        request=None,
-        responses={
-            200: OpenApiResponse(
-                response=OpenApiTypes.OBJECT,
-                examples=[
-                    OpenApiExample(
-                        "Успешное удаление плана",
-                        summary="Успешное удаление",
-                        description="План был успешно удалён.",
-                        value={"message": "План успешно удалён"}
-                    ),
-                    OpenApiExample(
-                        "Успешное удаление планов",
-                        summary="Успешное удаление всех планов",
-                        description="Все планы для указанных предпочтений были успешно удалены.",
-                        value={"message": "Планы успешно удалены"}
-                    )
-                ]
-            ),
-            404: OpenApiResponse(
-                response=OpenApiTypes.OBJECT,
-                examples=[
-                    OpenApiExample(
-                        "План не найден",
-                        summary="План не найден",
-                        description="Указанный план не найден в базе данных.",
-                        value={"error": "План не найден"}
-                    ),
-                    OpenApiExample(
-                        "Планы не найдены",
-                        summary="Планы не найдены",
-                        description="Для указанных предпочтений планы не найдены.",
-                        value={"error": "Планы для указанных предпочтений не найдены"}
-                    )
-                ]
-            ),
-            400: OpenApiResponse(
-                response=OpenApiTypes.OBJECT,
-                examples=[
-                    OpenApiExample(
-                        "Некорректный запрос",
-                        summary="Некорректный запрос",
-                        description="Не указаны идентификаторы предпочтений или плана.",
-                        value={"error": "Не указаны ID предпочтений или плана"}
-                    )
-                ]
-            )
-        },
-        tags=['plan generation']
-    )
+    def get_batch(self, request):
+        try:
+            ids = list(dict.fromkeys(int(pk) for pk in request.query_params["ids"].split(",") if pk.strip()))
+        except ValueError:
+            return Response({"error": "Некорректный список ID планов"}, status=status.HTTP_400_BAD_REQUEST)
+
+        if not ids:
+            return Response({"error": "Не указаны ID планов"}, status=status.HTTP_400_BAD_REQUEST)
+        if len(ids) > self.max_batch_size:
+            return Response({"error": f"Можно запросить не больше {self.max_batch_size} планов"},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        # Проверка владельца и загрузка всего дерева: один запрос на планы и по одному на дни и упражнения
+        plans = Plan.objects.for_user(request.user.id).filter(pk__in=ids).select_related("archive").prefetch_related(
+            "weekly_schedule_set__exercises_set"
+        )
+        plans_by_id = {plan.pk: plan for plan in plans}
+
+        serializer = PlanDetailSerializer([plans_by_id[pk] for pk in ids if pk in plans_by_id], many=True)
+        return Response({
+            "results": serializer.data,
+            "not_found": [pk for pk in ids if pk not in plans_by_id],
+        }, status=status.HTTP_200_OK)
+
     def delete(self, request, preferences_pk=None, plan_pk=None):
         if preferences_pk and plan_pk:
             try:
-                plan = Plan.objects.get(pk=plan_pk, id_preferences_id=preferences_pk, id_user=request.user)
+                plan = Plan.objects.for_user(request.user.id).get(pk=plan_pk, id_preferences_id=preferences_pk)
                 plan.delete()
                 return Response({"message": "План успешно удалён"}, status=status.HTTP_200_OK)
             except Plan.DoesNotExist:
                 return Response({"error": "План не найден"}, status=status.HTTP_404_NOT_FOUND)
 
         elif preferences_pk:
-            plans = Plan.objects.filter(id_preferences_id=preferences_pk, id_user=request.user)
+            plans = Plan.objects.for_user(request.user.id).filter(id_preferences_id=preferences_pk)
             if plans.exists():
                 plans.delete()
                 return Response({"message": "Планы успешно удалены"}, status=status.HTTP_200_OK)
@@ -595,7 +273,7 @@ class GeneratePlanAPIView(APIView):
 
         elif plan_pk:
             try:
-                plan = Plan.objects.get(pk=plan_pk, id_user=request.user)
+                plan = Plan.objects.for_user(request.user.id).get(pk=plan_pk)
                 plan.delete()
                 return Response({"message": "План успешно удалён"}, status=status.HTTP_200_OK)
             except Plan.DoesNotExist:
@@ -610,3 +288,162 @@ class GeneratePlanAPIView(APIView):
     #     return Response(serializer.data, status=status.HTTP_200_OK)
 
 
+
+
+class TokenBudgetAPIView(APIView):
+    permission_classes = [IsAuthenticated]
+    token_claims_user = True
+
+    def get(self, request):
+        return Response(token_budget.status(request.user.id), status=status.HTTP_200_OK)
+
+
+class ExerciseAutocompleteAPIView(APIView):
+    permission_classes = [IsAuthenticated]
+    token_claims_user = True
+
+    def get(self, request):
+        config = settings.EXERCISE_AUTOCOMPLETE
+        prefix = request.query_params.get('q', '')
+        if not prefix.strip():
+            return Response({"error": "Не указан параметр q"}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            limit = int(request.query_params.get('limit', config['LIMIT']))
+        except ValueError:
+            return Response({"error": "limit должен быть числом"}, status=status.HTTP_400_BAD_REQUEST)
+        limit = min(max(limit, 1), config['MAX_LIMIT'])
+        return Response({"results": exercise_index.suggest(prefix, limit)}, status=status.HTTP_200_OK)
+
+
+class PlanCalendarAPIView(APIView):
+    permission_classes = [IsAuthenticated]
+    token_claims_user = True
+
+    def get(self, request, plan_pk):
+        config = settings.PLAN_CALENDAR
+        try:
+            start = date.fromisoformat(request.query_params["from"]) if "from" in request.query_params \
+                else timezone.localdate()
+            end = date.fromisoformat(request.query_params["to"]) if "to" in request.query_params \
+                else start + timedelta(days=config['DEFAULT_DAYS'] - 1)
+        except ValueError:
+            return Response({"error": "Даты from и to ожидаются в формате ГГГГ-ММ-ДД"},
+                            status=status.HTTP_400_BAD_REQUEST)
+        if end < start:
+            return Response({"error": "Дата to раньше from"}, status=status.HTTP_400_BAD_REQUEST)
+        if (end - start).days + 1 > config['MAX_DAYS']:
+            return Response({"error": f"Окно календаря - не больше {config['MAX_DAYS']} дней"},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            plan = Plan.objects.for_user(request.user.id).select_related("archive").get(pk=plan_pk)
+        except Plan.DoesNotExist:
+            return Response({"error": "План не найден"}, status=status.HTTP_404_NOT_FOUND)
+
+        # Разворачивается только запрошенное окно внутри программы
+        starts_on, ends_on = plan_period(plan)
+        sessions = iter_sessions(load_plan_schedule(plan), max(start, starts_on), min(end + timedelta(days=1), ends_on))
+        return Response({
+            "plan": plan.pk,
+            "starts_on": starts_on,
+            "ends_on": ends_on - timedelta(days=1),
+            "from": start,
+            "to": end,
+            "sessions": [
+                {"date": day, "day": session["day"], "focus": session["focus"], "exercises": session["exercises"]}
+                for day, session in sessions
+            ],
+            "ical_url": request.build_absolute_uri(
+                reverse('plan-calendar-feed', args=[feed_token(request.user.id, plan.pk)])),
+        }, status=status.HTTP_200_OK)
+
+
+class PlanCalendarFeedAPIView(APIView):
+    # Лента для календарных приложений: доступ по подписанной ссылке, без JWT
+    authentication_classes = []
+    permission_classes = [AllowAny]
+
+    def perform_content_negotiation(self, request, force=False):
+        # Календари присылают Accept: text/calendar, ошибки всё равно отдаются в JSON
+        return super().perform_content_negotiation(request, force=True)
+
+    def get(self, request, token):
+        ids = read_feed_token(token)
+        if ids is None:
+            return Response({"error": "План не найден"}, status=status.HTTP_404_NOT_FOUND)
+        user_id, plan_pk = ids
+        try:
+            plan = Plan.objects.for_user(user_id).select_related("archive").get(pk=plan_pk)
+        except Plan.DoesNotExist:
+            return Response({"error": "План не найден"}, status=status.HTTP_404_NOT_FOUND)
+
+        # Неизменившийся план - 304 без загрузки дней и упражнений
+        etag = feed_etag(plan)
+        last_modified = int(plan.updated_at.timestamp())
+        response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+        if response is None:
+            response = StreamingHttpResponse(iter_ical(plan, load_plan_schedule(plan)),
+                                             content_type='text/calendar; charset=utf-8')
+            response['Content-Disposition'] = f'inline; filename="plan-{plan.pk}.ics"'
+        response['ETag'] = etag
+        response['Last-Modified'] = http_date(last_modified)
+        response['Cache-Control'] = 'private, no-cache'
+        return response
+
+
+class WorkoutSetsAPIView(APIView):
+    permission_classes = [IsAuthenticated]
+    token_claims_user = True
+    idempotent_methods = ('POST',)  # см. authUser.idempotency
+
+    def post(self, request):
+        records = request.data.get("sets") if isinstance(request.data, dict) else None
+        if not isinstance(records, list) or not records:
+            return Response({"error": "Ожидается непустой список sets"}, status=status.HTTP_400_BAD_REQUEST)
+        if len(records) > settings.WORKOUT_LOG['MAX_BATCH']:
+            return Response({"error": f"Можно передать не больше {settings.WORKOUT_LOG['MAX_BATCH']} подходов"},
+                            status=status.HTTP_400_BAD_REQUEST)
+        serializer = WorkoutSetInputSerializer(data=records, many=True)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        # Упражнения пачки проверяются одним запросом в шард пользователя
+        user_id = request.user.id
+        ids = {item["exercise"] for item in serializer.validated_data}
+        names = dict(Exercises.objects.using(shard_for_user(user_id)).filter(
+            pk__in=ids, weekly_schedule_id__plan_id__id_user_id=user_id).values_list("pk", "name"))
+        not_found = sorted(ids - names.keys())
+        if not_found:
+            return Response({"error": "Упражнения не найдены", "not_found": not_found},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        now = timezone.now()
+        sets = []
+        for item in serializer.validated_data:
+            performed_at = item.get("performed_at") or now
+            sets.append(WorkoutSet(
+                id_user_id=user_id, exercise_id=item["exercise"], exercise_name=names[item["exercise"]],
+                performed_at=performed_at, period=month_start(performed_at), reps=item["reps"],
+                weight=item.get("weight"),
+            ))
+        workout_log.record(sets)
+        return Response({"accepted": len(sets)}, status=status.HTTP_202_ACCEPTED)
+
+
+class WorkoutProgressAPIView(APIView):
+    permission_classes = [IsAuthenticated]
+    token_claims_user = True
+    max_months = 24
+
+    def get(self, request):
+        try:
+            months = int(request.query_params.get("months", 6))
+        except ValueError:
+            return Response({"error": "months должен быть числом"}, status=status.HTTP_400_BAD_REQUEST)
+        months = min(max(months, 1), self.max_months)
+        since = add_months(month_start(timezone.now()), 1 - months)
+
+        # Подходы из буфера этого процесса должны попасть в ответ
+        workout_log.flush()
+        results = exercise_history(request.user.id, since, request.query_params.get("exercise"))
+        return Response({"results": results}, status=status.HTTP_200_OK)
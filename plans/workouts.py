@@ -0,0 +1,205 @@
+import atexit
+import logging
+import os
+import threading
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+
+from fit.sharding import shard_aliases, shard_for_user
+from .autocomplete import normalize_name
+from .calendar_feed import add_months
+
+logger = logging.getLogger(__name__)
+
+
+def month_start(value):
+    return timezone.localdate(value).replace(day=1)
+
+
+def retention_start(months, now=None):
+    # Первый месяц, подходы которого ещё хранятся при хранении months полных месяцев
+    return add_months(month_start(now or timezone.now()), -months)
+
+
+def add_stats(stats, key, name, period, sets, reps, volume, max_weight, last_performed_at):
+    entry = stats.get((key, period))
+    if entry is None:
+        stats[(key, period)] = {
+            "exercise": name, "period": period, "sets": sets, "reps": reps, "volume": volume,
+            "max_weight": max_weight, "last_performed_at": last_performed_at,
+        }
+        return
+    entry["sets"] += sets
+    entry["reps"] += reps
+    entry["volume"] += volume
+    if max_weight is not None and (entry["max_weight"] is None or max_weight > entry["max_weight"]):
+        entry["max_weight"] = max_weight
+    entry["last_performed_at"] = max(entry["last_performed_at"], last_performed_at)
+
+
+def summarize(rows, stats=None):
+    # rows - (exercise_name, period, reps, weight, performed_at); ключ упражнения - название
+    # без учёта регистра: id упражнений меняются при каждой генерации плана
+    stats = {} if stats is None else stats
+    for name, period, reps, weight, performed_at in rows:
+        add_stats(stats, normalize_name(name), name, period, 1, reps, reps * (weight or 0), weight, performed_at)
+    return stats
+
+
+class WorkoutLog:
+    # Буфер записи подходов. Пачки из запросов копятся в памяти процесса и пишутся
+    # bulk_create по шардам, когда набралось BUFFER_SIZE или прошло FLUSH_INTERVAL.
+    # Фоновый поток сбрасывает буфер и без новых записей, поэтому принятый (202) подход
+    # попадает в базу и виден другим воркерам не позже чем через FLUSH_INTERVAL, пока база
+    # доступна. При падении процесса теряется не больше одного несброшенного буфера
+
+    def __init__(self):
+        self._pending = []
+        self._lock = threading.Lock()
+        self._flushed_at = time.monotonic()
+        self._flusher_pid = None
+
+    def record(self, sets):
+        config = settings.WORKOUT_LOG
+        with self._lock:
+            self._pending.extend(sets)
+            size = len(self._pending)
+        if size >= config['BUFFER_SIZE'] or time.monotonic() - self._flushed_at >= config['FLUSH_INTERVAL']:
+            self.flush()
+        if config['FLUSH_THREAD']:
+            self._start_flusher()
+
+    def _start_flusher(self):
+        # Поток запускается при первой записи: после fork у воркера gunicorn свой поток
+        if self._flusher_pid == os.getpid():
+            return
+        with self._lock:
+            if self._flusher_pid == os.getpid():
+                return
+            self._flusher_pid = os.getpid()
+        threading.Thread(target=self._flush_periodically, name='workout-log-flush', daemon=True).start()
+
+    def _flush_periodically(self):
+        while True:
+            interval = settings.WORKOUT_LOG['FLUSH_INTERVAL']
+            time.sleep(max(interval - (time.monotonic() - self._flushed_at), 0.1))
+            if time.monotonic() - self._flushed_at < interval:
+                continue
+            try:
+                self.flush()
+            except Exception:
+                logger.exception("Workout log flush failed")
+            finally:
+                close_old_connections()
+
+    def flush(self):
+        from .models import WorkoutSet
+
+        with self._lock:
+            pending, self._pending = self._pending, []
+            self._flushed_at = time.monotonic()
+        if not pending:
+            return
+        by_shard = {}
+        for workout_set in pending:
+            by_shard.setdefault(shard_for_user(workout_set.id_user_id), []).append(workout_set)
+        for db, sets in by_shard.items():
+            try:
+                WorkoutSet.objects.using(db).bulk_create(sets, batch_size=500)
+            except Exception:
+                # Подходы не теряются: вернутся в буфер до следующей записи
+                logger.exception("Workout log flush failed")
+                with self._lock:
+                    self._pending.extend(sets)
+
+    def clear(self):
+        with self._lock:
+            self._pending = []
+
+
+workout_log = WorkoutLog()
+atexit.register(workout_log.flush)
+
+
+def rolled_through(db):
+    from .models import WorkoutRollupState
+
+    return WorkoutRollupState.objects.using(db).values_list('rolled_through', flat=True).first()
+
+
+def rollup_workouts(now=None):
+    # Пересчёт свёрток за месяцы, в которые с прошлого раза добавились подходы. Месяц
+    # пересчитывается из журнала целиком, поэтому повторный запуск ничего не удваивает.
+    # Граница шарда сдвигается после всех месяцев: прерванный проход повторится целиком
+    from .models import ExerciseProgress, WorkoutRollupState, WorkoutSet
+
+    cutoff = (now or timezone.now()) - timedelta(seconds=settings.WORKOUT_LOG['ROLLUP_GRACE'])
+    rolled = 0
+    for db in shard_aliases():
+        sets = WorkoutSet.objects.using(db).filter(created_at__lte=cutoff)
+        watermark = rolled_through(db)
+        fresh = sets.filter(created_at__gt=watermark) if watermark else sets
+        for user_id, period in list(fresh.order_by().values_list('id_user_id', 'period').distinct()):
+            stats = summarize(sets.filter(id_user_id=user_id, period=period).values_list(
+                'exercise_name', 'period', 'reps', 'weight', 'performed_at').iterator())
+            with transaction.atomic(using=db):
+                ExerciseProgress.objects.using(db).filter(id_user_id=user_id, period=period).delete()
+                ExerciseProgress.objects.using(db).bulk_create([
+                    ExerciseProgress(
+                        id_user_id=user_id, exercise_key=key, exercise_name=entry["exercise"], period=period,
+                        sets=entry["sets"], reps=entry["reps"], volume=entry["volume"],
+                        max_weight=entry["max_weight"], last_performed_at=entry["last_performed_at"],
+                        rolled_through=cutoff,
+                    )
+                    for (key, _), entry in stats.items()
+                ])
+            rolled += 1
+        WorkoutRollupState.objects.using(db).update_or_create(pk=1, defaults={'rolled_through': cutoff})
+    return rolled
+
+
+def prune_workouts(months, now=None):
+    # Подходы старше months полных месяцев удаляются целыми месяцами, свёртки остаются.
+    # Удаляются только месяцы, уже вошедшие в свёртку
+    from .models import WorkoutSet
+
+    before = retention_start(months, now)
+    deleted = 0
+    for db in shard_aliases():
+        watermark = rolled_through(db)
+        if watermark is None:
+            continue
+        deleted += WorkoutSet.objects.using(db).filter(period__lt=before, created_at__lte=watermark).delete()[0]
+    return deleted
+
+
+def exercise_history(user_id, since, exercise=None):
+    # Свёртки плюс ещё не свёрнутый хвост журнала пользователя
+    from .models import ExerciseProgress, WorkoutSet
+
+    db = shard_for_user(user_id)
+    progress = ExerciseProgress.objects.using(db).filter(id_user_id=user_id, period__gte=since)
+    tail = WorkoutSet.objects.using(db).filter(id_user_id=user_id, period__gte=since)
+    if exercise:
+        progress = progress.filter(exercise_key=normalize_name(exercise))
+    watermark = rolled_through(db)
+    if watermark:
+        tail = tail.filter(created_at__gt=watermark)
+
+    # Месяцы прерванного прохода свёрнуты дальше границы шарда: их подходы до rolled_through
+    # свёртки уже учтены
+    rolled = {}
+    stats = {}
+    for row in progress:
+        rolled[row.period] = row.rolled_through
+        add_stats(stats, row.exercise_key, row.exercise_name, row.period, row.sets, row.reps, row.volume,
+                  row.max_weight, row.last_performed_at)
+    rows = tail.values_list('exercise_name', 'period', 'reps', 'weight', 'performed_at', 'created_at').iterator()
+    summarize((row[:5] for row in rows if row[1] not in rolled or row[5] > rolled[row[1]]), stats)
+    if exercise:
+        stats = {key: entry for key, entry in stats.items() if key[0] == normalize_name(exercise)}
+    return sorted(stats.values(), key=lambda entry: (-entry["period"].toordinal(), entry["exercise"].lower()))